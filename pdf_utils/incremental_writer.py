@@ -1,4 +1,5 @@
 import os
+from io import BytesIO
 from typing import Union
 
 from . import generic
@@ -14,12 +15,27 @@ Contains code from the PyPDF2 project, see LICENSE.PyPDF2
 
 __all__ = ['IncrementalPdfFileWriter']
 
+# chunk size used when copying the original file to the output
+COPY_CHUNK_SIZE = 1024 * 1024
 
-class IncrementalPdfFileWriter(BasePdfFileWriter):
 
-    def __init__(self, input_stream, skip_original=False):
+class IncrementalPdfFileWriter(BasePdfFileWriter):
+    """
+    Writer for incremental updates to an existing PDF file.
+
+    :param input_stream:
+        Stream containing the file to update.
+    :param skip_original:
+        Don't copy the original file to the output when writing. Use this
+        when appending the update to ``input_stream`` itself.
+    :param prev:
+        Reader for ``input_stream``, if one is available already.
+    """
+
+    def __init__(self, input_stream, skip_original=False,
+                 prev: PdfFileReader = None):
         self.input_stream = input_stream
-        self.prev = prev = PdfFileReader(input_stream)
+        self.prev = prev = prev or PdfFileReader(input_stream)
         self.skip_original = skip_original
         trailer = prev.trailer
         root_ref = trailer.raw_get('/Root')
@@ -101,6 +117,54 @@ class IncrementalPdfFileWriter(BasePdfFileWriter):
     def update_root(self):
         self.mark_update(self._root)
 
+    def chain(self, stream) -> 'IncrementalPdfFileWriter':
+        """
+        Start a new incremental update on top of the output of this writer,
+        without parsing that output again: the reader of this writer is
+        told about the xrefs that were just written, and is reused along with
+        its object cache.
+
+        The new writer appends to ``stream`` directly (i.e. it doesn't copy
+        the original), so make sure to position ``stream`` at the end before
+        writing.
+        This writer should not be used anymore afterwards.
+
+        :param stream:
+            The stream this writer wrote to. If anything was patched in
+            afterwards (e.g. signature contents), it must only affect objects
+            written by this writer.
+        :return:
+            A new :class:`.IncrementalPdfFileWriter`.
+        :raises pdf_utils.misc.PdfReadError:
+            if ``stream`` doesn't contain the output of this writer, or
+            the reader was already told about it.
+        """
+        written = self._written_xrefs
+        if written is None:
+            raise ValueError('Nothing has been written yet.')
+        prev = self.prev
+        prev.register_update(stream, written)
+        # write() makes sure that the output has the right version
+        prev.input_version = self.output_version
+        writer = IncrementalPdfFileWriter(
+            stream, skip_original=True, prev=prev
+        )
+        writer._encrypt = self._encrypt
+        writer._encrypt_key = self._encrypt_key
+        return writer
+
+    def original_length(self):
+        """
+        Return the number of bytes of the original file that will be copied
+        to the output when writing.
+        """
+        if self.skip_original:
+            return 0
+        input_pos = self.input_stream.tell()
+        length = self.input_stream.seek(0, os.SEEK_END)
+        self.input_stream.seek(input_pos)
+        return length
+
     def _write_header(self, stream):
 
         if self.skip_original:
@@ -109,9 +173,19 @@ class IncrementalPdfFileWriter(BasePdfFileWriter):
         # copy the original data to the output
         input_pos = self.input_stream.tell()
         self.input_stream.seek(0)
-        # TODO there has to be a better way to do this that doesn't involve
-        #  loading the entire file into a separate buffer
-        stream.write(self.input_stream.read())
+        if isinstance(self.input_stream, BytesIO):
+            # no need to copy anything in this case
+            buf = self.input_stream.getbuffer()
+            stream.write(buf)
+            buf.release()
+        else:
+            # copy in chunks, so we never have to hold the entire file
+            # in memory
+            while True:
+                chunk = self.input_stream.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                stream.write(chunk)
         self.input_stream.seek(input_pos)
 
     def _populate_trailer(self, trailer):
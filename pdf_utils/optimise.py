@@ -0,0 +1,754 @@
+"""
+Utilities to rewrite PDF files from scratch.
+
+Contrary to the incremental writer, the rewriting writer in this module
+only retains objects that are reachable from the trailer of the input document.
+The revision history of the input is flattened into a single revision,
+non-stream objects can be packed into object streams and streams are
+recompressed where that is safe to do.
+
+Obviously, this invalidates any signatures on the input document, so we refuse
+to touch signed documents unless explicitly told otherwise.
+"""
+
+import logging
+from collections import deque, defaultdict
+from io import BytesIO
+from typing import Optional
+
+from pdf_utils import generic
+from pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pdf_utils.generic import pdf_name
+from pdf_utils.misc import PdfReadError
+from pdf_utils.reader import PdfFileReader
+from pdf_utils.writer import (
+    BasePdfFileWriter, write_pdf_header, write_xref_table
+)
+
+__all__ = [
+    'RewritingPdfFileWriter', 'LinearizedPdfFileWriter', 'optimise_pdf',
+    'is_signed', 'DEFAULT_OBJSTM_SIZE'
+]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OBJSTM_SIZE = 100
+"""
+Default maximal number of objects to pack into a single object stream.
+"""
+
+# filters that we are willing to strip and replace by plain /FlateDecode
+_RECOMPRESSIBLE_FILTERS = {
+    '/FlateDecode', '/Fl', '/ASCIIHexDecode', '/AHx', '/ASCII85Decode', '/A85'
+}
+
+
+def is_signed(reader: PdfFileReader) -> bool:
+    """
+    Check whether a document contains filled-in signature fields, or
+    a /Perms dictionary (which would be invalidated by a rewrite as well).
+
+    :param reader:
+        A PDF reader.
+    :return:
+        ``True`` if the document appears to be signed.
+    """
+    root = reader.root
+    if '/Perms' in root:
+        return True
+    try:
+        fields = root['/AcroForm']['/Fields']
+    except KeyError:
+        return False
+
+    # walk the form field tree, keeping track of inherited field types
+    todo = [(field, None) for field in fields]
+    seen = set()
+    while todo:
+        field_ref, parent_ft = todo.pop()
+        if isinstance(field_ref, generic.IndirectObject):
+            key = (field_ref.generation, field_ref.idnum)
+            if key in seen:
+                continue
+            seen.add(key)
+        field = field_ref.get_object()
+        try:
+            field_type = field['/FT']
+        except KeyError:
+            field_type = parent_ft
+        if field_type == '/Sig' and '/V' in field:
+            return True
+        try:
+            kids = field['/Kids']
+        except KeyError:
+            continue
+        todo.extend((kid, field_type) for kid in kids)
+    return False
+
+
+def _recompress(stream_obj: generic.StreamObject) -> generic.StreamObject:
+    if any(isinstance(stream_obj.get(k), generic.IndirectObject)
+           for k in ('/Filter', '/DecodeParms')):
+        # the referenced objects might not be available in the writer yet
+        return stream_obj
+    filters = [name for name, _ in stream_obj._filters()]
+    if any(f not in _RECOMPRESSIBLE_FILTERS for f in filters):
+        # we don't want to mess with image encodings and the like, so just
+        # leave those alone
+        return stream_obj
+
+    params = stream_obj.get('/DecodeParms')
+    if isinstance(params, generic.ArrayObject):
+        params = [p for p in params if not isinstance(p, generic.NullObject)]
+    if params:
+        # predictors etc. often serve a purpose, so don't touch those
+        return stream_obj
+
+    result = generic.StreamObject(
+        {k: v for k, v in stream_obj.items()
+         if k not in ('/Filter', '/DecodeParms', '/Length')},
+        stream_data=stream_obj.data
+    )
+    result.compress()
+    # only keep the result if it's actually an improvement
+    orig_len = len(stream_obj.encoded_data)
+    if filters and len(result.encoded_data) >= orig_len:
+        return stream_obj
+    return result
+
+
+def _ref_key(ref):
+    return ref.generation, ref.idnum
+
+
+def _direct_refs(obj):
+    """
+    Enumerate the indirect references in the direct part of an object.
+    The /Length entries of streams are skipped, since those are recomputed
+    on output anyway.
+    """
+    todo = [obj]
+    while todo:
+        cur = todo.pop()
+        if isinstance(cur, generic.IndirectObject):
+            yield cur
+        elif isinstance(cur, generic.StreamObject):
+            todo.extend(cur.raw_get(k) for k in cur if k != '/Length')
+        elif isinstance(cur, generic.DictionaryObject):
+            todo.extend(cur.raw_get(k) for k in cur)
+        elif isinstance(cur, generic.ArrayObject):
+            todo.extend(cur)
+
+
+class RewritingPdfFileWriter(BasePdfFileWriter):
+    """
+    PDF writer that rewrites the content of an existing document from scratch,
+    retaining only objects that are reachable from the trailer.
+
+    :param reader:
+        A PDF reader for the input document.
+    :param object_streams:
+        Pack non-stream objects into object streams.
+    :param recompress:
+        Compress uncompressed streams, and replace trivial filter chains
+        by a single /FlateDecode filter.
+    :param objstm_size:
+        Maximal number of objects per object stream.
+    """
+
+    def __init__(self, reader: PdfFileReader, object_streams=True,
+                 recompress=True, objstm_size=DEFAULT_OBJSTM_SIZE):
+        if reader.encrypted:
+            raise ValueError('Rewriting encrypted documents is not supported.')
+        self.reader = reader
+        self.recompress = recompress
+        self.objstm_size = objstm_size
+        # source reference -> object number in the output
+        self._ref_map = {}
+        trailer = reader.trailer
+        root_ref = trailer.raw_get('/Root')
+        try:
+            info_ref = trailer.raw_get('/Info')
+        except KeyError:
+            info_ref = None
+
+        # keep the first half of the document ID (cf. § 14.4 in ISO 32000)
+        document_id = IncrementalPdfFileWriter._handle_id(reader)
+        self._sources = []
+        self._collect_refs(root_ref, info_ref)
+        self._sources = self._arrange_sources(self._sources)
+        for new_idnum, ref in enumerate(self._sources, start=1):
+            if ref is not None:
+                self._ref_map[_ref_key(ref)] = new_idnum
+        # The root and info dictionaries will be added by _copy_objects()
+        # together with all the other objects
+        root = self._translate(root_ref)
+        info = None if info_ref is None else self._translate(info_ref)
+        super().__init__(
+            root, info, document_id, stream_xrefs=object_streams
+        )
+        self._copy_objects(object_streams)
+        major, minor = reader.input_version
+        if (major, minor) > self.output_version:  # pragma: nocover
+            self.output_version = (major, minor)
+
+    def _collect_refs(self, *start_refs):
+        # Breadth-first search through the object graph, starting from the
+        # trailer. Unless _arrange_sources() says otherwise, this also
+        # determines the numbering of objects in the output file, which keeps
+        # related objects close to one another.
+        queue = deque(ref for ref in start_refs if ref is not None)
+        ref_map = self._ref_map
+        while queue:
+            ref = queue.popleft()
+            key = _ref_key(ref)
+            if key in ref_map:
+                continue
+            try:
+                obj = ref.get_object()
+            except (KeyError, PdfReadError):
+                # references to nonexistent objects are to be treated as null
+                logger.warning(
+                    f'Reference {ref} could not be resolved; replacing it by '
+                    f'null.'
+                )
+                ref_map[key] = None
+                continue
+            self._sources.append(ref)
+            # the actual object number is assigned later
+            ref_map[key] = -1
+            queue.extend(
+                child for child in _direct_refs(obj)
+                if _ref_key(child) not in ref_map
+            )
+
+    def _arrange_sources(self, sources):
+        """
+        Determine the order in which objects are numbered in the output.
+        Subclasses can override this method to impose a different layout.
+        ``None`` entries in the output reserve an object number for
+        objects that are not taken from the input document.
+
+        :param sources:
+            References to all objects in the input document that are reachable
+            from the trailer, in breadth-first order.
+        :return:
+            A list of references and ``None`` values.
+        """
+        return sources
+
+    def _translate(self, obj):
+        # Copy the direct part of an object, translating indirect references
+        # along the way.
+        if isinstance(obj, generic.IndirectObject):
+            idnum = self._ref_map.get(_ref_key(obj))
+            if idnum is None:
+                return generic.NullObject()
+            return generic.IndirectObject(idnum, 0, self)
+        elif isinstance(obj, generic.StreamObject):
+            result = generic.StreamObject(
+                {k: self._translate(obj.raw_get(k))
+                 for k in obj if k != '/Length'},
+                encoded_data=obj.encoded_data
+            )
+            return _recompress(result) if self.recompress else result
+        elif isinstance(obj, generic.DictionaryObject):
+            return generic.DictionaryObject(
+                {k: self._translate(obj.raw_get(k)) for k in obj}
+            )
+        elif isinstance(obj, generic.ArrayObject):
+            return generic.ArrayObject(self._translate(v) for v in obj)
+        else:
+            return obj
+
+    def _copy_objects(self, object_streams):
+        obj_stream = None
+        for new_idnum, orig_ref in enumerate(self._sources, start=1):
+            if orig_ref is None:
+                # reserve an object number, the subclass will take care of it
+                self.add_object(generic.NullObject())
+                continue
+            new_obj = self._translate(orig_ref.get_object())
+            if object_streams and \
+                    not isinstance(new_obj, generic.StreamObject):
+                if obj_stream is None or \
+                        len(obj_stream._obj_refs) >= self.objstm_size:
+                    obj_stream = self.prepare_object_stream()
+                added = self.add_object(new_obj, obj_stream=obj_stream)
+            else:
+                added = self.add_object(new_obj)
+            assert added.idnum == new_idnum
+
+    def _write_header(self, stream):
+        write_pdf_header(stream, self.output_version)
+
+
+_INHERITABLE_PAGE_ATTRS = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+# catalog entries that a viewer needs in order to open the document,
+# cf. § F.2.4 in ISO 32000-1
+_OPEN_DOCUMENT_KEYS = (
+    '/ViewerPreferences', '/PageMode', '/Threads', '/OpenAction', '/AcroForm'
+)
+
+
+class _PaddedNumber(generic.NumberObject):
+    # fixed-width integer, so we can fill in offsets after the fact
+
+    def write_to_stream(self, stream, encryption_key):
+        stream.write(b'%010d' % self)
+
+
+class _BitWriter:
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value, nbits):
+        if value >= 1 << nbits:
+            raise ValueError(f'{value} does not fit into {nbits} bits')
+        self._acc = (self._acc << nbits) | value
+        self._bits += nbits
+        while self._bits >= 8:
+            self._bits -= 8
+            self.buffer.append((self._acc >> self._bits) & 0xff)
+        self._acc &= (1 << self._bits) - 1
+
+    def flush(self):
+        # pad to a byte boundary
+        if self._bits:
+            self.write(0, 8 - self._bits)
+
+
+def _write_items(bw: _BitWriter, values, nbits):
+    # hint table items are byte-aligned
+    for value in values:
+        bw.write(value, nbits)
+    bw.flush()
+
+
+def _render_object(idnum, obj):
+    out = BytesIO()
+    out.write(b'%d 0 obj\n' % idnum)
+    obj.write_to_stream(out, None)
+    out.write(b'\nendobj\n')
+    return out.getvalue()
+
+
+class LinearizedPdfFileWriter(RewritingPdfFileWriter):
+    """
+    Rewriting writer that produces linearized output, cf. Annex F
+    in ISO 32000-1.
+    Linearized files are laid out in such a way that a viewer can render
+    the first page before the rest of the file has been retrieved.
+
+    This writer always uses classical cross-reference tables, and doesn't
+    produce object streams.
+    Incremental updates can be appended to the output as usual (of course,
+    the updated file is no longer linearized).
+
+    :param reader:
+        A PDF reader for the input document.
+    :param recompress:
+        Compress uncompressed streams, and replace trivial filter chains
+        by a single /FlateDecode filter.
+    """
+
+    def __init__(self, reader: PdfFileReader, recompress=True):
+        super().__init__(reader, object_streams=False, recompress=recompress)
+        self._push_down_page_attrs()
+
+    def _reachable(self, start_values, barrier):
+        # all objects reachable from start_values without passing through
+        # a reference in the barrier, in breadth-first order
+        result = []
+        seen = set()
+        queue = deque(
+            ref for value in start_values for ref in _direct_refs(value)
+        )
+        while queue:
+            ref = queue.popleft()
+            key = _ref_key(ref)
+            if key in seen or key in barrier or self._ref_map.get(key) is None:
+                continue
+            seen.add(key)
+            result.append(ref)
+            queue.extend(_direct_refs(ref.get_object()))
+        return result
+
+    def _arrange_sources(self, sources):
+        reader = self.reader
+        root_ref = reader.trailer.raw_get('/Root')
+        root = root_ref.get_object()
+
+        # walk the page tree, keeping track of inherited attributes
+        page_refs = []
+        page_inherited = []
+        node_refs = []
+        stack = [(root.raw_get('/Pages'), {})]
+        while stack:
+            node_ref, inherited = stack.pop()
+            node = node_ref.get_object()
+            try:
+                kids = node['/Kids']
+            except KeyError:
+                page_refs.append(node_ref)
+                page_inherited.append(inherited)
+                continue
+            node_refs.append(node_ref)
+            inherited = dict(inherited)
+            for attr in _INHERITABLE_PAGE_ATTRS:
+                if attr in node:
+                    inherited[attr] = node.raw_get(attr)
+            stack.extend((kid, inherited) for kid in reversed(kids))
+
+        if not page_refs:
+            raise ValueError('Cannot linearize a document without pages')
+
+        # the catalog and the page tree delimit the sections of the file
+        barrier = {_ref_key(ref) for ref in page_refs + node_refs}
+        barrier.add(_ref_key(root_ref))
+
+        # document-level objects required to open the document come first
+        # (even if they are also used by some page)
+        doc_level = [root_ref] + self._reachable(
+            [root.raw_get(k) for k in _OPEN_DOCUMENT_KEYS if k in root],
+            barrier
+        )
+        doc_level_keys = {_ref_key(ref) for ref in doc_level}
+
+        page_reach = []
+        owners = defaultdict(set)
+        for page_ix, (page_ref, inherited) in \
+                enumerate(zip(page_refs, page_inherited)):
+            page = page_ref.get_object()
+            start = [page.raw_get(k) for k in page if k != '/Parent']
+            start.extend(v for k, v in inherited.items() if k not in page)
+            reach = [
+                ref for ref in self._reachable(start, barrier)
+                if _ref_key(ref) not in doc_level_keys
+            ]
+            page_reach.append(reach)
+            for ref in reach:
+                owners[_ref_key(ref)].add(page_ix)
+
+        # first page section: everything the first page needs
+        first_page = [page_refs[0]] + page_reach[0]
+        # sections for the other pages: objects that only they use
+        other_pages = [
+            [page_ref] + [
+                ref for ref in reach if owners[_ref_key(ref)] == {page_ix}
+            ] for page_ix, (page_ref, reach) in
+            enumerate(zip(page_refs, page_reach)) if page_ix
+        ]
+        # shared objects, except those used by the first page
+        shared = []
+        shared_keys = set()
+        for reach in page_reach[1:]:
+            for ref in reach:
+                key = _ref_key(ref)
+                page_owners = owners[key]
+                if len(page_owners) > 1 and 0 not in page_owners \
+                        and key not in shared_keys:
+                    shared_keys.add(key)
+                    shared.append(ref)
+        placed = {
+            _ref_key(ref) for section in
+            (first_page, shared, doc_level, *other_pages) for ref in section
+        }
+        remaining = [ref for ref in sources if _ref_key(ref) not in placed]
+
+        # Objects in the first page section (and the document-level objects
+        # preceding it) are numbered last, cf. § F.3 in ISO 32000-1.
+        rest = [ref for section in other_pages for ref in section]
+        rest += shared + remaining
+        first_page_start = len(rest) + len(doc_level) + 3
+
+        # identifiers of shared objects for the hint tables
+        shared_ids = {
+            _ref_key(ref): ix for ix, ref in enumerate(first_page + shared)
+        }
+        self._layout = {
+            'main_xref_size': len(rest) + 1,
+            'doc_level': range(len(rest) + 2, first_page_start - 1),
+            'first_page': range(
+                first_page_start, first_page_start + len(first_page)
+            ),
+            'page_sizes': [len(first_page)] + [len(s) for s in other_pages],
+            'shared_count': len(shared),
+            'page_shared_ids': [[]] + [
+                [shared_ids[_ref_key(ref)] for ref in reach
+                 if _ref_key(ref) in shared_ids]
+                for reach in page_reach[1:]
+            ],
+        }
+        # reserve slots for the linearization dictionary and the hint stream
+        return rest + [None] + doc_level + [None] + first_page
+
+    def _push_down_page_attrs(self):
+        # Linearized files shouldn't rely on attribute inheritance in the
+        # page tree, so we copy inherited attributes into the page objects.
+        stack = [(self.root.raw_get('/Pages'), {})]
+        while stack:
+            node_ref, inherited = stack.pop()
+            node = node_ref.get_object()
+            try:
+                kids = node['/Kids']
+            except KeyError:
+                for attr, value in inherited.items():
+                    if attr not in node:
+                        node[pdf_name(attr)] = value
+                continue
+            inherited = dict(inherited)
+            for attr in _INHERITABLE_PAGE_ATTRS:
+                if attr in node:
+                    inherited[attr] = node.raw_get(attr)
+                    del node[attr]
+            stack.extend((kid, inherited) for kid in kids)
+
+    def _hint_stream(self, offsets, lengths, first_page_end):
+        layout = self._layout
+        first_page_nums = layout['first_page']
+        page_sizes = layout['page_sizes']
+
+        # compute page offsets and lengths
+        page_starts = [offsets[first_page_nums[0]]]
+        page_ends = [first_page_end]
+        cur = 1
+        for size in page_sizes[1:]:
+            page_starts.append(offsets[cur])
+            cur += size
+            last = cur - 1
+            page_ends.append(offsets[last] + lengths[last])
+        page_lengths = [e - s for s, e in zip(page_starts, page_ends)]
+
+        # page offset hint table, cf. § F.4.1 in ISO 32000-1
+        bw = _BitWriter()
+        min_objs = min(page_sizes)
+        objs_bits = (max(page_sizes) - min_objs).bit_length()
+        min_len = min(page_lengths)
+        len_bits = (max(page_lengths) - min_len).bit_length()
+        page_shared_ids = layout['page_shared_ids']
+        nshared = [len(ids) for ids in page_shared_ids]
+        nshared_bits = max(nshared).bit_length()
+        shared_id_bits = max(
+            (ix for ids in page_shared_ids for ix in ids), default=0
+        ).bit_length()
+        bw.write(min_objs, 32)
+        bw.write(page_starts[0], 32)
+        bw.write(objs_bits, 16)
+        bw.write(min_len, 32)
+        bw.write(len_bits, 16)
+        # We don't bother with content stream offsets (they are ignored by
+        # most viewers anyway), and pretend the page is one big content stream
+        bw.write(0, 32)
+        bw.write(0, 16)
+        bw.write(min_len, 32)
+        bw.write(len_bits, 16)
+        bw.write(nshared_bits, 16)
+        bw.write(shared_id_bits, 16)
+        # no fractional positions
+        bw.write(0, 16)
+        bw.write(1, 16)
+        _write_items(bw, (size - min_objs for size in page_sizes), objs_bits)
+        _write_items(bw, (length - min_len for length in page_lengths), len_bits)
+        _write_items(bw, nshared, nshared_bits)
+        _write_items(
+            bw, (ix for ids in page_shared_ids for ix in ids), shared_id_bits
+        )
+        _write_items(bw, (), 0)
+        _write_items(bw, (0 for _ in page_sizes), 0)
+        _write_items(bw, (length - min_len for length in page_lengths), len_bits)
+        page_offset_table = bytes(bw.buffer)
+
+        # shared object hint table, cf. § F.4.2 in ISO 32000-1
+        # Every object is in a group of its own
+        # (shared objects are numbered right after the other pages' objects)
+        shared_count = layout['shared_count']
+        shared_nums = list(first_page_nums) + list(
+            range(cur, cur + shared_count)
+        )
+        group_lengths = [lengths[n] for n in shared_nums]
+        min_group = min(group_lengths)
+        group_bits = (max(group_lengths) - min_group).bit_length()
+        bw = _BitWriter()
+        if shared_count:
+            bw.write(cur, 32)
+            bw.write(offsets[cur], 32)
+        else:
+            bw.write(0, 32)
+            bw.write(0, 32)
+        bw.write(len(first_page_nums), 32)
+        bw.write(len(shared_nums), 32)
+        bw.write(0, 16)
+        bw.write(min_group, 32)
+        bw.write(group_bits, 16)
+        _write_items(bw, (gl - min_group for gl in group_lengths), group_bits)
+        _write_items(bw, (0 for _ in shared_nums), 1)
+        shared_object_table = bytes(bw.buffer)
+
+        hint_stream = generic.StreamObject(
+            {pdf_name('/S'): generic.NumberObject(len(page_offset_table))},
+            stream_data=page_offset_table + shared_object_table
+        )
+        hint_stream.compress()
+        return hint_stream
+
+    def _first_page_xref(self, offsets, first_num, last_num, main_xref):
+        out = BytesIO()
+        out.write(b'xref\n%d %d\n' % (first_num, last_num - first_num + 1))
+        for num in range(first_num, last_num + 1):
+            out.write(b'%010d 00000 n \n' % offsets[num])
+        trailer = generic.DictionaryObject({
+            pdf_name('/Size'): generic.NumberObject(last_num + 1),
+            pdf_name('/Prev'): _PaddedNumber(main_xref),
+        })
+        self._populate_trailer(trailer)
+        out.write(b'trailer\n')
+        trailer.write_to_stream(out, None)
+        # the real startxref pointer is at the end of the file
+        out.write(b'\nstartxref\n0\n%%EOF\n')
+        return out.getvalue()
+
+    def write(self, stream):
+        layout = self._layout
+        main_xref_size = layout['main_xref_size']
+        lin_num = main_xref_size
+        doc_level_nums = layout['doc_level']
+        hint_num = doc_level_nums[-1] + 1
+        first_page_nums = layout['first_page']
+        last_num = self._lastobj_id
+        page_sizes = layout['page_sizes']
+
+        rendered = {
+            num: _render_object(num, self.objects[(0, num)])
+            for num in range(1, last_num + 1)
+            if num not in (lin_num, hint_num)
+        }
+        lengths = {num: len(data) for num, data in rendered.items()}
+        header = BytesIO()
+        self._write_header(header)
+        header = header.getvalue()
+
+        def _lin_dict(file_len=0, hint_offset=0, hint_len=0, first_page_end=0,
+                      main_xref_entries=0):
+            lin_dict = (
+                b'<< /Linearized 1 /L %010d /H [ %010d %010d ] /O %d '
+                b'/E %010d /N %d /T %010d >>' % (
+                    file_len, hint_offset, hint_len, first_page_nums[0],
+                    first_page_end, len(page_sizes), main_xref_entries
+                )
+            )
+            return b'%d 0 obj\n%s\nendobj\n' % (lin_num, lin_dict)
+
+        lin_len = len(_lin_dict())
+        fp_xref_len = len(self._first_page_xref(
+            {num: 0 for num in range(lin_num, last_num + 1)},
+            lin_num, last_num, 0
+        ))
+        file_order = list(first_page_nums) + list(range(1, lin_num))
+
+        def _layout(hint_len):
+            offsets = {lin_num: len(header)}
+            pos = len(header) + lin_len + fp_xref_len
+            for num in doc_level_nums:
+                offsets[num] = pos
+                pos += lengths[num]
+            offsets[hint_num] = pos
+            pos += hint_len
+            first_page_end = None
+            for num in file_order:
+                if num == 1:
+                    first_page_end = pos
+                offsets[num] = pos
+                pos += lengths[num]
+            if first_page_end is None:
+                first_page_end = pos
+            return offsets, first_page_end, pos
+
+        # Offsets in the hint tables are computed as if the hint stream
+        # weren't there, cf. § F.4 in ISO 32000-1.
+        offsets, first_page_end, _ = _layout(0)
+        hint_stream = self._hint_stream(offsets, lengths, first_page_end)
+        hint_data = _render_object(hint_num, hint_stream)
+
+        offsets, first_page_end, main_xref = _layout(len(hint_data))
+        main_xref_data = BytesIO()
+        write_xref_table(main_xref_data, {
+            (0, num): offsets[num] for num in range(1, lin_num)
+        })
+        main_xref_data.write(b'trailer\n<< /Size %d >>\n' % main_xref_size)
+        fp_xref_offset = len(header) + lin_len
+        main_xref_data.write(
+            b'startxref\n%d\n%%%%EOF\n' % fp_xref_offset
+        )
+        main_xref_data = main_xref_data.getvalue()
+        file_len = main_xref + len(main_xref_data)
+        # offset of the EOL marker preceding the first entry of the
+        # main xref table
+        main_xref_entries = main_xref + len(b'xref\n0 %d' % main_xref_size)
+
+        stream.write(header)
+        stream.write(_lin_dict(
+            file_len, offsets[hint_num], len(hint_data), first_page_end,
+            main_xref_entries
+        ))
+        stream.write(
+            self._first_page_xref(offsets, lin_num, last_num, main_xref)
+        )
+        for num in doc_level_nums:
+            stream.write(rendered[num])
+        stream.write(hint_data)
+        for num in file_order:
+            stream.write(rendered[num])
+        stream.write(main_xref_data)
+
+
+def optimise_pdf(input_stream, output_stream, force=False,
+                 object_streams=True, recompress=True,
+                 objstm_size=DEFAULT_OBJSTM_SIZE, linearize=False,
+                 reader: Optional[PdfFileReader] = None):
+    """
+    Rewrite a PDF document as a single revision, dropping unreachable objects,
+    and optionally packing objects into object streams.
+
+    :param input_stream:
+        The input document.
+    :param output_stream:
+        Output stream to write the result to.
+    :param force:
+        Rewrite the document even when it appears to be signed.
+    :param object_streams:
+        Pack non-stream objects into object streams.
+    :param recompress:
+        (Re)compress streams where possible.
+    :param objstm_size:
+        Maximal number of objects per object stream.
+    :param linearize:
+        Produce linearized output (see :class:`LinearizedPdfFileWriter`).
+        This implies ``object_streams=False``.
+    :param reader:
+        Reader to use, if one is already available for the input document.
+        In this case, ``input_stream`` is ignored.
+    :return:
+        The writer that was used to produce the output.
+    :raises ValueError:
+        if the document is signed (and ``force`` is ``False``), or encrypted.
+    """
+    reader = reader or PdfFileReader(input_stream)
+    if not force and is_signed(reader):
+        raise ValueError(
+            'This document contains signatures, which would be invalidated '
+            'by rewriting it.'
+        )
+    if linearize:
+        writer = LinearizedPdfFileWriter(reader, recompress=recompress)
+    else:
+        writer = RewritingPdfFileWriter(
+            reader, object_streams=object_streams, recompress=recompress,
+            objstm_size=objstm_size
+        )
+    writer.write(output_stream)
+    return writer
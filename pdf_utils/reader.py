@@ -212,6 +212,58 @@ class XRefCache:
             except KeyError:
                 raise misc.PdfReadError("Could not find object.")
 
+    def register_section(self, positions, xref_location, xref_container,
+                         root_ref=None):
+        """
+        Register the cross-reference data of a revision that was appended
+        to the document after it was read, without parsing it.
+
+        :param positions:
+            Dictionary mapping ``(generation, idnum)`` pairs to byte offsets,
+            or to ``(object stream idnum, index)`` pairs for objects in
+            object streams.
+        :param xref_location:
+            Offset of the new revision's xref table or stream.
+        :param xref_container:
+            Extent of the xref container, see
+            :meth:`get_xref_container_info`.
+        :param root_ref:
+            Reference to the document catalog, if the new revision's
+            trailer contains one.
+        """
+        # Sections are numbered from newest to oldest, so the new section
+        # gets number zero, and all others move up by one.
+        self.last_change = {
+            idnum: section + 1 for idnum, section in self.last_change.items()
+        }
+        for ix, hist in self.history.items():
+            self.history[ix] = [(section + 1, m) for section, m in hist]
+        self.historical_roots = [
+            (section + 1, ref) for section, ref in self.historical_roots
+        ]
+
+        new_refs = set()
+        for (generation, idnum), marker in positions.items():
+            ix = (generation, idnum)
+            if isinstance(marker, tuple):
+                self.in_obj_stream[idnum] = marker
+                self.standard_xrefs.pop(ix, None)
+            else:
+                self.standard_xrefs[ix] = marker
+                if generation == 0:
+                    self.in_obj_stream.pop(idnum, None)
+            self.last_change[idnum] = 0
+            self.history[ix].insert(0, (0, marker))
+            new_refs.add(generic.Reference(idnum, generation, self.reader))
+
+        self._refs_by_section.insert(0, new_refs)
+        self.xref_locations.insert(0, xref_location)
+        self.xref_container_info.insert(0, xref_container)
+        if root_ref is not None:
+            # same convention as when reading
+            self.historical_roots.insert(0, (1, root_ref))
+        self.xref_sections += 1
+
     def read_xref_table(self):
         stream = self.reader.stream
         read_non_whitespace(stream)
@@ -454,7 +506,9 @@ class PdfFileReader(PdfHandler):
                     raise misc.PdfReadError("Can't read object stream: %s" % e)
                 # Replace with null. Hopefully it's nothing important.
                 obj = generic.NullObject()
-            generic.read_non_whitespace(stream_data, seek_back=True)
+            generic.read_non_whitespace(
+                stream_data, seek_back=True, allow_eof=True
+            )
             return obj
 
         if self.strict:
@@ -801,6 +855,99 @@ class PdfFileReader(PdfHandler):
     def encrypted(self):
         return "/Encrypt" in self.trailer
 
+    def register_update(self, stream, written_xrefs):
+        """
+        Make the reader aware of an incremental update that was appended to
+        its input, without parsing the update again.
+
+        All objects written in the update are evicted from the object cache,
+        so they're read back from ``stream`` when they're needed.
+
+        :param stream:
+            Stream containing the input of this reader, followed by the
+            update. Future reads use this stream.
+        :param written_xrefs:
+            A :class:`~pdf_utils.writer.WrittenXRefs` object describing
+            the update.
+        :raises misc.PdfReadError:
+            if the update doesn't directly follow the last revision known
+            to this reader, or if its xref section isn't where it's supposed
+            to be in ``stream``.
+        """
+        self._check_update(stream, written_xrefs)
+        self.stream = stream
+        trailer = written_xrefs.trailer
+        xref_container = written_xrefs.xref_container
+        if self.has_xref_stream:
+            xrefs_id, xref_end = xref_container
+            xref_container = (generic.Reference(xrefs_id, 0, self), xref_end)
+            keys = TRAILER_KEYS
+        else:
+            keys = list(trailer.keys())
+        root_ref = None
+        try:
+            root_ref = trailer.raw_get('/Root')
+            root_ref = generic.IndirectObject(
+                root_ref.idnum, root_ref.generation, self
+            )
+        except KeyError:  # pragma: nocover
+            pass
+        self.xrefs.register_section(
+            written_xrefs.positions, written_xrefs.xref_location,
+            xref_container, root_ref=root_ref
+        )
+        self.last_startxref = written_xrefs.xref_location
+        for key in keys:
+            try:
+                value = trailer.raw_get(key)
+            except KeyError:
+                continue
+            if isinstance(value, generic.IndirectObject):
+                value = generic.IndirectObject(
+                    value.idnum, value.generation, self
+                )
+            self.trailer[generic.NameObject(key)] = value
+
+        for ix in written_xrefs.positions:
+            self.resolved_objects.pop(ix, None)
+        self._historical_resolver_cache = {}
+
+    def _check_update(self, stream, written_xrefs):
+        # Make sure that the update is appended to the revision we know
+        # about, before touching any state. Everything the update writes
+        # has to sit between the previous xref section and its own.
+        prev = written_xrefs.trailer.get('/Prev')
+        if prev != self.last_startxref:
+            raise misc.PdfReadError(
+                f'Update refers to the xref section at {prev}, but the last '
+                f'xref section of this document is at {self.last_startxref}.'
+            )
+        xref_location = written_xrefs.xref_location
+        for marker in written_xrefs.positions.values():
+            if isinstance(marker, tuple):
+                continue
+            if not prev < marker <= xref_location:
+                raise misc.PdfReadError(
+                    f'Object offset {marker} in update is outside of the '
+                    f'range ({prev}, {xref_location}].'
+                )
+        pos = stream.tell()
+        try:
+            stream.seek(xref_location)
+            head = stream.read(4)
+        finally:
+            stream.seek(pos)
+        if self.has_xref_stream:
+            # xref streams start with their object number
+            found = head[:1].isdigit()
+        else:
+            found = head == b'xref'
+        if not found:
+            raise misc.PdfReadError(
+                f'No xref section found at offset {xref_location} of the '
+                f'updated stream.'
+            )
+
     def get_historical_resolver(self, revision) -> 'HistoricalResolver':
         cache = self._historical_resolver_cache
         try:
@@ -1,8 +1,10 @@
 import os
 import struct
+import weakref
 from hashlib import md5
+from dataclasses import dataclass
 from io import BytesIO
-from typing import Tuple, List, Union
+from typing import Tuple, List, Union, Optional
 
 from pdf_utils import generic
 from pdf_utils.generic import pdf_name, pdf_string
@@ -38,6 +40,9 @@ class ObjectStream:
         for idnum, obj in self._obj_refs:
             offset = main_body.tell()
             obj.write_to_stream(main_body, None)
+            # separate objects by whitespace, otherwise objects like numbers
+            # can't be parsed reliably
+            main_body.write(b'\n')
             stream_header.write(b'%d %d ' % (idnum, offset))
 
         # strip the last bit of whitespace
@@ -55,6 +60,14 @@ class ObjectStream:
         return stream_object
 
 
+def write_pdf_header(stream, version):
+    major, minor = version
+    stream.write(f'%PDF-{major}.{minor}\n'.encode('ascii'))
+    # write some binary characters to make sure the file is flagged
+    # as binary (see § 7.5.2 in ISO 32000-1)
+    stream.write(b'%\xc2\xa5\xc2\xb1\xc3\xab\n')
+
+
 def _derive_key(base_key, idnum, generation):
     # Ripped out of PyPDF2
     # See § 7.6.2 in ISO 32000
@@ -204,6 +217,25 @@ def init_xobject_dictionary(command_stream, box_width, box_height,
     }, stream_data=command_stream)
 
 
+@dataclass(frozen=True)
+class WrittenXRefs:
+    """
+    Cross-reference data of a revision produced by a PDF writer.
+
+    The ``positions`` dictionary maps ``(generation, idnum)`` pairs to byte
+    offsets, or to ``(object stream idnum, index)`` pairs for objects in
+    object streams. ``xref_container`` describes the extent of the xref
+    table or stream in the same way as
+    :meth:`~pdf_utils.reader.XRefCache.get_xref_container_info`, except that
+    xref streams are identified by their object number.
+    """
+
+    positions: dict
+    xref_location: int
+    xref_container: tuple
+    trailer: generic.DictionaryObject
+
+
 class BasePdfFileWriter(PdfHandler):
     output_version = (1, 7)
 
@@ -214,6 +246,9 @@ class BasePdfFileWriter(PdfHandler):
         self.objs_in_streams = {}
         self._lastobj_id = obj_id_start
         self._resolves_objs_from = (self,)
+        # source handler -> (generation, idnum) -> imported reference
+        # (weak, so we don't keep source documents alive)
+        self._import_maps = weakref.WeakKeyDictionary()
 
         if isinstance(root, generic.IndirectObject):
             self._root = root
@@ -227,6 +262,8 @@ class BasePdfFileWriter(PdfHandler):
         self._encrypt = self._encrypt_key = None
         self._document_id = document_id
         self.stream_xrefs = stream_xrefs
+        # xref data of the last write() call
+        self._written_xrefs: Optional[WrittenXRefs] = None
 
     def mark_update(self, obj_ref: Union[generic.Reference,
                                          generic.IndirectObject]):
@@ -335,6 +372,7 @@ class BasePdfFileWriter(PdfHandler):
             # write XRef stream
             stream.write(('%d %d obj' % (xrefs_id, 0)).encode('ascii'))
             trailer.write_to_stream(stream, None)
+            xref_container = (xrefs_id, stream.tell())
             stream.write(b'\nendobj\n')
         else:
             # classical xref table
@@ -344,11 +382,18 @@ class BasePdfFileWriter(PdfHandler):
             )
             # write trailer
             stream.write(b'trailer\n')
+            # this is what the reader records as the extent of the xref table
+            # (sans the 'xref' keyword)
+            xref_container = (xref_location + 4, stream.tell())
             trailer.write_to_stream(stream, None)
 
         # write xref table pointer and EOF
         xref_pointer_string = '\nstartxref\n%s\n' % xref_location
         stream.write(xref_pointer_string.encode('ascii') + b'%%EOF\n')
+        self._written_xrefs = WrittenXRefs(
+            positions=object_positions, xref_location=xref_location,
+            xref_container=xref_container, trailer=trailer
+        )
 
     def register_annotation(self, page_ref, annot_ref):
         page_obj = page_ref.get_object()
@@ -418,13 +463,23 @@ class BasePdfFileWriter(PdfHandler):
 
         return new_page_ref
 
-    def import_object(self, obj: generic.PdfObject) -> generic.PdfObject:
+    def import_object(self, obj: generic.PdfObject,
+                      obj_stream: ObjectStream = None) -> generic.PdfObject:
         """
         Deep-copy an object into this writer, dealing with resolving indirect
         references in the process.
 
+        Indirect objects are imported only once: the writer keeps track of
+        the references it has imported from every source document, so
+        importing several objects from the same document will not duplicate
+        shared resources (fonts, for example), and cyclic structures like
+        ``/Parent`` back-pointers are handled correctly.
+
         :param obj:
             The object to import.
+        :param obj_stream:
+            If specified, all indirect non-stream objects that are imported
+            will be put into this object stream.
         :return:
             The object as associated with this writer.
             If the input object was an indirect reference, a dictionary
@@ -432,35 +487,69 @@ class BasePdfFileWriter(PdfHandler):
             a new instance. In other cases, the original object is returned.
         """
 
-        # TODO support collecting all relevant references into a single object
-        #  stream. This makes sense in various scenarios (e.g. encapsulating
-        #  content from an existing PDF file)
-
         # TODO check the spec for guidance on fonts. Do font identifiers have
         #  to be globally unique?
 
-        if isinstance(obj, generic.IndirectObject):
-            refd = obj.get_object()
-            return self.add_object(self.import_object(refd))
-        elif isinstance(obj, generic.DictionaryObject):
-            raw_dict = {k: self.import_object(v) for k, v in obj.items()}
-            if isinstance(obj, generic.StreamObject):
-                # In the vast majority of use cases, I'd expect the content
-                # to be available in encoded form by default.
-                # By initialising the stream object in this way, we avoid
-                # a potentially costly decoding operation.
-                return generic.StreamObject(
-                    raw_dict, encoded_data=obj.encoded_data
+        # We don't use recursion here, to avoid running into the recursion
+        # limit on deep trees. Instead, containers are created empty, and
+        # filled in later.
+        todo = []
+        result = self._import_shallow(obj, todo, obj_stream)
+        while todo:
+            source, target = todo.pop()
+            if isinstance(source, generic.DictionaryObject):
+                for key in source:
+                    # the /Length entry will be recomputed anyway
+                    if key == '/Length' and \
+                            isinstance(source, generic.StreamObject):
+                        continue
+                    target[key] = self._import_shallow(
+                        source.raw_get(key), todo, obj_stream
+                    )
+            else:
+                target.extend(
+                    self._import_shallow(source[ix], todo, obj_stream)
+                    for ix in range(len(source))
                 )
+        return result
+
+    def _import_shallow(self, obj, todo, obj_stream):
+        if isinstance(obj, generic.IndirectObject):
+            handler = obj.get_pdf_handler()
+            if handler is self:
+                return obj
+            ref_map = self._import_maps.setdefault(handler, {})
+            key = (obj.generation, obj.idnum)
+            try:
+                return ref_map[key]
+            except KeyError:
+                pass
+            target = self._import_shallow(obj.get_object(), todo, obj_stream)
+            if isinstance(target, generic.StreamObject):
+                ref = self.add_object(target)
             else:
-                return generic.DictionaryObject(raw_dict)
+                ref = self.add_object(target, obj_stream=obj_stream)
+            # register the reference before the content is filled in
+            ref_map[key] = ref
+            return ref
+        elif isinstance(obj, generic.StreamObject):
+            # In the vast majority of use cases, I'd expect the content
+            # to be available in encoded form by default.
+            # By initialising the stream object in this way, we avoid
+            # a potentially costly decoding operation.
+            target = generic.StreamObject(encoded_data=obj.encoded_data)
+        elif isinstance(obj, generic.DictionaryObject):
+            target = generic.DictionaryObject()
         elif isinstance(obj, generic.ArrayObject):
-            return generic.ArrayObject(self.import_object(v) for v in obj)
+            target = generic.ArrayObject()
         else:
             return obj
+        todo.append((obj, target))
+        return target
 
     def import_page_as_xobject(self, other: PdfHandler, page_ix=0,
-                               content_stream=0, inherit_filters=True):
+                               content_stream=0, inherit_filters=True,
+                               obj_stream: ObjectStream = None):
         """
         Import a page content stream from some other PdfHandler into the
         current one as a form XObject.
@@ -474,6 +563,9 @@ class BasePdfFileWriter(PdfHandler):
             (default: 0)
         :param inherit_filters:
             Inherit the content stream's filters, if present.
+        :param obj_stream:
+            If specified, put the (non-stream) objects that are imported
+            along with the page into this object stream.
         :return:
         """
         page_ref, resources = other.find_page_for_modification(page_ix)
@@ -495,7 +587,7 @@ class BasePdfFileWriter(PdfHandler):
 
         stream_dict = {
             pdf_name('/BBox'): mb,
-            pdf_name('/Resources'): self.import_object(resources),
+            pdf_name('/Resources'): self.import_object(resources, obj_stream),
             pdf_name('/Type'): pdf_name('/XObject'),
             pdf_name('/Subtype'): pdf_name('/Form')
         }
@@ -514,7 +606,9 @@ class BasePdfFileWriter(PdfHandler):
                 pass
 
         if filters is not None:
-            stream_dict[pdf_name('/Filter')] = self.import_object(filters)
+            stream_dict[pdf_name('/Filter')] = self.import_object(
+                filters, obj_stream
+            )
             result = generic.StreamObject(
                 stream_dict, encoded_data=command_stream.encoded_data
             )
@@ -586,11 +680,7 @@ class PdfFileWriter(BasePdfFileWriter):
         root[pdf_name('/Pages')] = self.add_object(pages)
 
     def _write_header(self, stream):
-        major, minor = self.output_version
-        stream.write(f'%PDF-{major}.{minor}\n'.encode('ascii'))
-        # write some binary characters to make sure the file is flagged
-        # as binary (see § 7.5.2 in ISO 32000-1)
-        stream.write(b'%\xc2\xa5\xc2\xb1\xc3\xab\n')
+        write_pdf_header(stream, self.output_version)
 
     # I can't be arsed to actually implement encrypt() for newly written PDFs,
     # since all security handlers specified in the 1.7 standard are insecure as
@@ -1,3 +1,5 @@
+import json
+import os
 from datetime import timedelta
 
 import click
@@ -8,10 +10,15 @@ from certvalidator import ValidationContext
 
 from pdfstamp.sign import signers
 from pdfstamp.sign.timestamps import HTTPTimeStamper
-from pdfstamp.sign import validation, beid, fields
+from pdfstamp.sign.cache import TSACache, ValidationResultStore
+from pdfstamp.sign.revinfo import RevocationInfoCache, CachingValidationContext
+from pdfstamp.sign import validation, beid, fields, batch
 from pdf_utils.reader import PdfFileReader
 from pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pdf_utils.optimise import optimise_pdf
+from pdfstamp.sign.general import SigningError
 from pdfstamp.sign.validation import SignatureValidationError
+from pdf_utils.misc import PdfReadError
 
 __all__ = ['cli']
 
@@ -96,6 +103,20 @@ def list_sigfields(infile, skip_status, validate, executive_summary, trust,
     vc_kwargs = init_validation_context_kwargs(
         trust, trust_replace, other_certs
     )
+    report = None
+    if validate and not skip_status:
+        # validate everything in one go, so the signatures can share
+        # validation contexts and revision diffs
+        if ltv_profile is None:
+            validator = validation.DocumentValidator(
+                r, signer_validation_context=ValidationContext(**vc_kwargs)
+            )
+        else:
+            validator = validation.DocumentValidator(r)
+        report = validator.validate_all(
+            validation_type=ltv_profile, validation_context_kwargs=vc_kwargs,
+            force_revinfo=ltv_obsessive
+        )
     for name, value, field_ref in fields.enumerate_sig_fields(r):
         if skip_status:
             print(name)
@@ -103,28 +124,18 @@ def list_sigfields(infile, skip_status, validate, executive_summary, trust,
         status_str = 'EMPTY'
         if value is not None:
             if validate:
-                try:
-                    if ltv_profile is None:
-                        vc = ValidationContext(**vc_kwargs)
-                        status = validation.validate_pdf_signature(
-                            r, field_ref, signer_validation_context=vc
-                        )
-                    else:
-                        status = validation.validate_pdf_ltv_signature(
-                            r, field_ref, ltv_profile,
-                            force_revinfo=ltv_obsessive,
-                            validation_context_kwargs=vc_kwargs
-                        )
-                    if executive_summary:
-                        status_str = (
-                            'VALID' if status.bottom_line else 'INVALID'
-                        )
+                result = report[name]
+                if result.error is not None:
+                    if isinstance(result.error, SignatureValidationError):
+                        status_str = 'INVALID'
+                    elif isinstance(result.error, (PdfReadError, ValueError)):
+                        status_str = 'MALFORMED'
                     else:
-                        status_str = status.summary()
-                except SignatureValidationError:
-                    status_str = 'INVALID'
-                except ValueError:
-                    status_str = 'MALFORMED'
+                        raise result.error
+                elif executive_summary:
+                    status_str = 'VALID' if result.bottom_line else 'INVALID'
+                else:
+                    status_str = result.status.summary()
             else:
                 status_str = 'FILLED'
         print('%s:%s' % (name, status_str))
@@ -133,6 +144,54 @@ def list_sigfields(infile, skip_status, validate, executive_summary, trust,
 SIG_META = 'SIG_META'
 EXISTING_ONLY = 'EXISTING_ONLY'
 TIMESTAMP_URL = 'TIMESTAMP_URL'
+TSA_CACHE = 'TSA_CACHE'
+
+
+def init_tsa_cache(tsa_cache_dir, no_tsa_cache):
+    if no_tsa_cache:
+        return None
+    return TSACache(directory=tsa_cache_dir)
+
+
+tsa_cache_options = [
+    click.option('--tsa-cache-dir', required=False, default=None,
+                 type=click.Path(file_okay=False),
+                 help='directory to cache timestamp server data in',
+                 show_default='~/.cache/pdfstamp/tsa'),
+    click.option('--no-tsa-cache', help='do not cache timestamp server data',
+                 required=False, default=False, is_flag=True, type=bool,
+                 show_default=True),
+]
+
+
+def with_tsa_cache_options(f):
+    for opt in reversed(tsa_cache_options):
+        f = opt(f)
+    return f
+
+
+def init_revinfo_cache(revinfo_cache_dir, no_revinfo_cache):
+    if no_revinfo_cache:
+        return None
+    return RevocationInfoCache(directory=revinfo_cache_dir)
+
+
+revinfo_cache_options = [
+    click.option('--revinfo-cache-dir', required=False, default=None,
+                 type=click.Path(file_okay=False),
+                 help='directory to cache OCSP responses and CRLs in',
+                 show_default='~/.cache/pdfstamp/revinfo'),
+    click.option('--no-revinfo-cache',
+                 help='do not cache OCSP responses and CRLs',
+                 required=False, default=False, is_flag=True, type=bool,
+                 show_default=True),
+]
+
+
+def with_revinfo_cache_options(f):
+    for opt in reversed(revinfo_cache_options):
+        f = opt(f)
+    return f
 
 
 @signing.group(name='addsig', help='add a signature')
@@ -147,12 +206,14 @@ TIMESTAMP_URL = 'TIMESTAMP_URL'
               show_default=True)
 @click.option('--timestamp-url', help='URL for timestamp server',
               required=False, type=str, default=None)
+@with_tsa_cache_options
 @click.option('--use-pades', help='sign PAdES-style [level B/B-T/B-LT]',
               required=False, default=False, is_flag=True, type=bool,
               show_default=True)
 @click.option('--with-validation-info', help='embed revocation info',
               required=False, default=False, is_flag=True, type=bool,
               show_default=True)
+@with_revinfo_cache_options
 @click.option('--trust-replace',
               help='listed trust roots supersede OS-provided trust store',
               required=False,
@@ -164,11 +225,13 @@ TIMESTAMP_URL = 'TIMESTAMP_URL'
               required=False, multiple=True, type=readable_file)
 @click.pass_context
 def addsig(ctx, field, name, reason, location, certify, existing_only,
-           timestamp_url, use_pades, with_validation_info, trust_replace, trust,
-           other_certs):
+           timestamp_url, tsa_cache_dir, no_tsa_cache, use_pades,
+           with_validation_info, revinfo_cache_dir, no_revinfo_cache,
+           trust_replace, trust, other_certs):
     ctx.ensure_object(dict)
     ctx.obj[EXISTING_ONLY] = existing_only or field is None
     ctx.obj[TIMESTAMP_URL] = timestamp_url
+    ctx.obj[TSA_CACHE] = init_tsa_cache(tsa_cache_dir, no_tsa_cache)
 
     if use_pades:
         subfilter = fields.SigSeedSubFilter.PADES
@@ -179,7 +242,11 @@ def addsig(ctx, field, name, reason, location, certify, existing_only,
         vc_kwargs = init_validation_context_kwargs(
             trust, trust_replace, other_certs, allow_fetching=True
         )
-        vc = ValidationContext(**vc_kwargs)
+        vc = CachingValidationContext(
+            revinfo_cache=init_revinfo_cache(
+                revinfo_cache_dir, no_revinfo_cache
+            ), **vc_kwargs
+        )
     else:
         vc = None
     ctx.obj[SIG_META] = signers.PdfSignatureMetadata(
@@ -191,9 +258,10 @@ def addsig(ctx, field, name, reason, location, certify, existing_only,
 
 
 def addsig_simple_signer(signer: signers.SimpleSigner, infile, outfile,
-                         timestamp_url, signature_meta, existing_fields_only):
+                         timestamp_url, signature_meta, existing_fields_only,
+                         tsa_cache=None):
     if timestamp_url is not None:
-        signer.timestamper = HTTPTimeStamper(timestamp_url)
+        signer.timestamper = HTTPTimeStamper(timestamp_url, cache=tsa_cache)
     writer = IncrementalPdfFileWriter(infile)
 
     # TODO make this an option higher up the tree
@@ -251,7 +319,8 @@ def addsig_pemder(ctx, infile, outfile, key, cert, chain, passfile):
     return addsig_simple_signer(
         signer, infile, outfile, timestamp_url=timestamp_url,
         signature_meta=signature_meta,
-        existing_fields_only=existing_fields_only
+        existing_fields_only=existing_fields_only,
+        tsa_cache=ctx.obj[TSA_CACHE]
     )
 
 
@@ -289,7 +358,8 @@ def addsig_pkcs12(ctx, infile, outfile, pfx, chain, passfile):
     return addsig_simple_signer(
         signer, infile, outfile, timestamp_url=timestamp_url,
         signature_meta=signature_meta,
-        existing_fields_only=existing_fields_only
+        existing_fields_only=existing_fields_only,
+        tsa_cache=ctx.obj[TSA_CACHE]
     )
 
 
@@ -311,7 +381,9 @@ def addsig_beid(ctx, infile, outfile, lib, use_auth_cert, slot_no):
     session = beid.open_beid_session(lib, slot_no=slot_no)
     label = 'Authentication' if use_auth_cert else 'Signature'
     if timestamp_url is not None:
-        timestamper = HTTPTimeStamper(timestamp_url)
+        timestamper = HTTPTimeStamper(
+            timestamp_url, cache=ctx.obj[TSA_CACHE]
+        )
     else:
         timestamper = None
     signer = beid.BEIDSigner(
@@ -330,6 +402,231 @@ def addsig_beid(ctx, infile, outfile, lib, use_auth_cert, slot_no):
     outfile.close()
 
 
+@signing.command(name='batch', help='sign many files in parallel')
+@click.option('--manifest', type=readable_file, required=False,
+              help='CSV or JSONL file listing input and (optionally) output '
+                   'files')
+@click.option('--glob', 'patterns', multiple=True, required=False,
+              help='glob pattern for input files (multiple allowed)')
+@click.option('--output-dir', required=False,
+              type=click.Path(file_okay=False, writable=True),
+              help='directory for output files [default: next to input]')
+@click.option('--suffix', help='suffix to append to output file names',
+              default=batch.DEFAULT_OUTPUT_SUFFIX, show_default=True)
+@click.option('--jobs', help='number of worker processes', type=int,
+              default=os.cpu_count() or 1, show_default='CPU count')
+@click.option('--log', help='write a JSON line per file to this file',
+              type=click.File('w'), default='-', show_default='stdout')
+@click.option('--key', help='file containing the private key (PEM/DER)',
+              type=readable_file, required=False)
+@click.option('--cert', help='file containing the signer\'s certificate '
+              '(PEM/DER)', type=readable_file, required=False)
+@click.option('--pfx', help='PKCS#12 file containing the key material',
+              type=readable_file, required=False)
+@click.option('--chain', type=readable_file, multiple=True,
+              help='file(s) containing the chain of trust for the '
+                   'signer\'s certificate (PEM/DER). May be '
+                   'passed multiple times.')
+@click.option('--passfile', help='file containing the passphrase '
+              'for the key material', required=False, type=click.File('rb'),
+              show_default='stdin')
+@click.option('--field', help='name of the signature field', required=False)
+@click.option('--name', help='explicitly specify signer name', required=False)
+@click.option('--reason', help='reason for signing', required=False)
+@click.option('--location', help='location of signing', required=False)
+@click.option('--existing-only', help='never create signature fields',
+              required=False, default=False, is_flag=True, type=bool,
+              show_default=True)
+@click.option('--timestamp-url', help='URL for timestamp server',
+              required=False, type=str, default=None)
+@with_tsa_cache_options
+@click.option('--use-pades', help='sign PAdES-style [level B/B-T/B-LT]',
+              required=False, default=False, is_flag=True, type=bool,
+              show_default=True)
+@click.option('--with-validation-info', help='embed revocation info',
+              required=False, default=False, is_flag=True, type=bool,
+              show_default=True)
+@with_revinfo_cache_options
+@click.option('--trust-replace',
+              help='listed trust roots supersede OS-provided trust store',
+              required=False,
+              type=bool, is_flag=True, default=False, show_default=True)
+@click.option('--trust', help='list trust roots (multiple allowed)',
+              required=False, multiple=True, type=readable_file)
+@click.option('--other-certs',
+              help='other certs relevant for validation',
+              required=False, multiple=True, type=readable_file)
+def batch_sign(manifest, patterns, output_dir, suffix, jobs, log, key, cert,
+               pfx, chain, passfile, field, name, reason, location,
+               existing_only, timestamp_url, tsa_cache_dir, no_tsa_cache,
+               use_pades, with_validation_info, revinfo_cache_dir,
+               no_revinfo_cache, trust_replace, trust, other_certs):
+    if (manifest is None) == (not patterns):
+        raise click.ClickException(
+            'Specify either a manifest or one or more glob patterns.'
+        )
+    if pfx is None and (key is None or cert is None):
+        raise click.ClickException(
+            'Specify either --pfx or both --key and --cert.'
+        )
+
+    # read the passphrase once, the workers get a copy
+    if passfile is None:
+        passphrase = getpass.getpass(prompt='Key passphrase: ').encode('utf-8')
+    else:
+        passphrase = passfile.read()
+        passfile.close()
+    key_spec = batch.KeyMaterialSpec(
+        key_file=key, cert_file=cert, pfx_file=pfx, ca_chain_files=chain,
+        passphrase=passphrase, timestamp_url=timestamp_url,
+        tsa_cache=init_tsa_cache(tsa_cache_dir, no_tsa_cache)
+    )
+    # fail early if the key material is unusable, rather than
+    # taking down every worker in the pool
+    try:
+        key_spec.load()
+    except SigningError as e:
+        raise click.ClickException(str(e))
+
+    if use_pades:
+        subfilter = fields.SigSeedSubFilter.PADES
+    else:
+        subfilter = fields.SigSeedSubFilter.ADOBE_PKCS7_DETACHED
+    signature_meta = signers.PdfSignatureMetadata(
+        field_name=field, location=location, reason=reason, name=name,
+        subfilter=subfilter, embed_validation_info=with_validation_info
+    )
+    vc_kwargs = None
+    if with_validation_info:
+        vc_kwargs = init_validation_context_kwargs(
+            trust, trust_replace, other_certs, allow_fetching=True
+        )
+        # the workers share their revocation info through the cache
+        vc_kwargs['revinfo_cache'] = init_revinfo_cache(
+            revinfo_cache_dir, no_revinfo_cache
+        )
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    try:
+        if manifest is not None:
+            job_list = list(batch.read_manifest(manifest, output_dir, suffix))
+        else:
+            job_list = list(batch.jobs_from_glob(patterns, output_dir, suffix))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    failures = 0
+    results = batch.sign_files(
+        job_list, key_spec, signature_meta,
+        validation_context_kwargs=vc_kwargs,
+        existing_fields_only=existing_only or field is None,
+        max_workers=max(1, min(jobs, len(job_list)))
+    )
+    for result in results:
+        if not result.ok:
+            failures += 1
+        log.write(json.dumps(result.as_json_dict()) + '\n')
+        log.flush()
+
+    if failures:
+        raise click.ClickException(
+            '%d of %d files could not be signed.' % (failures, len(job_list))
+        )
+
+
+@signing.command(name='validate-batch',
+                 help='validate signatures in many files in parallel')
+@click.argument('infiles', nargs=-1, type=readable_file)
+@click.option('--manifest', type=readable_file, required=False,
+              help='CSV or JSONL file listing input files')
+@click.option('--glob', 'patterns', multiple=True, required=False,
+              help='glob pattern for input files (multiple allowed)')
+@click.option('--jobs', help='number of worker processes', type=int,
+              default=os.cpu_count() or 1, show_default='CPU count')
+@click.option('--log', help='write a JSON line per file to this file',
+              type=click.File('w'), default='-', show_default='stdout')
+@click.option('--trust-replace',
+              help='listed trust roots supersede OS-provided trust store',
+              required=False,
+              type=bool, is_flag=True, default=False, show_default=True)
+@click.option('--trust', help='list trust roots (multiple allowed)',
+              required=False, multiple=True, type=readable_file)
+@click.option('--other-certs',
+              help='other certs relevant for validation',
+              required=False, multiple=True, type=readable_file)
+@click.option('--fetch-revinfo', help='fetch revocation info from the web',
+              required=False, default=False, is_flag=True, type=bool,
+              show_default=True)
+@with_revinfo_cache_options
+@click.option('--ltv-profile',
+              help='LTV signature validation profile',
+              type=click.Choice(('pades', 'adobe')), required=False)
+@click.option('--ltv-obsessive',
+              help='Fail trust validation if a certificate has no known CRL '
+                   'or OCSP endpoints.',
+              type=bool, is_flag=True, default=False, show_default=True)
+@click.option('--result-store', 'result_store_dir', required=False,
+              type=click.Path(file_okay=False),
+              help='directory to keep validation results in, to speed up '
+                   're-validating the same documents later (signature '
+                   'results are not kept when fetching revocation info)')
+def batch_validate(infiles, manifest, patterns, jobs, log, trust_replace,
+                   trust, other_certs, fetch_revinfo, revinfo_cache_dir,
+                   no_revinfo_cache, ltv_profile, ltv_obsessive,
+                   result_store_dir):
+    try:
+        input_files = list(infiles)
+        if manifest is not None:
+            input_files.extend(batch.read_input_manifest(manifest))
+        input_files.extend(batch.inputs_from_glob(patterns))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if not input_files:
+        raise click.ClickException(
+            'Specify input files, a manifest or one or more glob patterns.'
+        )
+
+    if ltv_profile == 'pades':
+        validation_type = validation.RevocationInfoValidationType.PADES_LT
+    elif ltv_profile == 'adobe':
+        validation_type = validation.RevocationInfoValidationType.ADOBE_STYLE
+    else:
+        validation_type = None
+    vc_kwargs = init_validation_context_kwargs(
+        trust, trust_replace, other_certs, allow_fetching=fetch_revinfo
+    )
+    if fetch_revinfo:
+        vc_kwargs['revinfo_cache'] = init_revinfo_cache(
+            revinfo_cache_dir, no_revinfo_cache
+        )
+
+    result_store = None
+    if result_store_dir is not None:
+        result_store = ValidationResultStore(directory=result_store_dir)
+
+    failures = 0
+    results = batch.validate_many(
+        input_files, validation_context_kwargs=vc_kwargs,
+        validation_type=validation_type, force_revinfo=ltv_obsessive,
+        result_store=result_store,
+        max_workers=max(1, min(jobs, len(input_files))),
+        # amortise IPC overhead over a couple of files
+        chunksize=max(1, min(16, len(input_files) // (4 * max(jobs, 1))))
+    )
+    for result in results:
+        if not result.ok:
+            failures += 1
+        log.write(json.dumps(result.as_json_dict()) + '\n')
+        log.flush()
+
+    if failures:
+        raise click.ClickException(
+            '%d of %d files could not be processed.'
+            % (failures, len(input_files))
+        )
+
+
 @signing.command(name='addfields')
 @click.argument('infile', type=click.File('rb'))
 @click.argument('outfile', type=click.File('wb'))
@@ -367,3 +664,30 @@ def add_sig_field(infile, outfile, specs):
     writer.write(outfile)
     infile.close()
     outfile.close()
+
+
+@cli.command(name='optimise',
+             help='rewrite a PDF file, dropping unreachable objects')
+@click.argument('infile', type=click.File('rb'))
+@click.argument('outfile', type=click.File('wb'))
+@click.option('--force', help='also rewrite signed documents',
+              type=bool, is_flag=True, default=False, show_default=True)
+@click.option('--no-object-streams',
+              help='do not pack objects into object streams',
+              type=bool, is_flag=True, default=False, show_default=True)
+@click.option('--no-recompress', help='do not recompress streams',
+              type=bool, is_flag=True, default=False, show_default=True)
+@click.option('--linearize', help='optimise for fast web view',
+              type=bool, is_flag=True, default=False, show_default=True)
+def optimise(infile, outfile, force, no_object_streams, no_recompress,
+             linearize):
+    try:
+        optimise_pdf(
+            infile, outfile, force=force,
+            object_streams=not no_object_streams, recompress=not no_recompress,
+            linearize=linearize
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    infile.close()
+    outfile.close()
@@ -0,0 +1,579 @@
+"""
+Utilities to sign or validate large numbers of PDF files, optionally spread
+out over a pool of worker processes.
+
+When signing, every worker loads the key material once, and then signs
+documents using a :class:`~pdfstamp.sign.signers.BatchSigner`, so the setup
+cost is paid once per worker instead of once per document.
+Similarly, validation workers keep the same validation context (and hence
+the same trust store, certificate registry and revocation info), as well as
+a cache of validated certificate paths, for all documents they process.
+"""
+
+import csv
+import glob
+import json
+import logging
+import os
+import secrets
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Iterable, Iterator, Optional, Tuple
+
+from asn1crypto import pem, x509
+
+from pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pdf_utils.misc import PdfReadError
+from pdf_utils.reader import PdfFileReader
+from pdfstamp.sign.general import SigningError, ValidationPathCache
+from pdfstamp.sign.signers import (
+    BatchSigner, PdfSignatureMetadata, SimpleSigner,
+)
+from pdfstamp.sign.cache import TSACache, ValidationResultStore
+from pdfstamp.sign.revinfo import CachingValidationContext
+from pdfstamp.sign.timestamps import HTTPTimeStamper
+from pdfstamp.sign.validation import (
+    DocumentValidator, FieldValidationResult, RevocationInfoValidationType,
+    SignatureValidationError, SignatureVerifier,
+)
+
+__all__ = [
+    'BatchJob', 'BatchJobResult', 'KeyMaterialSpec',
+    'read_manifest', 'jobs_from_glob', 'sign_files',
+    'DEFAULT_OUTPUT_SUFFIX', 'ValidationJobResult', 'read_input_manifest',
+    'inputs_from_glob', 'validate_many',
+]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT_SUFFIX = '-signed'
+
+
+@dataclass(frozen=True)
+class BatchJob:
+    input_file: str
+    output_file: str
+
+
+@dataclass(frozen=True)
+class BatchJobResult:
+    input_file: str
+    output_file: str
+    ok: bool
+    elapsed: float
+    error: Optional[str] = None
+
+    def as_json_dict(self):
+        result = {
+            'input': self.input_file, 'output': self.output_file,
+            'status': 'ok' if self.ok else 'error',
+            'elapsed': round(self.elapsed, 6),
+        }
+        if self.error is not None:
+            result['error'] = self.error
+        return result
+
+
+@dataclass(frozen=True)
+class KeyMaterialSpec:
+    """
+    Picklable recipe for loading a :class:`.SimpleSigner`, either from
+    PEM/DER files or from a PKCS#12 file.
+    """
+
+    key_file: str = None
+    cert_file: str = None
+    pfx_file: str = None
+    ca_chain_files: Tuple[str, ...] = ()
+    passphrase: bytes = None
+    timestamp_url: str = None
+    tsa_cache: TSACache = None
+
+    def load(self) -> SimpleSigner:
+        chain = self.ca_chain_files or None
+        if self.pfx_file is not None:
+            signer = SimpleSigner.load_pkcs12(
+                pfx_file=self.pfx_file, passphrase=self.passphrase,
+                ca_chain_files=chain
+            )
+        elif self.key_file is not None and self.cert_file is not None:
+            signer = SimpleSigner.load(
+                key_file=self.key_file, cert_file=self.cert_file,
+                key_passphrase=self.passphrase, ca_chain_files=chain
+            )
+        else:
+            raise SigningError(
+                'Either a PKCS#12 file or a key and a certificate file '
+                'must be specified.'
+            )
+        if signer is None:
+            raise SigningError('Could not load key material.')
+        if self.timestamp_url is not None:
+            signer.timestamper = HTTPTimeStamper(
+                self.timestamp_url, cache=self.tsa_cache
+            )
+        return signer
+
+
+def default_output_name(input_file, output_dir=None,
+                        suffix=DEFAULT_OUTPUT_SUFFIX):
+    """
+    Derive an output file name from an input file name, by appending
+    a suffix to the base name. If ``output_dir`` is ``None``, the output file
+    is put next to the input file.
+    """
+    base, ext = os.path.splitext(os.path.basename(input_file))
+    if output_dir is None:
+        output_dir = os.path.dirname(input_file)
+    return os.path.join(output_dir, base + suffix + (ext or '.pdf'))
+
+
+def _manifest_rows(manifest_file):
+    if os.path.splitext(manifest_file)[1].lower() in ('.jsonl', '.json'):
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(
+                        f'{manifest_file}, line {line_no}: invalid JSON.'
+                    ) from e
+                if not isinstance(row, dict):
+                    raise ValueError(
+                        f'{manifest_file}, line {line_no}: expected a JSON '
+                        f'object.'
+                    )
+                yield line_no, row
+    else:
+        with open(manifest_file, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames is None or \
+                    'input' not in reader.fieldnames:
+                raise ValueError(
+                    f'{manifest_file}: CSV manifests must have a header row '
+                    f'with an \'input\' column.'
+                )
+            # line 1 is the header
+            for line_no, row in enumerate(reader, start=2):
+                yield line_no, row
+
+
+def _same_file(path1, path2):
+    try:
+        return os.path.samefile(path1, path2)
+    except OSError:
+        # one of the files doesn't exist (yet)
+        return os.path.realpath(path1) == os.path.realpath(path2)
+
+
+def _check_job(job: BatchJob, where):
+    # writing the output would destroy the input before it is read
+    if _same_file(job.input_file, job.output_file):
+        raise ValueError(
+            f'{where}: the output file {job.output_file} is the same as '
+            f'the input file.'
+        )
+    return job
+
+
+def _manifest_path(manifest_file, path):
+    # relative paths in a manifest are relative to the manifest itself
+    return os.path.join(os.path.dirname(manifest_file), path)
+
+
+def read_input_manifest(manifest_file) -> Iterator[str]:
+    """
+    Read a list of input files from a manifest file, in the same format
+    as :func:`read_manifest`. Output file names are ignored.
+    """
+    for line_no, row in _manifest_rows(manifest_file):
+        input_file = row.get('input')
+        if not input_file:
+            raise ValueError(
+                f'{manifest_file}, line {line_no}: no input file specified.'
+            )
+        yield _manifest_path(manifest_file, input_file)
+
+
+def read_manifest(manifest_file, output_dir=None,
+                  suffix=DEFAULT_OUTPUT_SUFFIX) -> Iterator[BatchJob]:
+    """
+    Read batch jobs from a manifest file.
+
+    Files with a ``.jsonl`` or ``.json`` extension are read as JSON lines,
+    one object per line. Anything else is treated as a CSV file with a
+    header row.
+    In both cases, the ``input`` key is mandatory. The ``output`` key is
+    optional; when it's missing (or empty), the output file name is derived
+    from the input file name using ``output_dir`` and ``suffix``.
+    Relative paths in the manifest are resolved relative to the directory
+    containing the manifest.
+    A :class:`ValueError` is raised if a job would overwrite its own input.
+    """
+    for line_no, row in _manifest_rows(manifest_file):
+        input_file = row.get('input')
+        if not input_file:
+            raise ValueError(
+                f'{manifest_file}, line {line_no}: no input file specified.'
+            )
+        input_file = _manifest_path(manifest_file, input_file)
+        output_file = row.get('output')
+        if output_file:
+            output_file = _manifest_path(manifest_file, output_file)
+        else:
+            output_file = default_output_name(input_file, output_dir, suffix)
+        yield _check_job(
+            BatchJob(input_file=input_file, output_file=output_file),
+            f'{manifest_file}, line {line_no}'
+        )
+
+
+def inputs_from_glob(patterns: Iterable[str]) -> Iterator[str]:
+    """
+    List all files matching one or more glob patterns, without duplicates.
+    """
+    seen = set()
+    for pattern in patterns:
+        for input_file in sorted(glob.glob(pattern, recursive=True)):
+            if input_file in seen or not os.path.isfile(input_file):
+                continue
+            seen.add(input_file)
+            yield input_file
+
+
+def jobs_from_glob(patterns: Iterable[str], output_dir=None,
+                   suffix=DEFAULT_OUTPUT_SUFFIX) -> Iterator[BatchJob]:
+    """
+    Create batch jobs for all files matching one or more glob patterns.
+    Output file names are derived from input file names using ``output_dir``
+    and ``suffix``.
+    A :class:`ValueError` is raised if a job would overwrite its own input.
+    """
+    for input_file in inputs_from_glob(patterns):
+        job = BatchJob(
+            input_file=input_file,
+            output_file=default_output_name(input_file, output_dir, suffix)
+        )
+        yield _check_job(job, input_file)
+
+
+# per-process state for batch workers
+_worker_signer: Optional[BatchSigner] = None
+_worker_existing_only = False
+
+
+def _init_worker(key_spec: KeyMaterialSpec,
+                 signature_meta: PdfSignatureMetadata,
+                 validation_context_kwargs, existing_fields_only):
+    global _worker_signer, _worker_existing_only
+    signer = key_spec.load()
+    if validation_context_kwargs is not None:
+        signature_meta = replace(
+            signature_meta,
+            validation_context=CachingValidationContext(
+                **validation_context_kwargs
+            )
+        )
+    _worker_signer = BatchSigner(signature_meta, signer)
+    _worker_existing_only = existing_fields_only
+
+
+def _sign_to_file(pdf_out, output_file):
+    # Sign straight from disk to disk, so large files never have to be
+    # held in memory. The output is written to a temporary file first, and
+    # only moved into place once signing succeeded, so a failure never
+    # clobbers an existing file.
+    tmp_file = os.path.join(
+        os.path.dirname(os.path.abspath(output_file)),
+        f'.{os.path.basename(output_file)}.{secrets.token_hex(8)}.tmp'
+    )
+    # unlike mkstemp(), this respects the umask
+    flags = os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    fd = os.open(tmp_file, flags, 0o666)
+    try:
+        with os.fdopen(fd, 'w+b') as outfile:
+            # revocation info and document timestamps are appended to
+            # outfile as well
+            _worker_signer.sign_pdf(
+                pdf_out, existing_fields_only=_worker_existing_only,
+                output=outfile
+            )
+        os.replace(tmp_file, output_file)
+    except Exception:
+        # don't leave half-written files lying around
+        try:
+            os.unlink(tmp_file)
+        except OSError:  # pragma: nocover
+            pass
+        raise
+
+
+def _sign_one(job: BatchJob) -> BatchJobResult:
+    start = time.perf_counter()
+    try:
+        _check_job(job, job.input_file)
+        with open(job.input_file, 'rb') as infile:
+            pdf_out = IncrementalPdfFileWriter(infile)
+            _sign_to_file(pdf_out, job.output_file)
+    except Exception as e:
+        logger.debug(f'Failed to sign {job.input_file}.', exc_info=e)
+        return BatchJobResult(
+            input_file=job.input_file, output_file=job.output_file, ok=False,
+            elapsed=time.perf_counter() - start, error=str(e) or repr(e)
+        )
+    return BatchJobResult(
+        input_file=job.input_file, output_file=job.output_file, ok=True,
+        elapsed=time.perf_counter() - start
+    )
+
+
+def sign_files(jobs: Iterable[BatchJob], key_spec: KeyMaterialSpec,
+               signature_meta: PdfSignatureMetadata,
+               validation_context_kwargs=None, existing_fields_only=False,
+               max_workers=1, chunksize=1) -> Iterator[BatchJobResult]:
+    """
+    Sign a number of files.
+
+    :param jobs:
+        The files to sign.
+    :param key_spec:
+        Key material to load in each worker.
+    :param signature_meta:
+        Signature settings. Since validation contexts can't be shared between
+        processes, the ``validation_context`` attribute should be left unset.
+        Use ``validation_context_kwargs`` instead.
+    :param validation_context_kwargs:
+        Keyword arguments to build a
+        :class:`~pdfstamp.sign.revinfo.CachingValidationContext` in each
+        worker. Pass a ``revinfo_cache`` to share revocation info between
+        workers.
+    :param existing_fields_only:
+        Never create signature fields.
+    :param max_workers:
+        Number of worker processes. If ``1``, everything happens in the
+        current process.
+    :param chunksize:
+        Number of jobs to hand to a worker at once.
+    :return:
+        An iterator over the results, in the same order as the jobs.
+    """
+    if signature_meta.validation_context is not None and max_workers > 1:
+        raise ValueError(
+            'Pass validation_context_kwargs instead of a validation context '
+            'when signing with several workers.'
+        )
+    initargs = (
+        key_spec, signature_meta, validation_context_kwargs,
+        existing_fields_only
+    )
+    if max_workers <= 1:
+        _init_worker(*initargs)
+        yield from map(_sign_one, jobs)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=_init_worker,
+                             initargs=initargs) as executor:
+        yield from executor.map(_sign_one, jobs, chunksize=chunksize)
+
+
+@dataclass(frozen=True)
+class ValidationJobResult:
+    """
+    Outcome of validating a single document.
+    The per-signature results are stored as JSON-serialisable dictionaries,
+    so they're cheap to ship between processes.
+    """
+
+    input_file: str
+    ok: bool
+    elapsed: float
+    signatures: Tuple[dict, ...] = ()
+    error: Optional[str] = None
+
+    @property
+    def status(self):
+        if not self.ok:
+            return 'error'
+        elif not self.signatures:
+            return 'unsigned'
+        elif all(sig['status'] == 'VALID' for sig in self.signatures):
+            return 'valid'
+        return 'invalid'
+
+    def as_json_dict(self):
+        result = {
+            'input': self.input_file, 'status': self.status,
+            'elapsed': round(self.elapsed, 6),
+            'signatures': list(self.signatures),
+        }
+        if self.error is not None:
+            result['error'] = self.error
+        return result
+
+
+def _field_result_json(result: FieldValidationResult):
+    if result.error is not None:
+        # same terminology as 'pdfstamp sign list'
+        if isinstance(result.error, SignatureValidationError):
+            status_str = 'INVALID'
+        elif isinstance(result.error, (PdfReadError, ValueError)):
+            status_str = 'MALFORMED'
+        else:
+            # not a problem with the signature; fail the whole job
+            raise result.error
+        return {
+            'field': result.field_name, 'status': status_str,
+            'error': str(result.error) or repr(result.error)
+        }
+    status = result.status
+    sig_json = {
+        'field': result.field_name,
+        'status': 'VALID' if status.bottom_line else 'INVALID',
+        'summary': status.summary(),
+        'coverage': status.coverage.name,
+        'modification_level': status.modification_level.name,
+        'intact': status.intact, 'valid': status.valid,
+        'trusted': status.trusted, 'docmdp_ok': status.docmdp_ok,
+        'seed_value_ok': status.seed_value_ok,
+    }
+    if status.signed_dt is not None:
+        sig_json['signed_dt'] = status.signed_dt.isoformat()
+    return sig_json
+
+
+# per-process state for validation workers
+_worker_path_cache: Optional[ValidationPathCache] = None
+_worker_verifier: Optional[SignatureVerifier] = None
+_worker_validation_type: Optional[RevocationInfoValidationType] = None
+_worker_validation_context_kwargs = None
+_worker_force_revinfo = False
+_worker_result_store: Optional[ValidationResultStore] = None
+
+
+def _init_validation_worker(validation_context_kwargs,
+                            validation_type, force_revinfo, result_store):
+    global _worker_validation_type, \
+        _worker_validation_context_kwargs, _worker_force_revinfo, \
+        _worker_path_cache, _worker_verifier, _worker_result_store
+    validation_context_kwargs = dict(validation_context_kwargs or {})
+    _worker_path_cache = ValidationPathCache()
+    # the same signers and TSAs tend to show up over and over again, so
+    #  don't throw away their public keys
+    _worker_verifier = SignatureVerifier()
+    # parse the trust roots once, rather than for every document
+    for key in ('trust_roots', 'extra_trust_roots', 'other_certs'):
+        certs = validation_context_kwargs.get(key)
+        if certs is not None:
+            validation_context_kwargs[key] = [
+                _load_cert(cert) for cert in certs
+            ]
+    # LTV validation builds its validation contexts from the revocation info
+    # embedded in each document, so there's nothing to cache
+    if validation_type is not None:
+        validation_context_kwargs.pop('revinfo_cache', None)
+    _worker_validation_type = validation_type
+    _worker_validation_context_kwargs = validation_context_kwargs
+    _worker_force_revinfo = force_revinfo
+    _worker_result_store = result_store
+
+
+def _load_cert(cert) -> x509.Certificate:
+    if isinstance(cert, x509.Certificate):
+        return cert
+    if pem.detect(cert):
+        _, _, cert = pem.unarmor(cert)
+    return x509.Certificate.load(cert)
+
+
+def _validate_one(input_file) -> ValidationJobResult:
+    start = time.perf_counter()
+    # Every document gets a validation context of its own: the certificates
+    # embedded in one document shouldn't help validate another, and
+    # certvalidator keeps track of everything it ever fetched or checked.
+    # The trust roots and the revocation info cache are shared.
+    validation_context = None
+    if _worker_validation_type is None:
+        validation_context = CachingValidationContext(
+            **_worker_validation_context_kwargs
+        )
+    try:
+        with open(input_file, 'rb') as infile:
+            validator = DocumentValidator(
+                PdfFileReader(infile),
+                signer_validation_context=validation_context,
+                path_cache=_worker_path_cache, verifier=_worker_verifier,
+                result_store=_worker_result_store
+            )
+            report = validator.validate_all(
+                validation_type=_worker_validation_type,
+                validation_context_kwargs=_worker_validation_context_kwargs,
+                force_revinfo=_worker_force_revinfo
+            )
+            signatures = tuple(
+                _field_result_json(result) for result in report.results
+            )
+    except Exception as e:
+        logger.debug(f'Failed to validate {input_file}.', exc_info=e)
+        return ValidationJobResult(
+            input_file=input_file, ok=False,
+            elapsed=time.perf_counter() - start, error=str(e) or repr(e)
+        )
+    return ValidationJobResult(
+        input_file=input_file, ok=True, elapsed=time.perf_counter() - start,
+        signatures=signatures
+    )
+
+
+def validate_many(input_files: Iterable[str], validation_context_kwargs=None,
+                  validation_type: RevocationInfoValidationType = None,
+                  force_revinfo=False, max_workers=1, chunksize=1,
+                  result_store: ValidationResultStore = None) \
+        -> Iterator[ValidationJobResult]:
+    """
+    Validate all signatures in a number of files.
+
+    :param input_files:
+        The files to validate.
+    :param validation_context_kwargs:
+        Keyword arguments to build a
+        :class:`~pdfstamp.sign.revinfo.CachingValidationContext` for every
+        document. Pass a ``revinfo_cache`` to share revocation info between
+        documents (and workers).
+        For LTV validation, these are passed to
+        :meth:`.DocumentValidator.validate_all` instead.
+    :param validation_type:
+        If not ``None``, validate signatures as LTV signatures using
+        the given type of embedded revocation info.
+    :param force_revinfo:
+        Require revocation info for all certificates in LTV validation.
+    :param max_workers:
+        Number of worker processes. If ``1``, everything happens in the
+        current process.
+    :param chunksize:
+        Number of files to hand to a worker at once.
+    :param result_store:
+        Persistent store for validation results, shared by all workers.
+        See :class:`~pdfstamp.sign.cache.ValidationResultStore`.
+    :return:
+        An iterator over the results, in the same order as the input files.
+    """
+    initargs = (
+        validation_context_kwargs, validation_type, force_revinfo,
+        result_store
+    )
+    if max_workers <= 1:
+        _init_validation_worker(*initargs)
+        yield from map(_validate_one, input_files)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=_init_validation_worker,
+                             initargs=initargs) as executor:
+        yield from executor.map(
+            _validate_one, input_files, chunksize=chunksize
+        )
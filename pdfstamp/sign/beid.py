@@ -41,18 +41,9 @@ def open_beid_session(lib_location, slot_no=None):
 class BEIDSigner(sign_pkcs11.PKCS11Signer):
 
     def _load_ca_chain(self) -> Set[x509.Certificate]:
-
-        q = self.pkcs11_session.get_objects({
-            Attribute.LABEL: 'CA',
-            Attribute.CLASS: ObjectClass.CERTIFICATE
-        })
-        cert_obj, = list(q)
-        intermediate_ca = keys.parse_certificate(cert_obj[Attribute.VALUE])
-
-        q = self.pkcs11_session.get_objects({
-            Attribute.LABEL: 'Root',
-            Attribute.CLASS: ObjectClass.CERTIFICATE
-        })
-        cert_obj, = list(q)
-        root_ca = keys.parse_certificate(cert_obj[Attribute.VALUE])
+        with self.session_pool.lease() as pooled:
+            cert_obj = pooled.find_object('CA', ObjectClass.CERTIFICATE)
+            intermediate_ca = keys.parse_certificate(cert_obj[Attribute.VALUE])
+            cert_obj = pooled.find_object('Root', ObjectClass.CERTIFICATE)
+            root_ca = keys.parse_certificate(cert_obj[Attribute.VALUE])
         return {intermediate_ca, root_ca}
@@ -0,0 +1,409 @@
+"""
+On-disk cache for data about timestamping authorities that is expensive to
+obtain, but rarely changes: the size of the timestamp tokens a TSA produces,
+the TSA's certificates, and validation paths for those certificates.
+
+This allows short-lived processes (e.g. CLI invocations) to skip the dummy
+timestamp request used to collect that information.
+
+This module also provides :class:`.ValidationResultStore`, which persists
+signature validation results between runs, so archived documents can be
+re-validated without redoing work for signatures and revisions that were
+validated before.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import pytz
+from asn1crypto import x509
+from certvalidator.path import ValidationPath
+
+__all__ = [
+    'TSACacheEntry', 'TSACache', 'default_cache_dir', 'path_from_certs',
+    'write_json_atomically', 'DEFAULT_TSA_CACHE_TTL',
+    'SignatureResultEntry', 'ValidationResultStore', 'DEFAULT_RESULT_TTL',
+]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TSA_CACHE_TTL = timedelta(days=1)
+DEFAULT_RESULT_TTL = timedelta(days=1)
+
+# bump this when changing the on-disk format
+CACHE_FORMAT_VERSION = 1
+
+
+def default_cache_dir(name='tsa'):
+    """
+    Return the default location for one of pdfstamp's caches (the TSA cache
+    by default), following the XDG base directory conventions.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache'
+    )
+    return os.path.join(base, 'pdfstamp', name)
+
+
+def write_json_atomically(directory, fname, json_dict):
+    """
+    Write a JSON file to a directory (creating it if necessary). The data is
+    written to a temporary file first, so concurrent readers never see a
+    partially written file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(json_dict, f)
+        os.replace(tmp_name, fname)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def _now():
+    return datetime.now(tz=pytz.utc)
+
+
+def _cert_to_json(cert: x509.Certificate):
+    return base64.b64encode(cert.dump()).decode('ascii')
+
+
+def _cert_from_json(data) -> x509.Certificate:
+    return x509.Certificate.load(base64.b64decode(data))
+
+
+def path_from_certs(certs: List[x509.Certificate]) -> ValidationPath:
+    """
+    Rebuild a validation path from a list of certificates, trust root first.
+    """
+    *issuers, leaf = certs
+    path = ValidationPath(leaf)
+    for cert in reversed(issuers):
+        path.prepend(cert)
+    return path
+
+
+@dataclass
+class TSACacheEntry:
+    """
+    Cached data about a TSA: the size of the largest timestamp token seen,
+    the TSA's signing certificates, other certificates embedded into its
+    responses, and validation paths for the signing certificates (each listed
+    trust root first).
+    """
+
+    token_size: int
+    certs: List[x509.Certificate] = field(default_factory=list)
+    other_certs: List[x509.Certificate] = field(default_factory=list)
+    paths: List[List[x509.Certificate]] = field(default_factory=list)
+    created: datetime = field(default_factory=_now)
+    expires: Optional[datetime] = None
+
+    def compute_expiry(self, ttl: timedelta):
+        """
+        Set the expiry time of this entry to the earliest of its creation time
+        plus the TTL, and the end of the validity period of the certificates
+        it contains.
+        """
+        candidates = [self.created + ttl]
+        candidates.extend(cert.not_valid_after for cert in self.certs)
+        candidates.extend(cert.not_valid_after for cert in self.other_certs)
+        for path in self.paths:
+            candidates.extend(cert.not_valid_after for cert in path)
+        self.expires = min(candidates)
+
+    @property
+    def expired(self):
+        return self.expires is not None and _now() >= self.expires
+
+    def validation_paths(self):
+        return [path_from_certs(certs) for certs in self.paths]
+
+    def as_json_dict(self):
+        return {
+            'version': CACHE_FORMAT_VERSION,
+            'token_size': self.token_size,
+            'certs': [_cert_to_json(c) for c in self.certs],
+            'other_certs': [_cert_to_json(c) for c in self.other_certs],
+            'paths': [[_cert_to_json(c) for c in p] for p in self.paths],
+            'created': self.created.isoformat(),
+            'expires': None if self.expires is None
+            else self.expires.isoformat(),
+        }
+
+    @classmethod
+    def from_json_dict(cls, json_dict) -> 'TSACacheEntry':
+        if json_dict.get('version') != CACHE_FORMAT_VERSION:
+            raise ValueError('Unsupported cache entry format')
+        try:
+            expires = json_dict['expires']
+            return cls(
+                token_size=int(json_dict['token_size']),
+                certs=[_cert_from_json(c) for c in json_dict['certs']],
+                other_certs=[
+                    _cert_from_json(c) for c in json_dict['other_certs']
+                ],
+                paths=[
+                    [_cert_from_json(c) for c in p] for p in json_dict['paths']
+                ],
+                created=datetime.fromisoformat(json_dict['created']),
+                expires=None if expires is None
+                else datetime.fromisoformat(expires)
+            )
+        except (KeyError, TypeError) as e:
+            raise ValueError('Malformed cache entry') from e
+
+
+class TSACache:
+    """
+    Directory-backed cache of :class:`.TSACacheEntry` objects, keyed by TSA
+    URL and digest algorithm. Every entry is stored in a separate JSON file.
+
+    Unreadable, malformed or expired entries are treated as missing.
+    Errors writing to the cache are logged, but otherwise ignored.
+
+    :param directory: The directory to store the cache in.
+    :param ttl: Maximal lifetime of cache entries.
+    """
+
+    def __init__(self, directory=None, ttl: timedelta = DEFAULT_TSA_CACHE_TTL):
+        self.directory = directory or default_cache_dir()
+        self.ttl = ttl
+
+    def _entry_file(self, url, md_algorithm):
+        key = ('%s\n%s' % (url, md_algorithm.lower())).encode('utf-8')
+        fname = hashlib.sha256(key).hexdigest() + '.json'
+        return os.path.join(self.directory, fname)
+
+    def get(self, url, md_algorithm) -> Optional[TSACacheEntry]:
+        entry_file = self._entry_file(url, md_algorithm)
+        try:
+            with open(entry_file, 'r', encoding='utf-8') as f:
+                entry = TSACacheEntry.from_json_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (IOError, ValueError) as e:
+            logger.debug(f'Ignoring unreadable cache entry {entry_file}: {e}')
+            return None
+        if entry.expired:
+            return None
+        return entry
+
+    def put(self, url, md_algorithm, entry: TSACacheEntry):
+        entry.compute_expiry(self.ttl)
+        entry_file = self._entry_file(url, md_algorithm)
+        try:
+            write_json_atomically(
+                self.directory, entry_file, entry.as_json_dict()
+            )
+        except IOError as e:
+            logger.warning(f'Failed to write TSA cache entry: {e}')
+
+    def invalidate(self, url, md_algorithm):
+        try:
+            os.unlink(self._entry_file(url, md_algorithm))
+        except FileNotFoundError:
+            pass
+
+
+@dataclass
+class SignatureResultEntry:
+    """
+    Stored outcome of validating a CMS signature against a particular trust
+    configuration: the integrity and trust verdicts, and the validation path
+    of the signer's certificate (trust root first), if there is one.
+
+    The entry applies to validation at ``moment``, and to later validation
+    times up to ``expires``.
+    """
+
+    intact: bool
+    valid: bool
+    trusted: bool
+    revoked: bool
+    usage_ok: bool
+    path: List[x509.Certificate] = field(default_factory=list)
+    moment: datetime = field(default_factory=_now)
+    expires: Optional[datetime] = None
+
+    def compute_expiry(self, ttl: timedelta):
+        """
+        Set the expiry time of this entry to the earliest of the validation
+        time plus the TTL, and the end of the validity period of the
+        certificates in the validation path.
+        """
+        candidates = [self.moment + ttl]
+        candidates.extend(cert.not_valid_after for cert in self.path)
+        self.expires = min(candidates)
+
+    def usable_at(self, moment: datetime):
+        if moment == self.moment:
+            return True
+        return self.expires is not None and self.moment <= moment < self.expires
+
+    def validation_path(self) -> Optional[ValidationPath]:
+        return path_from_certs(self.path) if self.path else None
+
+    def as_json_dict(self):
+        return {
+            'version': CACHE_FORMAT_VERSION,
+            'intact': self.intact,
+            'valid': self.valid,
+            'trusted': self.trusted,
+            'revoked': self.revoked,
+            'usage_ok': self.usage_ok,
+            'path': [_cert_to_json(c) for c in self.path],
+            'moment': self.moment.isoformat(),
+            'expires': None if self.expires is None
+            else self.expires.isoformat(),
+        }
+
+    @classmethod
+    def from_json_dict(cls, json_dict) -> 'SignatureResultEntry':
+        if json_dict.get('version') != CACHE_FORMAT_VERSION:
+            raise ValueError('Unsupported cache entry format')
+        try:
+            expires = json_dict['expires']
+            return cls(
+                intact=bool(json_dict['intact']),
+                valid=bool(json_dict['valid']),
+                trusted=bool(json_dict['trusted']),
+                revoked=bool(json_dict['revoked']),
+                usage_ok=bool(json_dict['usage_ok']),
+                path=[_cert_from_json(c) for c in json_dict['path']],
+                moment=datetime.fromisoformat(json_dict['moment']),
+                expires=None if expires is None
+                else datetime.fromisoformat(expires)
+            )
+        except (KeyError, TypeError) as e:
+            raise ValueError('Malformed cache entry') from e
+
+
+class ValidationResultStore:
+    """
+    Directory-backed store of validation results, for documents that are
+    validated over and over again (e.g. archived documents that are
+    re-validated periodically, or PAdES-LTA documents that acquire a new
+    revision at every renewal).
+
+    Two kinds of results are stored:
+
+    * the outcome of validating a CMS signature (see
+      :class:`.SignatureResultEntry`), keyed by the signature, the digest of
+      the data it covers and the trust configuration (see
+      :func:`~pdfstamp.sign.general.trust_fingerprint`);
+    * the outcome of comparing two revisions of a document, keyed by the
+      position of both revisions and a digest of the file up to the end of
+      the later one.
+
+    The keys are computed by the validation code, this class only deals with
+    storage. Every entry is stored in a separate JSON file. Unreadable,
+    malformed or inapplicable entries are treated as missing, and errors
+    writing to the store are logged, but otherwise ignored.
+
+    :param directory: The directory to store results in.
+    :param ttl:
+        Maximal time for which signature validation results are reused for
+        later validation times (revision comparisons don't expire).
+    :param include_fetched:
+        Also store the outcome of validating signatures with validation
+        contexts that fetch revocation info. Those results are reused for up
+        to ``ttl`` without checking for revocation again, so this is off by
+        default.
+    """
+
+    def __init__(self, directory=None, ttl: timedelta = DEFAULT_RESULT_TTL,
+                 include_fetched=False):
+        self.directory = directory or default_cache_dir('results')
+        self.ttl = ttl
+        self.include_fetched = include_fetched
+
+    def _entry_file(self, kind, key: bytes):
+        digest = hashlib.sha256(kind.encode('ascii') + b'\n' + key)
+        return os.path.join(self.directory, digest.hexdigest() + '.json')
+
+    def _read(self, kind, key):
+        entry_file = self._entry_file(kind, key)
+        try:
+            with open(entry_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (IOError, ValueError) as e:
+            logger.debug(f'Ignoring unreadable result entry {entry_file}: {e}')
+            return None
+
+    def _write(self, kind, key, json_dict):
+        try:
+            write_json_atomically(
+                self.directory, self._entry_file(kind, key), json_dict
+            )
+        except IOError as e:
+            logger.warning(f'Failed to write validation result: {e}')
+
+    def get_signature_result(self, key: bytes, moment: datetime) \
+            -> Optional[SignatureResultEntry]:
+        """
+        Look up a signature validation result that applies at the given
+        validation time.
+        """
+        json_dict = self._read('signature', key)
+        if json_dict is None:
+            return None
+        try:
+            entry = SignatureResultEntry.from_json_dict(json_dict)
+        except ValueError as e:
+            logger.debug(f'Ignoring malformed result entry: {e}')
+            return None
+        return entry if entry.usable_at(moment) else None
+
+    def put_signature_result(self, key: bytes, entry: SignatureResultEntry):
+        entry.compute_expiry(self.ttl)
+        self._write('signature', key, entry.as_json_dict())
+
+    def get_revision_diff(self, key: bytes) -> Optional[dict]:
+        """
+        Look up the outcome of comparing two revisions. This is a dictionary
+        with either a ``level`` entry (the name of the modification level) or
+        a ``suspicious`` entry (the reason why the changes are suspicious).
+        """
+        json_dict = self._read('diff', key)
+        if json_dict is None \
+                or json_dict.get('version') != CACHE_FORMAT_VERSION:
+            return None
+        if 'level' in json_dict or 'suspicious' in json_dict:
+            return json_dict
+        return None
+
+    def put_revision_diff(self, key: bytes, level: str = None,
+                          suspicious: str = None):
+        json_dict = {'version': CACHE_FORMAT_VERSION}
+        if suspicious is not None:
+            json_dict['suspicious'] = suspicious
+        else:
+            json_dict['level'] = level
+        self._write('diff', key, json_dict)
+
+    def invalidate(self):
+        """
+        Remove all entries from the store.
+        """
+        try:
+            fnames = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for fname in fnames:
+            if fname.endswith('.json'):
+                try:
+                    os.unlink(os.path.join(self.directory, fname))
+                except FileNotFoundError:  # pragma: nocover
+                    pass
@@ -1,7 +1,10 @@
 import itertools
 import logging
+import threading
+import weakref
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import List, ClassVar, Set
+from typing import List, ClassVar, Set, Optional
 
 
 import hashlib
@@ -12,14 +15,15 @@ from certvalidator.path import ValidationPath
 
 from certvalidator import (
     CertificateValidator, InvalidCertificateError,
-    PathBuildingError,
+    PathBuildingError, ValidationContext,
 )
 from certvalidator.errors import RevokedError, PathValidationError
 
 __all__ = [
     'SignatureStatus', 'simple_cms_attribute', 'find_cms_attribute',
     'as_signing_certificate', 'CertificateStore', 'SimpleCertificateStore',
-    'WriteThroughCertificateStore', 'SigningError', 'UnacceptableSignerError'
+    'WriteThroughCertificateStore', 'SigningError', 'UnacceptableSignerError',
+    'ValidationPathCache', 'trust_fingerprint', 'path_is_available',
 ]
 
 
@@ -189,6 +193,158 @@ class ForkedCertificateStore(SimpleCertificateStore):
         return itertools.chain(iter(self.backend), iter(self.certs.values()))
 
 
+DEFAULT_PATH_CACHE_SIZE = 1024
+
+
+def trust_fingerprint(validation_context: ValidationContext) -> bytes:
+    """
+    Compute a digest of everything in a validation context that could
+    influence the outcome of path validation, except for the validation time
+    and the intermediate certificates that happen to be known: trust roots,
+    embedded revocation info, revocation settings, weak hash algorithms and
+    whitelisted certificates.
+
+    Since the intermediate certificates are left out, paths built earlier
+    should only be reused if :func:`path_is_available` says so.
+    """
+    # noinspection PyProtectedMember
+    registry = validation_context.certificate_registry
+    # noinspection PyProtectedMember
+    trust_roots = b''.join(sorted(registry._ca_lookup))
+    # noinspection PyProtectedMember
+    revinfo = itertools.chain(
+        validation_context._ocsps, validation_context._crls
+    )
+    embedded_revinfo = b''.join(sorted(
+        hashlib.sha256(item.dump()).digest() for item in revinfo
+    ))
+    # noinspection PyProtectedMember
+    settings = '\n'.join([
+        validation_context._revocation_mode,
+        str(validation_context._allow_fetching),
+        ','.join(sorted(validation_context.weak_hash_algos)),
+        ','.join(sorted(validation_context._whitelisted_certs)),
+    ]).encode('utf-8')
+    md = hashlib.sha256()
+    for part in (trust_roots, embedded_revinfo, settings):
+        md.update(hashlib.sha256(part).digest())
+    return md.digest()
+
+
+def path_is_available(path: ValidationPath,
+                      validation_context: ValidationContext,
+                      supplied_certs=()) -> bool:
+    """
+    Check whether a validation context could build a path that was built
+    (and validated) earlier: the path has to start at one of its trust roots,
+    and all intermediate certificates on the path have to be supplied along
+    with the end entity certificate, or be known to the validation context.
+    """
+    certs = list(path)
+    registry = validation_context.certificate_registry
+    if not certs or not registry.is_ca(certs[0]):
+        return False
+    supplied = {cert.sha256 for cert in supplied_certs}
+    for cert in certs[1:-1]:
+        if cert.sha256 in supplied:
+            continue
+        known = registry.retrieve_by_name(cert.subject)
+        if not any(c.sha256 == cert.sha256 for c in known):
+            return False
+    return True
+
+
+class ValidationPathCache:
+    """
+    Bounded (LRU) cache of validated certificate paths, which can be shared
+    between validation contexts.
+
+    A path is only reused when the leaf certificate, the trust roots, the
+    validation time and everything else that could influence the outcome of
+    path validation (revocation settings, embedded revocation info, weak
+    hash algorithms, whitelisted certificates) are the same. Since a
+    validation context validates everything at a fixed moment, a batch of
+    documents validated against the same context doesn't need to rebuild
+    and revalidate the same paths over and over again.
+
+    Only successfully validated paths are cached, and they're only reused if
+    their intermediate certificates are available (see
+    :func:`path_is_available`). Key usage is always checked again.
+
+    :param max_size:
+        Maximal number of paths to keep.
+    """
+
+    def __init__(self, max_size=DEFAULT_PATH_CACHE_SIZE):
+        self.max_size = max_size
+        self._paths = OrderedDict()
+        self._context_keys = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def _context_key(self, validation_context: ValidationContext):
+        try:
+            return self._context_keys[validation_context]
+        except KeyError:
+            pass
+        key = (trust_fingerprint(validation_context), validation_context.moment)
+        self._context_keys[validation_context] = key
+        return key
+
+    def _key(self, cert: x509.Certificate,
+             validation_context: ValidationContext):
+        if validation_context is None or validation_context.moment is None:
+            return None
+        return cert.sha256, self._context_key(validation_context)
+
+    def get(self, cert: x509.Certificate,
+            validation_context: ValidationContext) -> Optional[ValidationPath]:
+        key = self._key(cert, validation_context)
+        if key is None:
+            return None
+        with self._lock:
+            try:
+                path = self._paths[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._paths.move_to_end(key)
+            self.hits += 1
+            return path
+
+    def put(self, cert: x509.Certificate,
+            validation_context: ValidationContext, path: ValidationPath):
+        key = self._key(cert, validation_context)
+        if key is None:
+            return
+        with self._lock:
+            self._paths[key] = path
+            self._paths.move_to_end(key)
+            while len(self._paths) > self.max_size:
+                self._paths.popitem(last=False)
+
+    def validator(self, cert: x509.Certificate, intermediate_certs=None,
+                  validation_context: ValidationContext = None) \
+            -> CertificateValidator:
+        """
+        Create a certificate validator, which skips path building and path
+        validation if a suitable validated path is in the cache.
+        """
+        validator = CertificateValidator(
+            cert, intermediate_certs=intermediate_certs,
+            validation_context=validation_context
+        )
+        path = self.get(cert, validation_context)
+        if path is not None and path_is_available(
+                path, validation_context, intermediate_certs or ()):
+            # noinspection PyProtectedMember
+            validator._path = path
+        return validator
+
+    def __len__(self):
+        return len(self._paths)
+
+
 class SigningError(ValueError):
     pass
 
@@ -1,4 +1,11 @@
-from typing import Set
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Set, Callable, List, Optional
 
 from asn1crypto import x509
 from oscrypto import keys as oskeys
@@ -6,19 +13,252 @@ from oscrypto import keys as oskeys
 from pdfstamp.sign.general import CertificateStore, SimpleCertificateStore
 from pdfstamp.sign.signers import Signer
 
-__all__ = ['PKCS11Signer']
+__all__ = ['PKCS11Signer', 'PKCS11SessionPool', 'PooledSession']
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSession:
+    """
+    PKCS#11 session leased from a :class:`.PKCS11SessionPool`, together with
+    a cache of the object handles looked up in it.
+    Object handles are tied to the session they were retrieved from, so the
+    cache can't be shared between sessions.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._objects = {}
+
+    def find_object(self, label, object_class):
+        """
+        Look up the unique object with the given label and class in the
+        token, or return the cached handle if it was looked up before.
+        """
+        key = (label, object_class)
+        try:
+            return self._objects[key]
+        except KeyError:
+            pass
+        from pkcs11 import Attribute
+        q = self.session.get_objects({
+            Attribute.LABEL: label, Attribute.CLASS: object_class
+        })
+        # need to run through the full iterator to make sure the operation
+        # terminates
+        result, = list(q)
+        self._objects[key] = result
+        return result
+
+
+class PKCS11SessionPool:
+    """
+    Pool of PKCS#11 sessions. A PKCS#11 session can only be used by one
+    thread at a time, but most tokens support several sessions being
+    active at once, so spreading signing operations over several sessions
+    allows them to run in parallel.
+
+    Sessions are opened lazily using ``open_session``, until there are
+    ``size`` of them.
+    If a session turns out to be closed or invalid while it's leased out,
+    it's thrown away, and a new one will be opened when needed.
+
+    :param open_session:
+        Callable that opens a new session. If ``None``, the pool can only use
+        the sessions passed in through ``sessions``.
+    :param size:
+        Maximal number of sessions in the pool.
+    :param sessions:
+        Sessions that are already open, to add to the pool.
+    :param timeout:
+        Maximal time (in seconds) to wait for a session to become available.
+        If ``None``, wait indefinitely.
+    :param close_session:
+        Callable that closes a session. If ``None``, the session's
+        ``close()`` method is called.
+    """
+
+    def __init__(self, open_session: Callable = None, size=4,
+                 sessions: Optional[List] = None, timeout=None,
+                 close_session: Callable = None):
+        sessions = list(sessions or ())
+        if open_session is None and not sessions:
+            raise ValueError(
+                'Either a session factory or a list of sessions is required.'
+            )
+        self.open_session = open_session
+        self.close_session = close_session
+        self.size = max(size, len(sessions)) if open_session is not None \
+            else len(sessions)
+        self.timeout = timeout
+        # idle sessions, most recently used last
+        self._idle = [PooledSession(session) for session in sessions]
+        self._open_count = len(sessions)
+        # protects the state above, and signals changes to it
+        self._cond = threading.Condition()
+        self._closed = False
+
+    @classmethod
+    def for_token(cls, token, size=4, user_pin=None, **kwargs) \
+            -> 'PKCS11SessionPool':
+        """
+        Create a pool of sessions on a single token.
+
+        :param token:
+            A ``pkcs11.Token``.
+        :param size:
+            Number of sessions.
+        :param user_pin:
+            User PIN. Since the login state is shared between all sessions,
+            a session only logs in if none of the other sessions in the pool
+            are open. The token drops the login state when the last session
+            is closed, so the next session to be opened logs in again.
+        """
+        # sessions that were passed in are assumed to be logged in
+        live_sessions = len(kwargs.get('sessions') or ())
+        login_lock = threading.Lock()
+
+        def _open():
+            nonlocal live_sessions
+            with login_lock:
+                if user_pin is not None and not live_sessions:
+                    session = token.open(user_pin=user_pin)
+                else:
+                    session = token.open()
+                live_sessions += 1
+                return session
+
+        def _close(session):
+            nonlocal live_sessions
+            # hold the lock, so that no session gets opened without logging
+            # in just as the last logged-in session goes away
+            with login_lock:
+                live_sessions -= 1
+                session.close()
+
+        return cls(_open, size=size, close_session=_close, **kwargs)
+
+    def _acquire(self) -> PooledSession:
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise ValueError('Session pool is closed.')
+                if self._idle:
+                    return self._idle.pop()
+                if self._open_count < self.size:
+                    self._open_count += 1
+                    break
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            'Timed out waiting for a PKCS#11 session.'
+                        )
+                # woken up when a session is returned or discarded, or
+                # when the pool is closed
+                self._cond.wait(remaining)
+        # open the session without holding the lock
+        try:
+            return PooledSession(self.open_session())
+        except BaseException:
+            with self._cond:
+                self._open_count -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, pooled: PooledSession):
+        with self._cond:
+            closed = self._closed
+            if not closed:
+                self._idle.append(pooled)
+                self._cond.notify()
+        if closed:
+            self._close(pooled)
+
+    def _close(self, pooled: PooledSession):
+        if self.close_session is not None:
+            self.close_session(pooled.session)
+        else:
+            pooled.session.close()
+
+    def _discard(self, pooled: PooledSession):
+        with self._cond:
+            self._open_count -= 1
+            # someone waiting for a session can open a new one now
+            self._cond.notify()
+        try:
+            self._close(pooled)
+        except Exception:  # pragma: nocover
+            pass
+
+    @contextmanager
+    def lease(self):
+        """
+        Lease a session for the duration of a ``with`` block.
+        """
+        from pkcs11.exceptions import (
+            SessionClosed, SessionHandleInvalid, DeviceRemoved,
+        )
+        pooled = self._acquire()
+        try:
+            yield pooled
+        except (SessionClosed, SessionHandleInvalid, DeviceRemoved):
+            if self.open_session is not None:
+                logger.warning('Discarding broken PKCS#11 session.')
+                self._discard(pooled)
+                pooled = None
+            raise
+        finally:
+            if pooled is not None:
+                self._release(pooled)
+
+    def close(self):
+        """
+        Close all idle sessions. Sessions that are leased out are closed
+        when they're returned. Threads waiting for a session get
+        a :class:`ValueError`.
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for pooled in idle:
+            self._close(pooled)
 
 
 class PKCS11Signer(Signer):
+    """
+    Signer backed by a PKCS#11 token.
+
+    :param pkcs11_session:
+        The session to use. Either this or ``session_pool`` is required.
+    :param session_pool:
+        Pool of sessions to use, to allow several signing operations to run
+        at the same time.
+    """
 
     # TODO is this actually the correct one to use?
     pkcs7_signature_mechanism: str = 'rsassa_pkcs1v15'
 
-    def __init__(self, pkcs11_session, cert_label, ca_chain=None,
-                 key_label=None, timestamper=None):
+    def __init__(self, pkcs11_session=None, cert_label=None, ca_chain=None,
+                 key_label=None, timestamper=None,
+                 session_pool: PKCS11SessionPool = None):
+        if cert_label is None:
+            raise ValueError('A certificate label is required.')
+        if session_pool is None:
+            if pkcs11_session is None:
+                raise ValueError(
+                    'Either a session or a session pool is required.'
+                )
+            session_pool = PKCS11SessionPool(sessions=[pkcs11_session])
         self.cert_label = cert_label
         self.key_label = key_label or cert_label
         self.pkcs11_session = pkcs11_session
+        self.session_pool = session_pool
         self.timestamper = timestamper
         if ca_chain is not None:
             cs = SimpleCertificateStore()
@@ -26,8 +266,10 @@ class PKCS11Signer(Signer):
             self._cert_registry: CertificateStore = cs
         else:
             self._cert_registry = None
-        self._signing_cert = self._key_handle = None
+        self._signing_cert = None
         self._loaded = False
+        self._load_lock = threading.Lock()
+        self._token_executor = None
 
     @property
     def cert_registry(self):
@@ -45,22 +287,84 @@ class PKCS11Signer(Signer):
         self._load_objects()
         return self._signing_cert
 
-    def sign_raw(self, data: bytes, digest_algorithm: str, dry_run=False):
-        if dry_run:
-            # allocate 4096 bits for the fake signature
-            return b'0' * 512
-
-        self._load_objects()
-        from pkcs11 import Mechanism, SignMixin
-        kh: SignMixin = self._key_handle
-        mech = {
+    @staticmethod
+    def _mechanism(digest_algorithm):
+        from pkcs11 import Mechanism
+        return {
             'sha1': Mechanism.SHA1_RSA_PKCS,
             'sha256': Mechanism.SHA256_RSA_PKCS,
             'sha384': Mechanism.SHA384_RSA_PKCS,
             'sha512': Mechanism.SHA512_RSA_PKCS,
         }[digest_algorithm.lower()]
+
+    def _sign_with(self, pooled: PooledSession, data, mech):
+        from pkcs11 import ObjectClass, SignMixin
+        kh: SignMixin = pooled.find_object(
+            self.key_label, ObjectClass.PRIVATE_KEY
+        )
         return kh.sign(data, mechanism=mech)
 
+    def sign_raw(self, data: bytes, digest_algorithm: str, dry_run=False):
+        if dry_run:
+            # allocate 4096 bits for the fake signature
+            return b'0' * 512
+
+        self._load_objects()
+        mech = self._mechanism(digest_algorithm)
+        with self.session_pool.lease() as pooled:
+            return self._sign_with(pooled, data, mech)
+
+    def sign_raw_many(self, items, digest_algorithm: str) -> List[bytes]:
+        """
+        Sign several payloads, spreading the work over all sessions in
+        the pool. Every worker holds on to its session until all payloads
+        have been signed, so the token can process several signing
+        operations back to back.
+        """
+        items = list(items)
+        if not items:
+            return []
+        self._load_objects()
+        mech = self._mechanism(digest_algorithm)
+        results: List[Optional[bytes]] = [None] * len(items)
+        todo = queue.SimpleQueue()
+        for ix in range(len(items)):
+            todo.put(ix)
+
+        def _worker():
+            with self.session_pool.lease() as pooled:
+                while True:
+                    try:
+                        ix = todo.get_nowait()
+                    except queue.Empty:
+                        return
+                    results[ix] = self._sign_with(pooled, items[ix], mech)
+
+        worker_count = min(self.session_pool.size, len(items))
+        if worker_count <= 1:
+            _worker()
+            return results
+        with ThreadPoolExecutor(max_workers=worker_count) as executor:
+            futures = [executor.submit(_worker) for _ in range(worker_count)]
+            for fut in futures:
+                fut.result()
+        return results
+
+    async def async_sign_raw(self, data: bytes, digest_algorithm: str,
+                             dry_run=False):
+        if dry_run:
+            return self.sign_raw(data, digest_algorithm, dry_run=True)
+        # PKCS#11 sessions can't be used from several threads at once,
+        # so we never use more threads than there are sessions
+        if self._token_executor is None:
+            self._token_executor = ThreadPoolExecutor(
+                max_workers=self.session_pool.size
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._token_executor, self.sign_raw, data, digest_algorithm
+        )
+
     def _load_ca_chain(self) -> Set[x509.Certificate]:
         return set()
 
@@ -70,21 +374,16 @@ class PKCS11Signer(Signer):
 
         from pkcs11 import Attribute, ObjectClass
 
-        q = self.pkcs11_session.get_objects({
-            Attribute.LABEL: self.cert_label,
-            Attribute.CLASS: ObjectClass.CERTIFICATE
-        })
-        # need to run through the full iterator to make sure the operation
-        # terminates
-        cert_obj, = list(q)
-        self._signing_cert = oskeys.parse_certificate(cert_obj[Attribute.VALUE])
-
-        self._load_ca_chain()
-
-        q = self.pkcs11_session.get_objects({
-            Attribute.LABEL: self.key_label,
-            Attribute.CLASS: ObjectClass.PRIVATE_KEY
-        })
-        self._key_handle, = list(q)
-
-        self._loaded = True
+        with self._load_lock:
+            if self._loaded:
+                return
+            with self.session_pool.lease() as pooled:
+                cert_obj = pooled.find_object(
+                    self.cert_label, ObjectClass.CERTIFICATE
+                )
+                self._signing_cert = oskeys.parse_certificate(
+                    cert_obj[Attribute.VALUE]
+                )
+                # make sure the key is there
+                pooled.find_object(self.key_label, ObjectClass.PRIVATE_KEY)
+            self._loaded = True
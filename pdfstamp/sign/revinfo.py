@@ -0,0 +1,634 @@
+"""
+Fetching and caching of revocation information (OCSP responses and CRLs).
+
+:class:`.CachingValidationContext` is a drop-in replacement for
+:class:`~certvalidator.ValidationContext` that consults a
+:class:`.RevocationInfoCache` before going to the network. Cache entries are
+stored on disk and remain valid until the ``nextUpdate`` time of the OCSP
+response or CRL, so signing many documents with the same key (or validating
+many signatures from the same signer) only requires a single OCSP request per
+validity period, regardless of how many processes are involved.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import socket
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
+from urllib.error import URLError
+
+import pytz
+import requests
+from asn1crypto import algos, core, crl, ocsp, pem, x509
+from certvalidator import ValidationContext, crl_client
+from certvalidator.errors import (
+    OCSPValidationError, PathBuildingError, SoftFailError,
+)
+
+from pdfstamp.sign.cache import default_cache_dir, write_json_atomically
+
+__all__ = [
+    'RevocationInfoCache', 'CachingValidationContext', 'fetch_ocsp',
+    'fetch_crl', 'OCSPFetcher', 'CRLFetcher', 'FETCH_ERRORS',
+]
+
+logger = logging.getLogger(__name__)
+
+OCSPFetcher = Callable[[x509.Certificate, x509.Certificate],
+                       ocsp.OCSPResponse]
+CRLFetcher = Callable[[str], crl.CertificateList]
+
+# Errors that indicate that revocation info could not be retrieved.
+# These are subject to the soft-fail policy of the validation context.
+FETCH_ERRORS = (requests.RequestException, URLError, socket.error)
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_PREFETCH_WORKERS = 8
+USER_AGENT = 'pdfstamp'
+
+# bump this when changing the on-disk format
+CACHE_FORMAT_VERSION = 1
+
+
+def _now():
+    return datetime.now(tz=pytz.utc)
+
+
+def fetch_ocsp(cert: x509.Certificate, issuer: x509.Certificate,
+               hash_algo='sha1', nonce=True, user_agent=None,
+               timeout=DEFAULT_TIMEOUT, session=None) -> ocsp.OCSPResponse:
+    """
+    Query the OCSP responders listed in a certificate, and return the first
+    response received.
+
+    :param cert: The certificate to query the status of.
+    :param issuer: The issuer of ``cert``.
+    :param hash_algo: Hash algorithm to use in the certificate ID.
+    :param nonce: Include a nonce in the request.
+    :param user_agent: User agent to send.
+    :param timeout: Timeout for every request (in seconds).
+    :param session: The ``requests`` session to use.
+    :return: An OCSP response.
+    """
+    if not cert.ocsp_urls:
+        raise ValueError('Certificate does not list any OCSP responders.')
+    cert_id = ocsp.CertId({
+        'hash_algorithm': algos.DigestAlgorithm({'algorithm': hash_algo}),
+        'issuer_name_hash': getattr(cert.issuer, hash_algo),
+        'issuer_key_hash': getattr(issuer.public_key, hash_algo),
+        'serial_number': cert.serial_number,
+    })
+    tbs_request = ocsp.TBSRequest({
+        'request_list': ocsp.Requests([ocsp.Request({'req_cert': cert_id})]),
+    })
+    if nonce:
+        tbs_request['request_extensions'] = ocsp.TBSRequestExtensions([
+            ocsp.TBSRequestExtension({
+                'extn_id': 'nonce', 'critical': False,
+                'extn_value': core.OctetString(
+                    core.OctetString(os.urandom(16)).dump()
+                )
+            })
+        ])
+    ocsp_request = ocsp.OCSPRequest({'tbs_request': tbs_request})
+    headers = {
+        'Accept': 'application/ocsp-response',
+        'Content-Type': 'application/ocsp-request',
+        'User-Agent': user_agent or USER_AGENT,
+    }
+
+    session = session or requests
+    last_e = None
+    for url in cert.ocsp_urls:
+        try:
+            response = session.post(
+                url, data=ocsp_request.dump(), headers=headers,
+                timeout=timeout
+            )
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.debug(f'OCSP request to {url} failed: {e}')
+            last_e = e
+            continue
+        ocsp_response = ocsp.OCSPResponse.load(response.content)
+        request_nonce = ocsp_request.nonce_value
+        response_nonce = ocsp_response.nonce_value
+        if request_nonce and response_nonce \
+                and request_nonce.native != response_nonce.native:
+            raise OCSPValidationError(
+                'Unable to verify OCSP response since the request and '
+                'response nonces do not match'
+            )
+        return ocsp_response
+    raise last_e
+
+
+def fetch_crl(url, user_agent=None, timeout=DEFAULT_TIMEOUT,
+              session=None) -> crl.CertificateList:
+    """
+    Download a CRL (in DER or PEM format).
+
+    :param url: The URL of the CRL.
+    :param user_agent: User agent to send.
+    :param timeout: Timeout for the request (in seconds).
+    :param session: The ``requests`` session to use.
+    :return: A CRL.
+    """
+    session = session or requests
+    response = session.get(
+        url, headers={
+            'Accept': 'application/pkix-crl',
+            'User-Agent': user_agent or USER_AGENT,
+        }, timeout=timeout
+    )
+    response.raise_for_status()
+    data = response.content
+    if pem.detect(data):
+        _, _, data = pem.unarmor(data)
+    return crl.CertificateList.load(data)
+
+
+def _ocsp_single_response(response: ocsp.OCSPResponse,
+                          cert: x509.Certificate):
+    # Find the part of the response that's about cert, if any.
+    # Anything that's not a definitive answer about cert isn't worth caching.
+    if response['response_status'].native != 'successful':
+        return None
+    response_bytes = response['response_bytes']
+    if response_bytes['response_type'].native != 'basic_ocsp_response':
+        return None
+    basic_response = response_bytes['response'].parsed
+    for single in basic_response['tbs_response_data']['responses']:
+        if single['cert_id']['serial_number'].native == cert.serial_number:
+            return single
+    return None
+
+
+class RevocationInfoCache:
+    """
+    Directory-backed cache of OCSP responses and CRLs.
+    OCSP responses are keyed by issuer and serial number of the certificate
+    they apply to, and CRLs by their distribution point URL.
+    Every entry is stored in a separate JSON file.
+
+    Entries expire at the ``nextUpdate`` time specified in the OCSP response
+    or CRL. Responses and CRLs without ``nextUpdate`` are only cached if
+    ``max_age`` is set. Unreadable, malformed or expired entries are treated as
+    missing. Errors writing to the cache are logged, but otherwise ignored.
+
+    :param directory: The directory to store the cache in.
+    :param max_age:
+        If not ``None``, entries are not kept for longer than this,
+        even if their ``nextUpdate`` time is further in the future.
+    """
+
+    def __init__(self, directory=None, max_age: timedelta = None):
+        self.directory = directory or default_cache_dir('revinfo')
+        self.max_age = max_age
+
+    def _entry_file(self, kind, key: bytes):
+        digest = hashlib.sha256(kind.encode('ascii') + b'\n' + key)
+        return os.path.join(self.directory, digest.hexdigest() + '.json')
+
+    def _get(self, kind, key) -> Optional[Tuple[bytes, List[bytes]]]:
+        # returns the data, and the certificates stored alongside it
+        entry_file = self._entry_file(kind, key)
+        try:
+            with open(entry_file, 'r', encoding='utf-8') as f:
+                json_dict = json.load(f)
+            if json_dict.get('version') != CACHE_FORMAT_VERSION:
+                raise ValueError('Unsupported cache entry format')
+            expires = datetime.fromisoformat(json_dict['expires'])
+            data = base64.b64decode(json_dict['data'])
+            certs = [base64.b64decode(c) for c in json_dict.get('certs', ())]
+        except FileNotFoundError:
+            return None
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            logger.debug(f'Ignoring unreadable cache entry {entry_file}: {e}')
+            return None
+        if _now() >= expires:
+            return None
+        return data, certs
+
+    def _put(self, kind, key, data: bytes, next_update: Optional[datetime],
+             certs: Iterable[x509.Certificate] = ()):
+        now = _now()
+        candidates = []
+        if next_update is not None:
+            candidates.append(next_update)
+        if self.max_age is not None:
+            candidates.append(now + self.max_age)
+        if not candidates:
+            return
+        expires = min(candidates)
+        if expires <= now:
+            return
+        json_dict = {
+            'version': CACHE_FORMAT_VERSION,
+            'data': base64.b64encode(data).decode('ascii'),
+            'fetched': now.isoformat(),
+            'expires': expires.isoformat(),
+            'certs': [
+                base64.b64encode(cert.dump()).decode('ascii') for cert in certs
+            ],
+        }
+        try:
+            write_json_atomically(
+                self.directory, self._entry_file(kind, key), json_dict
+            )
+        except IOError as e:
+            logger.warning(f'Failed to write revocation cache entry: {e}')
+
+    def get_ocsp(self, cert: x509.Certificate) -> Optional[ocsp.OCSPResponse]:
+        """
+        Look up a cached OCSP response for a certificate.
+        """
+        entry = self._get('ocsp', cert.issuer_serial)
+        if entry is None:
+            return None
+        data, _ = entry
+        try:
+            response = ocsp.OCSPResponse.load(data)
+            if _ocsp_single_response(response, cert) is None:
+                return None
+        except ValueError:
+            return None
+        return response
+
+    def put_ocsp(self, cert: x509.Certificate, response: ocsp.OCSPResponse):
+        """
+        Cache an OCSP response for a certificate.
+        """
+        single = _ocsp_single_response(response, cert)
+        if single is not None:
+            self._put(
+                'ocsp', cert.issuer_serial, response.dump(),
+                single['next_update'].native
+            )
+
+    def get_crl(self, url) -> Optional[crl.CertificateList]:
+        """
+        Look up a cached CRL by distribution point URL.
+        """
+        entry = self.get_crl_with_certs(url)
+        return None if entry is None else entry[0]
+
+    def get_crl_with_certs(self, url) \
+            -> Optional[Tuple[crl.CertificateList, List[x509.Certificate]]]:
+        """
+        Look up a cached CRL by distribution point URL, along with the
+        certificates of its issuer that were cached with it.
+        """
+        entry = self._get('crl', url.encode('utf-8'))
+        if entry is None:
+            return None
+        data, cert_data = entry
+        try:
+            certificate_list = crl.CertificateList.load(data)
+            certificate_list.native
+            certs = [x509.Certificate.load(c) for c in cert_data]
+            for cert in certs:
+                cert.native
+        except ValueError:
+            return None
+        return certificate_list, certs
+
+    def put_crl(self, url, certificate_list: crl.CertificateList,
+                certs: Iterable[x509.Certificate] = ()):
+        """
+        Cache a CRL under its distribution point URL.
+
+        :param certs:
+            Certificates of the CRL's issuer (see
+            :func:`certvalidator.crl_client.fetch_certs`), to cache along
+            with the CRL.
+        """
+        next_update = certificate_list['tbs_cert_list']['next_update'].native
+        self._put(
+            'crl', url.encode('utf-8'), certificate_list.dump(), next_update,
+            certs=certs
+        )
+
+    def invalidate(self):
+        """
+        Remove all entries from the cache.
+        """
+        try:
+            fnames = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for fname in fnames:
+            if fname.endswith('.json'):
+                try:
+                    os.unlink(os.path.join(self.directory, fname))
+                except FileNotFoundError:  # pragma: nocover
+                    pass
+
+
+@dataclass(frozen=True)
+class _PrefetchJobs:
+    # OCSP responses to fetch: issuer_serial -> (cert, issuer)
+    ocsp_jobs: dict
+    # CRL distribution points by issuer_serial of the certificate
+    crl_jobs: dict
+    # CRL distribution points that haven't been fetched yet
+    crl_urls: set
+
+
+class CachingValidationContext(ValidationContext):
+    """
+    Validation context that fetches revocation info through pluggable
+    fetchers, and caches the results in a :class:`.RevocationInfoCache`.
+
+    All other arguments are passed to
+    :class:`~certvalidator.ValidationContext`. Revocation info is only fetched
+    if ``allow_fetching`` is ``True``.
+
+    :param revinfo_cache:
+        Cache to look up revocation info in before fetching it, and to put
+        freshly fetched revocation info in. If ``None``, nothing is cached
+        beyond the lifetime of this validation context.
+    :param ocsp_fetcher:
+        Callable taking a certificate and its issuer, and returning an OCSP
+        response. Defaults to :func:`fetch_ocsp`, called with
+        ``ocsp_fetch_params``.
+    :param crl_fetcher:
+        Callable taking a distribution point URL, and returning a CRL.
+        Defaults to :func:`fetch_crl`, called with ``crl_fetch_params``.
+    """
+
+    def __init__(self, *args, revinfo_cache: RevocationInfoCache = None,
+                 ocsp_fetcher: OCSPFetcher = None,
+                 crl_fetcher: CRLFetcher = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.revinfo_cache = revinfo_cache
+        self.ocsp_fetcher = ocsp_fetcher or self._default_ocsp_fetcher
+        self.crl_fetcher = crl_fetcher or self._default_crl_fetcher
+        # CRLs by distribution point, since many certificates share one
+        self._fetched_crls_by_url = {}
+        # fetch errors encountered while prefetching, by issuer_serial
+        self._prefetch_errors = {}
+
+    def _default_ocsp_fetcher(self, cert, issuer):
+        return fetch_ocsp(cert, issuer, **self._ocsp_fetch_params)
+
+    def _default_crl_fetcher(self, url):
+        params = dict(self._crl_fetch_params)
+        params.pop('use_deltas', None)
+        return fetch_crl(url, **params)
+
+    def _fetch_failed(self, e):
+        # same policy as ValidationContext
+        if self._revocation_mode == 'soft-fail':
+            self._soft_fail_exceptions.append(e)
+            raise SoftFailError()
+        raise e
+
+    def _crl_urls(self, cert):
+        sources = list(cert.crl_distribution_points)
+        if self._crl_fetch_params.get('use_deltas', True):
+            sources.extend(cert.delta_crl_distribution_points)
+        return [dp.url for dp in sources if dp.url is not None]
+
+    # The _load_* methods don't touch the state of the validation context,
+    # so they can run concurrently.
+
+    def _load_ocsp(self, cert, issuer) -> ocsp.OCSPResponse:
+        cache = self.revinfo_cache
+        response = None if cache is None else cache.get_ocsp(cert)
+        if response is not None:
+            logger.debug('Using cached OCSP response.')
+            return response
+        response = self.ocsp_fetcher(cert, issuer)
+        if cache is not None:
+            cache.put_ocsp(cert, response)
+        return response
+
+    def _load_crl(self, url):
+        # returns the CRL and the certificates it points to
+        cache = self.revinfo_cache
+        entry = None if cache is None else cache.get_crl_with_certs(url)
+        if entry is not None:
+            logger.debug(f'Using cached CRL for {url}.')
+            return entry
+        certificate_list = self.crl_fetcher(url)
+        # CRLs can point to the certificate of their issuer
+        try:
+            certs = crl_client.fetch_certs(
+                certificate_list,
+                user_agent=self._crl_fetch_params.get('user_agent'),
+                timeout=self._crl_fetch_params.get('timeout', DEFAULT_TIMEOUT)
+            )
+        except FETCH_ERRORS:
+            certs = []
+        if cache is not None:
+            cache.put_crl(url, certificate_list, certs)
+        return certificate_list, certs
+
+    def _register_crl(self, url, certificate_list, certs):
+        self._fetched_crls_by_url[url] = certificate_list
+        for cert in certs:
+            if self.certificate_registry.add_other_cert(cert):
+                self._revocation_certs[cert.issuer_serial] = cert
+
+    def _register_ocsp(self, key, response):
+        self._fetched_ocsps[key] = [response]
+        # Responses can contain certificates that are useful in validating
+        # the response itself.
+        self._extract_ocsp_certs(response)
+
+    def retrieve_ocsps(self, cert, issuer):
+        if not self._allow_fetching:
+            return self._ocsps
+
+        key = cert.issuer_serial
+        try:
+            return self._fetched_ocsps[key]
+        except KeyError:
+            pass
+
+        try:
+            e = self._prefetch_errors.pop(('ocsp', key))
+        except KeyError:
+            try:
+                response = self._load_ocsp(cert, issuer)
+            except FETCH_ERRORS as e:
+                self._fetched_ocsps[key] = []
+                self._fetch_failed(e)
+            self._register_ocsp(key, response)
+        else:
+            self._fetched_ocsps[key] = []
+            self._fetch_failed(e)
+        return self._fetched_ocsps[key]
+
+    def retrieve_crls(self, cert):
+        if not self._allow_fetching:
+            return self._crls
+
+        key = cert.issuer_serial
+        try:
+            return self._fetched_crls[key]
+        except KeyError:
+            pass
+
+        crls = []
+        try:
+            e = self._prefetch_errors.pop(('crl', key))
+        except KeyError:
+            pass
+        else:
+            self._fetched_crls[key] = []
+            self._fetch_failed(e)
+        try:
+            for url in self._crl_urls(cert):
+                try:
+                    certificate_list = self._fetched_crls_by_url[url]
+                except KeyError:
+                    certificate_list, certs = self._load_crl(url)
+                    self._register_crl(url, certificate_list, certs)
+                crls.append(certificate_list)
+        except FETCH_ERRORS as e:
+            self._fetched_crls[key] = []
+            self._fetch_failed(e)
+        self._fetched_crls[key] = crls
+        return crls
+
+    def prefetch(self, certs: Iterable[x509.Certificate],
+                 intermediate_certs: Iterable[x509.Certificate] = (),
+                 max_workers=DEFAULT_PREFETCH_WORKERS):
+        """
+        Fetch revocation info for every certificate on the candidate
+        validation paths of ``certs`` at the same time, so validating those
+        paths afterwards doesn't have to wait for the fetches one by one.
+
+        As during validation, CRLs are only fetched for certificates without
+        an OCSP responder.
+        Failures are remembered, and reported when the revocation info is
+        requested during validation, subject to the usual soft-fail policy.
+
+        :param certs:
+            End-entity certificates to fetch revocation info for.
+        :param intermediate_certs:
+            Intermediate certificates to build paths with.
+        :param max_workers:
+            Maximal number of concurrent fetches.
+        """
+        jobs = self._plan_prefetch(certs, intermediate_certs)
+        if jobs is None:
+            return
+        results = self._run_prefetch(jobs, max_workers=max_workers)
+        self._register_prefetched(jobs, results)
+
+    # prefetch() is split up into three steps, so that callers that share
+    # a validation context between threads only need to hold a lock while
+    # the state of the validation context is read or updated, and not
+    # while the actual fetching happens (see PdfSigner.async_sign_pdf).
+
+    def _plan_prefetch(self, certs, intermediate_certs=()) \
+            -> Optional['_PrefetchJobs']:
+        if not self._allow_fetching:
+            return None
+        registry = self.certificate_registry
+        for cert in intermediate_certs:
+            registry.add_other_cert(cert)
+
+        ocsp_jobs = {}
+        crl_jobs = {}
+        crl_urls = set()
+        for cert in certs:
+            try:
+                paths = registry.build_paths(cert)
+            except PathBuildingError:
+                continue
+            for path in paths:
+                issuer = None
+                # trust root first
+                for path_cert in path:
+                    if issuer is None:
+                        # no revocation checks for trust roots
+                        issuer = path_cert
+                        continue
+                    key = path_cert.issuer_serial
+                    if path_cert.ocsp_urls:
+                        if key not in self._fetched_ocsps:
+                            ocsp_jobs.setdefault(key, (path_cert, issuer))
+                    elif key not in self._fetched_crls:
+                        urls = self._crl_urls(path_cert)
+                        crl_jobs.setdefault(key, urls)
+                        crl_urls.update(
+                            url for url in urls
+                            if url not in self._fetched_crls_by_url
+                        )
+                    issuer = path_cert
+        if not ocsp_jobs and not crl_urls:
+            return None
+
+        # asn1crypto parses lazily, which isn't thread-safe
+        for path_cert, issuer in ocsp_jobs.values():
+            path_cert.native
+            issuer.native
+        return _PrefetchJobs(
+            ocsp_jobs=ocsp_jobs, crl_jobs=crl_jobs, crl_urls=crl_urls
+        )
+
+    def _run_prefetch(self, jobs: '_PrefetchJobs',
+                      max_workers=DEFAULT_PREFETCH_WORKERS):
+        # only calls the _load_* methods, so this doesn't touch the state
+        # of the validation context
+
+        def _outcome(future):
+            try:
+                return future.result(), None
+            except Exception as e:
+                return None, e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            ocsp_futures = {
+                key: executor.submit(self._load_ocsp, path_cert, issuer)
+                for key, (path_cert, issuer) in jobs.ocsp_jobs.items()
+            }
+            crl_futures = {
+                url: executor.submit(self._load_crl, url)
+                for url in jobs.crl_urls
+            }
+            ocsp_results = {
+                key: _outcome(future) for key, future in ocsp_futures.items()
+            }
+            crl_results = {
+                url: _outcome(future) for url, future in crl_futures.items()
+            }
+        return ocsp_results, crl_results
+
+    def _register_prefetched(self, jobs: '_PrefetchJobs', results):
+        ocsp_results, crl_results = results
+        crl_errors = {}
+        for key, (response, e) in ocsp_results.items():
+            try:
+                if e is not None:
+                    raise e
+                self._register_ocsp(key, response)
+            except FETCH_ERRORS as e:
+                self._prefetch_errors[('ocsp', key)] = e
+            except Exception as e:
+                # let validation deal with it
+                logger.debug(f'Failed to prefetch OCSP response: {e}')
+        for url, (crl_and_certs, e) in crl_results.items():
+            try:
+                if e is not None:
+                    raise e
+                self._register_crl(url, *crl_and_certs)
+            except FETCH_ERRORS as e:
+                crl_errors[url] = e
+            except Exception as e:
+                logger.debug(f'Failed to prefetch CRL from {url}: {e}')
+
+        for key, urls in jobs.crl_jobs.items():
+            for url in urls:
+                if url in crl_errors:
+                    self._prefetch_errors[('crl', key)] = crl_errors[url]
+                    break
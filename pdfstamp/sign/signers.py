@@ -1,11 +1,17 @@
+import asyncio
 import binascii
+import functools
 import hashlib
 import logging
+import os
+import threading
+import time
 import uuid
+import weakref
 from dataclasses import dataclass
 from datetime import datetime
 from io import BytesIO
-from typing import Optional
+from typing import Optional, IO, Iterable, Iterator, Tuple, Any, List
 
 import tzlocal
 from asn1crypto import x509, cms, core, algos, pem, keys, pdf as asn1_pdf
@@ -23,6 +29,7 @@ from pdfstamp.sign.fields import (
     SigSeedValueSpec, SigSeedValFlags, SigSeedSubFilter, MDPPerm, FieldMDPSpec,
 )
 from pdfstamp.sign.timestamps import TimeStamper
+from pdfstamp.sign.revinfo import CachingValidationContext
 from pdfstamp.sign.general import (
     simple_cms_attribute, CertificateStore,
     SimpleCertificateStore, SigningError,
@@ -30,7 +37,9 @@ from pdfstamp.sign.general import (
 from pdfstamp.stamp import TextStampStyle, TextStamp
 
 __all__ = ['Signer', 'SimpleSigner', 'PdfSigner', 'sign_pdf',
-           'SignatureObject']
+           'SignatureObject', 'BatchSigner', 'BatchSigningResult',
+           'PreparedSignature', 'fill_signature_contents',
+           'DEFAULT_SIZE_MARGIN']
 
 
 logger = logging.getLogger(__name__)
@@ -126,47 +135,150 @@ class PdfSignedData(generic.DictionaryObject):
         byte_range = SigByteRangeObject()
         self[pdf_name('/ByteRange')] = self.byte_range = byte_range
 
-    def write_signature(self, writer: IncrementalPdfFileWriter, md_algorithm):
+    def write_placeholder(self, writer: IncrementalPdfFileWriter,
+                          md_algorithm, output=None):
+        """
+        Render the document with placeholder values for the signature
+        contents, fill in the /ByteRange entry and compute the document
+        digest.
+
+        The part of the output copied from the original document is hashed
+        while it's being written, and only the update section is read back
+        from ``output`` afterwards. Hence, when the input and the output are
+        files on disk, memory usage doesn't depend on the size of the
+        document.
+
+        :param writer: The writer containing this signature object.
+        :param md_algorithm: The message digest algorithm to use.
+        :param output:
+            Seekable, readable and writable binary stream to write the
+            document to. It should be empty, unless ``writer`` was obtained
+            through :meth:`.IncrementalPdfFileWriter.chain`, in which case
+            it should be the stream ``writer`` appends to, positioned at the
+            end.
+            If ``None``, a new :class:`io.BytesIO` is used.
+        :return:
+            A tuple containing the output stream, the start and end offsets
+            of the signature placeholder, and the document digest.
+        """
         # Render the PDF to a byte buffer with placeholder values
         # for the signature data
-        output = BytesIO()
-        writer.write(output)
+        if output is None:
+            output = BytesIO()
+        md = getattr(hashlib, md_algorithm)()
+        # the original document precedes everything we add, so it can
+        # be hashed on the fly
+        prefix_len = 0
+        if isinstance(writer, IncrementalPdfFileWriter):
+            prefix_len = writer.original_length()
+        writer.write(_PrefixDigester(output, md, prefix_len))
 
         # retcon time: write the proper values of the /ByteRange entry
         #  in the signature object
         eof = output.tell()
         sig_start, sig_end = self.signature_contents.offsets
+        assert sig_start >= prefix_len
         self.byte_range.fill_offsets(output, sig_start, sig_end, eof)
 
-        # compute the digests
-        output_buffer = output.getbuffer()
-        md = getattr(hashlib, md_algorithm)()
-        # these are memoryviews, so slices should not copy stuff around
-        md.update(output_buffer[:sig_start])
-        md.update(output_buffer[sig_end:])
-        output_buffer.release()
+        # hash the rest
+        _digest_byte_range(output, md, sig_start, sig_end, start=prefix_len)
+        return output, sig_start, sig_end, md.digest()
+
+    def write_signature(self, writer: IncrementalPdfFileWriter, md_algorithm,
+                        output=None):
+        output, sig_start, sig_end, digest = self.write_placeholder(
+            writer, md_algorithm, output=output
+        )
+        signature_cms = yield digest
+        sig_contents = fill_signature_contents(
+            output, sig_start, sig_end, signature_cms
+        )
+        output.seek(0)
+        yield output, sig_contents
 
-        signature_cms = yield md.digest()
 
-        signature_bytes = signature_cms.dump()
-        signature = binascii.hexlify(signature_bytes).upper()
+class _PrefixDigester:
+    # write-through stream wrapper that feeds the first `limit` bytes
+    # written to it to a hash function
 
-        # might as well compute this
-        bytes_reserved = sig_end - sig_start - 2
-        length = len(signature)
-        assert length <= bytes_reserved, (length, bytes_reserved)
+    def __init__(self, stream, md, limit):
+        self.stream = stream
+        self.md = md
+        self.remaining = limit
 
-        # +1 to skip the '<'
-        output.seek(sig_start + 1)
-        # NOTE: the PDF spec is not completely clear on this, but
-        # signature contents are NOT supposed to be encrypted.
-        # Perhaps this falls under the "strings in encrypted containers"
-        # denominator in § 7.6.1?
-        output.write(signature)
+    def write(self, data):
+        if self.remaining > 0:
+            if len(data) > self.remaining:
+                self.md.update(memoryview(data)[:self.remaining])
+                self.remaining = 0
+            else:
+                self.md.update(data)
+                self.remaining -= len(data)
+        return self.stream.write(data)
 
-        output.seek(0)
-        padding = bytes(bytes_reserved // 2 - len(signature_bytes))
-        yield output, signature_bytes + padding
+    def tell(self):
+        return self.stream.tell()
+
+
+def _digest_byte_range(stream, md, sig_start, sig_end, start=0,
+                       chunk_size=65536):
+    # hash stream[start:sig_start] and stream[sig_end:]
+    if isinstance(stream, BytesIO):
+        output_buffer = stream.getbuffer()
+        # these are memoryviews, so slices should not copy stuff around
+        md.update(output_buffer[start:sig_start])
+        md.update(output_buffer[sig_end:])
+        output_buffer.release()
+        return
+
+    def _feed(remaining):
+        while remaining is None or remaining > 0:
+            to_read = chunk_size if remaining is None \
+                else min(chunk_size, remaining)
+            chunk = stream.read(to_read)
+            if not chunk:
+                break
+            md.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+
+    stream.seek(start)
+    _feed(sig_start - start)
+    stream.seek(sig_end)
+    _feed(None)
+
+
+def fill_signature_contents(output, sig_start, sig_end,
+                            signature_cms: cms.ContentInfo):
+    """
+    Write a signature into the placeholder at the given offsets.
+
+    :return:
+        The DER-encoded signature, padded with null bytes to fill the entire
+        placeholder (i.e. the value of /Contents as it will be read back).
+    """
+    signature_bytes = signature_cms.dump()
+    signature = binascii.hexlify(signature_bytes).upper()
+
+    # might as well compute this
+    bytes_reserved = sig_end - sig_start - 2
+    length = len(signature)
+    if length > bytes_reserved:
+        raise SigningError(
+            'The signature requires %d bytes, but only %d bytes were '
+            'reserved.' % (length, bytes_reserved)
+        )
+
+    # +1 to skip the '<'
+    output.seek(sig_start + 1)
+    # NOTE: the PDF spec is not completely clear on this, but
+    # signature contents are NOT supposed to be encrypted.
+    # Perhaps this falls under the "strings in encrypted containers"
+    # denominator in § 7.6.1?
+    output.write(signature)
+
+    padding = bytes(bytes_reserved // 2 - len(signature_bytes))
+    return signature_bytes + padding
 
 
 class SignatureObject(PdfSignedData):
@@ -199,6 +311,11 @@ class DocumentTimestamp(PdfSignedData):
         # PAdES, so we don't set those
 
 
+# upper bound for the number of bytes added to a SignedData structure
+# on top of the timestamp token itself when adding a signature timestamp
+_TS_ATTR_OVERHEAD = 64
+
+
 class Signer:
     signing_cert: x509.Certificate
     cert_registry: CertificateStore
@@ -208,6 +325,90 @@ class Signer:
     def sign_raw(self, data: bytes, digest_algorithm: str, dry_run=False):
         raise NotImplementedError
 
+    def sign_raw_many(self, items, digest_algorithm: str) -> List[bytes]:
+        """
+        Sign several payloads at once. By default, this simply calls
+        :meth:`sign_raw` for every item. Signers that can process several
+        signing operations in parallel should override it.
+
+        :param items:
+            The payloads to sign.
+        :param digest_algorithm:
+            The digest algorithm to use for all of them.
+        :return:
+            A list of signatures, in the same order as the payloads.
+        """
+        return [self.sign_raw(data, digest_algorithm) for data in items]
+
+    def raw_signature_size(self) -> int:
+        """
+        Compute an upper bound for the size (in bytes) of the signatures
+        produced by :meth:`sign_raw`, based on the signer's public key.
+
+        :raises NotImplementedError: if the key type is not supported.
+        """
+        public_key: keys.PublicKeyInfo = self.signing_cert.public_key
+        algorithm = public_key.algorithm
+        if algorithm in ('rsa', 'rsassa_pss'):
+            return (public_key.bit_size + 7) // 8
+        if algorithm == 'ec':
+            int_len = (public_key.bit_size + 7) // 8
+        elif algorithm == 'dsa':
+            q = public_key['algorithm']['parameters']['q'].native
+            int_len = (q.bit_length() + 7) // 8
+        else:
+            raise NotImplementedError(
+                'Cannot estimate signature size for %s keys' % algorithm
+            )
+        # DER-encoded SEQUENCE of two INTEGERs, each of which might
+        # need an extra leading zero byte
+        return 2 * (int_len + 3) + 3
+
+    def estimate_cms_size(self, digest_algorithm: str,
+                          timestamp: datetime = None, revocation_info=None,
+                          use_pades=False) -> int:
+        """
+        Estimate the size of the DER-encoded output of :meth:`sign`,
+        without actually signing anything.
+
+        Everything except the signature value and the signature timestamp
+        token is computed exactly. The former is taken from
+        :meth:`raw_signature_size`, the latter from
+        :meth:`.TimeStamper.token_size_estimate`, which only contacts the
+        timestamping service if it hasn't seen any of its tokens yet.
+
+        :raises NotImplementedError:
+            if the size of the signature can't be determined.
+        """
+        digest_size = getattr(hashlib, digest_algorithm)().digest_size
+        signed_attrs = self.signed_attrs(
+            bytes(digest_size), timestamp, revocation_info=revocation_info,
+            use_pades=use_pades
+        )
+        signature = bytes(self.raw_signature_size())
+        sig_info = self.signer_info(digest_algorithm, signed_attrs, signature)
+        size = len(self._wrap_signer_info(digest_algorithm, sig_info).dump())
+        if self.timestamper is not None:
+            # account for the attribute wrapping the token, and
+            # for the length prefixes of the enclosing structures growing
+            size += self.timestamper.token_size_estimate(digest_algorithm)
+            size += _TS_ATTR_OVERHEAD
+        return size
+
+    async def async_sign_raw(self, data: bytes, digest_algorithm: str,
+                             dry_run=False):
+        """
+        Asynchronous version of :meth:`sign_raw`.
+        By default, this runs :meth:`sign_raw` in the event loop's default
+        executor. Signers backed by an asynchronous API should override it.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(
+                self.sign_raw, data, digest_algorithm, dry_run=dry_run
+            )
+        )
+
     @property
     def subject_name(self):
         name: x509.Name = self.signing_cert.subject
@@ -308,7 +509,17 @@ class Signer:
         signature = self.sign_raw(
             signed_attrs.dump(), digest_algorithm.lower(), dry_run
         )
+        return self.build_cms(
+            digest_algorithm, signed_attrs, signature, dry_run=dry_run
+        )
 
+    def build_cms(self, digest_algorithm: str, signed_attrs, signature,
+                  dry_run=False) -> cms.ContentInfo:
+        """
+        Wrap a raw signature over the signed attributes into a CMS
+        SignedData object, adding a signature timestamp if the signer has
+        a timestamper.
+        """
         sig_info = self.signer_info(digest_algorithm, signed_attrs, signature)
 
         if self.timestamper is not None:
@@ -325,6 +536,42 @@ class Signer:
                 [simple_cms_attribute('signature_time_stamp_token', ts_token)]
             )
 
+        return self._wrap_signer_info(digest_algorithm, sig_info)
+
+    async def async_sign(self, data_digest: bytes, digest_algorithm: str,
+                         timestamp: datetime = None, dry_run=False,
+                         revocation_info=None, use_pades=False) \
+            -> cms.ContentInfo:
+        """
+        Asynchronous version of :meth:`sign`.
+        """
+        signed_attrs = self.signed_attrs(
+            data_digest, timestamp, revocation_info=revocation_info,
+            use_pades=use_pades
+        )
+        signature = await self.async_sign_raw(
+            signed_attrs.dump(), digest_algorithm.lower(), dry_run
+        )
+        sig_info = self.signer_info(digest_algorithm, signed_attrs, signature)
+
+        if self.timestamper is not None:
+            md = getattr(hashlib, digest_algorithm)()
+            md.update(signature)
+            if dry_run:
+                ts_token = await self.timestamper.async_dummy_response(
+                    digest_algorithm
+                )
+            else:
+                ts_token = await self.timestamper.async_timestamp(
+                    md.digest(), digest_algorithm
+                )
+            sig_info['unsigned_attrs'] = cms.CMSAttributes(
+                [simple_cms_attribute('signature_time_stamp_token', ts_token)]
+            )
+
+        return self._wrap_signer_info(digest_algorithm, sig_info)
+
+    def _wrap_signer_info(self, digest_algorithm, sig_info):
         digest_algorithm_obj = algos.DigestAlgorithm(
             {'algorithm': digest_algorithm}
         )
@@ -511,10 +758,10 @@ SIG_DETAILS_DEFAULT_TEMPLATE = (
 
 def sign_pdf(pdf_out: IncrementalPdfFileWriter,
              signature_meta: PdfSignatureMetadata, signer: Signer,
-             existing_fields_only=False, bytes_reserved=None):
+             existing_fields_only=False, bytes_reserved=None, output=None):
     return PdfSigner(signature_meta, signer).sign_pdf(
         pdf_out, existing_fields_only=existing_fields_only,
-        bytes_reserved=bytes_reserved
+        bytes_reserved=bytes_reserved, output=output
     )
 
 
@@ -569,12 +816,103 @@ def _get_or_create_sigfield(field_name, pdf_out, existing_fields_only,
     return field_created, sig_field_ref
 
 
+@dataclass(frozen=True)
+class _SigningContext:
+    # state shared between the phases of PdfSigner.sign_pdf
+    sig_obj: SignatureObject
+    md_algorithm: str
+    timestamp: datetime
+    use_pades: bool
+    revinfo: Optional[cms.CMSAttribute]
+    validation_paths: list
+    ts_validation_paths: Optional[list]
+
+
+@dataclass(frozen=True)
+class PreparedSignature:
+    """
+    Everything needed to finish a signature prepared by
+    :meth:`.PdfSigner.prepare_pdf`, except for the document itself.
+    Use :meth:`as_json_dict` and :meth:`from_json_dict` to persist it.
+    """
+
+    md_algorithm: str
+    document_digest: bytes
+    signed_attrs: bytes
+    sig_start: int
+    sig_end: int
+    use_pades: bool = False
+
+    @property
+    def signed_attrs_digest(self) -> bytes:
+        """
+        Digest of the signed attributes, for signing backends that
+        expect a prehashed message.
+        """
+        return getattr(hashlib, self.md_algorithm)(self.signed_attrs).digest()
+
+    def as_json_dict(self):
+        return {
+            'md_algorithm': self.md_algorithm,
+            'document_digest': self.document_digest.hex(),
+            'signed_attrs': self.signed_attrs.hex(),
+            'sig_start': self.sig_start,
+            'sig_end': self.sig_end,
+            'use_pades': self.use_pades,
+        }
+
+    @classmethod
+    def from_json_dict(cls, json_dict):
+        try:
+            return cls(
+                md_algorithm=json_dict['md_algorithm'],
+                document_digest=bytes.fromhex(json_dict['document_digest']),
+                signed_attrs=bytes.fromhex(json_dict['signed_attrs']),
+                sig_start=int(json_dict['sig_start']),
+                sig_end=int(json_dict['sig_end']),
+                use_pades=bool(json_dict.get('use_pades', False)),
+            )
+        except (KeyError, TypeError) as e:
+            raise ValueError('Malformed prepared signature data') from e
+
+
+# Relative safety margin on top of the estimated size of a signature.
+# External actors such as timestamping servers can't be relied on to
+# always return responses of exactly the same size.
+DEFAULT_SIZE_MARGIN = 0.1
+
+# absolute minimum of bytes to add to the estimate
+MIN_SIZE_SLACK = 64
+
+
+def _reserve_with_margin(estimated_size, margin):
+    # convert the size estimate for the DER-encoded signature
+    # into the number of hex digits to reserve (+ ensure the result is even)
+    slack = max(int(estimated_size * margin), MIN_SIZE_SLACK)
+    return 2 * (estimated_size + slack)
+
+
 class PdfSigner:
+    """
+    Signs PDF files using the settings in a :class:`.PdfSignatureMetadata`
+    object.
+
+    :param signature_meta: The signature settings.
+    :param signer: The signer to use.
+    :param size_margin:
+        Relative safety margin on top of the estimated size of the signature
+        when reserving space for it in the document.
+    """
     _ignore_sv = False
 
-    def __init__(self, signature_meta: PdfSignatureMetadata, signer: Signer):
+    def __init__(self, signature_meta: PdfSignatureMetadata, signer: Signer,
+                 size_margin=DEFAULT_SIZE_MARGIN):
         self.signature_meta = signature_meta
         self.signer = signer
+        self.size_margin = size_margin
+        # serialises access to validation state in async_sign_pdf
+        self._sync_lock = threading.Lock()
+        self._certs_primed = False
 
     def _apply_locking_rules(self, sig_field, sig_obj_ref, md_algorithm,
                              pdf_out):
@@ -772,8 +1110,78 @@ class PdfSigner:
 
         return sv_spec
 
-    def sign_pdf(self, pdf_out: IncrementalPdfFileWriter,
-                 existing_fields_only=False, bytes_reserved=None):
+    def _signer_validation_path(self, validation_context):
+        signer = self.signer
+        # validate cert
+        # (this also keeps track of any validation data automagically)
+        validator = CertificateValidator(
+            signer.signing_cert, intermediate_certs=signer.cert_registry,
+            validation_context=validation_context
+        )
+        # TODO allow customisation of key usage parameters
+        return validator.validate_usage({"non_repudiation"})
+
+    def _prefetch_targets(self):
+        # The TSA's certificates might not be known yet, in which case
+        # they're dealt with when validating the TSA's certificates.
+        signer = self.signer
+        certs = [signer.signing_cert]
+        intermediate_certs = list(signer.cert_registry)
+        timestamper = signer.timestamper
+        if timestamper is not None \
+                and self.signature_meta.embed_validation_info:
+            certs.extend(timestamper.signing_certs)
+            intermediate_certs.extend(timestamper.other_certs)
+        return certs, intermediate_certs
+
+    def _prefetch_revinfo(self, validation_context):
+        # Fetch all revocation info we're going to need at once, instead of
+        # one certificate at a time while validating.
+        if not isinstance(validation_context, CachingValidationContext):
+            return
+        validation_context.prefetch(*self._prefetch_targets())
+
+    def _timestamper_validation_paths(self, md_algorithm, validation_context):
+        if validation_context is None:
+            return None
+        timestamper = self.signer.timestamper
+        # this might hit the TS server, but the response is cached
+        # and it collects the certificates we need to verify the TS response
+        timestamper.collect_certs(md_algorithm)
+        return list(
+            timestamper.validation_paths(validation_context, md_algorithm)
+        )
+
+    # noinspection PyMethodMayBeStatic
+    def _revocation_info(self, validation_context):
+        return Signer.format_revinfo(
+            ocsp_responses=validation_context.ocsps,
+            crls=validation_context.crls
+        )
+
+    def _estimate_bytes_reserved(self, md_algorithm, timestamp, use_pades,
+                                 revinfo):
+        signer = self.signer
+        try:
+            estimate = signer.estimate_cms_size(
+                md_algorithm, timestamp=timestamp, use_pades=use_pades,
+                revocation_info=revinfo
+            )
+        except NotImplementedError:
+            # we don't know how large signatures produced by this key are,
+            # so do a dry run instead
+            test_md = getattr(hashlib, md_algorithm)().digest()
+            test_signature_cms = signer.sign(
+                test_md, md_algorithm,
+                timestamp=timestamp, use_pades=use_pades,
+                dry_run=True, revocation_info=revinfo
+            )
+            estimate = len(test_signature_cms.dump())
+        return _reserve_with_margin(estimate, self.size_margin)
+
+    def _prepare_signature(self, pdf_out: IncrementalPdfFileWriter,
+                           existing_fields_only, bytes_reserved) \
+            -> '_SigningContext':
 
         # TODO if PAdES is requested, set the ESIC extension to the proper value
 
@@ -790,18 +1198,20 @@ class PdfSigner:
         validation_paths = []
         signer_cert_validation_path = None
         if validation_context is not None:
-            # validate cert
-            # (this also keeps track of any validation data automagically)
-            validator = CertificateValidator(
-                signer.signing_cert, intermediate_certs=signer.cert_registry,
-                validation_context=validation_context
-            )
-            # TODO allow customisation of key usage parameters
-            signer_cert_validation_path = validator.validate_usage(
-                {"non_repudiation"}
+            self._prefetch_revinfo(validation_context)
+            signer_cert_validation_path = self._signer_validation_path(
+                validation_context
             )
             validation_paths.append(signer_cert_validation_path)
 
+        if signer.timestamper is not None and bytes_reserved is None:
+            # Measuring the TSA's tokens might require a dry-run request,
+            # which should happen before we touch the document, so a failing
+            # TSA doesn't leave pdf_out half-modified.
+            signer.timestamper.token_size_estimate(
+                signature_meta.md_algorithm or DEFAULT_MD
+            )
+
         field_created, sig_field_ref = _get_or_create_sigfield(
             signature_meta.field_name, pdf_out,
             existing_fields_only, is_timestamp=False
@@ -858,38 +1268,26 @@ class PdfSigner:
             #  undesirable. I should perhaps restructure things a little.
             signer.timestamper = sv_spec.build_timestamper()
 
-        if signer.timestamper is not None:
-            # this might hit the TS server, but the response is cached
-            # and it collects the certificates we need to verify the TS response
-            signer.timestamper.dummy_response(md_algorithm)
-            if validation_context is not None:
-                ts_validation_paths = list(
-                    signer.timestamper.validation_paths(validation_context)
-                )
-                validation_paths += ts_validation_paths
+        # the TSA's certificates only need to be validated if we're going
+        # to embed validation info for them
+        if signer.timestamper is not None \
+                and signature_meta.embed_validation_info:
+            ts_validation_paths = self._timestamper_validation_paths(
+                md_algorithm, validation_context
+            )
+            validation_paths += ts_validation_paths
 
         # do we need adobe-style revocation info?
         if signature_meta.embed_validation_info and not use_pades:
-            revinfo = Signer.format_revinfo(
-                ocsp_responses=validation_context.ocsps,
-                crls=validation_context.crls
-            )
+            revinfo = self._revocation_info(validation_context)
         else:
             # PAdES prescribes another mechanism for embedding revocation info
             revinfo = None
 
         if bytes_reserved is None:
-            test_md = getattr(hashlib, md_algorithm)().digest()
-            test_signature_cms = signer.sign(
-                test_md, md_algorithm,
-                timestamp=timestamp, use_pades=use_pades,
-                dry_run=True, revocation_info=revinfo
+            bytes_reserved = self._estimate_bytes_reserved(
+                md_algorithm, timestamp, use_pades, revinfo
             )
-            test_len = len(test_signature_cms.dump()) * 2
-            # External actors such as timestamping servers can't be relied on to
-            # always return exactly the same response, so we build in a 50%
-            # error margin (+ ensure that bytes_reserved is even)
-            bytes_reserved = test_len + 2 * (test_len // 4)
 
         # we need to add a signature object and a corresponding form field
         # to the PDF file
@@ -916,50 +1314,347 @@ class PdfSigner:
 
         self._apply_locking_rules(sig_field, sig_obj_ref, md_algorithm, pdf_out)
 
-        wr = sig_obj.write_signature(pdf_out, md_algorithm)
+        return _SigningContext(
+            sig_obj=sig_obj, md_algorithm=md_algorithm, timestamp=timestamp,
+            use_pades=use_pades, revinfo=revinfo,
+            validation_paths=validation_paths,
+            ts_validation_paths=ts_validation_paths
+        )
+
+    def _post_sign(self, output, sig_contents, md_algorithm, use_pades,
+                   validation_paths=None, ts_validation_paths=None,
+                   writer: IncrementalPdfFileWriter = None):
+        # If the writer that produced the output is passed in, the DSS and
+        # the document timestamp are added as chained updates, which saves
+        # us from parsing the output again (twice for B-LTA).
+        signature_meta = self.signature_meta
+        signer = self.signer
+        validation_context = signature_meta.validation_context
+        if not (use_pades and signature_meta.embed_validation_info):
+            return output
+
+        if validation_paths is None:
+            # we're finishing a signature prepared earlier, possibly in
+            # another process, so we need to collect the paths again
+            validation_paths = [
+                self._signer_validation_path(validation_context)
+            ]
+            if signer.timestamper is not None:
+                ts_validation_paths = self._timestamper_validation_paths(
+                    md_algorithm, validation_context
+                )
+                validation_paths += ts_validation_paths
+
+        writer = self._add_dss(
+            output, sig_contents, validation_paths, validation_context,
+            writer
+        )
+
+        if signer.timestamper is not None and signature_meta.use_pades_lta:
+            # append an LTV document timestamp to the same stream
+            output = self.timestamp_pdf(
+                writer.chain(output), md_algorithm, validation_context,
+                validation_paths=ts_validation_paths, output=output
+            )
+
+        return output
+
+    # noinspection PyMethodMayBeStatic
+    def _add_dss(self, output, sig_contents, validation_paths,
+                 validation_context, writer=None):
+        from pdfstamp.sign import validation
+        return validation.DocumentSecurityStore.add_dss(
+            output_stream=output, sig_contents=sig_contents,
+            paths=validation_paths, validation_context=validation_context,
+            writer=None if writer is None else writer.chain(output)
+        )
+
+    def sign_pdf(self, pdf_out: IncrementalPdfFileWriter,
+                 existing_fields_only=False, bytes_reserved=None,
+                 output=None):
+        """
+        Sign a PDF file.
+
+        :param pdf_out: The document to sign.
+        :param existing_fields_only:
+            Never create signature fields.
+        :param bytes_reserved:
+            Bytes to reserve for the signature. If ``None``, an estimate is
+            computed.
+        :param output:
+            Empty binary stream (seekable, readable and writable) to write the
+            signed document to, e.g. a file opened in ``w+b`` mode.
+            If ``None``, a new :class:`io.BytesIO` is used.
+            To sign large files without holding them in memory, read the
+            input from a file and pass a file here.
+        :return:
+            The stream containing the signed document. This is ``output``
+            if it was specified; revocation info and document timestamps
+            are appended to it as well.
+        """
+        ctx = self._prepare_signature(
+            pdf_out, existing_fields_only, bytes_reserved
+        )
+        md_algorithm = ctx.md_algorithm
+
+        wr = ctx.sig_obj.write_signature(pdf_out, md_algorithm, output=output)
         true_digest = next(wr)
 
-        signature_cms = signer.sign(
+        signature_cms = self.signer.sign(
             true_digest, md_algorithm,
-            timestamp=timestamp, use_pades=use_pades,
-            revocation_info=revinfo
+            timestamp=ctx.timestamp, use_pades=ctx.use_pades,
+            revocation_info=ctx.revinfo
         )
         output, sig_contents = wr.send(signature_cms)
 
-        if use_pades and signature_meta.embed_validation_info:
-            from pdfstamp.sign import validation
-            validation.DocumentSecurityStore.add_dss(
-                output_stream=output, sig_contents=sig_contents,
-                paths=validation_paths, validation_context=validation_context
+        return self._post_sign(
+            output, sig_contents, md_algorithm, ctx.use_pades,
+            validation_paths=ctx.validation_paths,
+            ts_validation_paths=ctx.ts_validation_paths, writer=pdf_out
+        )
+
+    async def async_sign_pdf(self, pdf_out: IncrementalPdfFileWriter,
+                             existing_fields_only=False, bytes_reserved=None,
+                             executor=None):
+        """
+        Asynchronous version of :meth:`sign_pdf`.
+
+        Requests to the signer and the timestamping service go through
+        :meth:`.Signer.async_sign`. Everything else (building validation
+        paths, rendering and hashing the document, embedding revocation
+        info) is CPU- or I/O-bound synchronous code, and runs in ``executor``.
+        Since the signing process mutates ``pdf_out``, a writer should not
+        be shared between concurrent calls.
+
+        Work involving the validation context is serialised between
+        concurrent calls. Timestamp requests don't happen while the lock is
+        held. Neither does fetching revocation info, provided that the
+        validation context is a :class:`.CachingValidationContext`.
+
+        :param executor:
+            The executor to use, or ``None`` to use the event loop's default
+            executor.
+        """
+        loop = asyncio.get_running_loop()
+
+        if not self._certs_primed:
+            # asn1crypto values are parsed lazily, which is not thread-safe.
+            # Hence, we parse the certificates that will be accessed from
+            # several threads at once in advance. The timestamper takes care
+            # of the certificates it collects itself.
+            signer = self.signer
+            signer.signing_cert.native
+            for cert in signer.cert_registry:
+                cert.native
+            self._certs_primed = True
+
+        def _run(fun, *args, **kwargs):
+            return loop.run_in_executor(
+                executor, functools.partial(fun, *args, **kwargs)
             )
 
-            if signer.timestamper is not None and signature_meta.use_pades_lta:
-                # append an LTV document timestamp
-                output.seek(0)
-                w = IncrementalPdfFileWriter(output)
-                output = self.timestamp_pdf(
-                    w, md_algorithm, validation_context,
-                    validation_paths=ts_validation_paths
-                )
+        def _run_locked(fun, *args, **kwargs):
+            # the validation context is not thread-safe either
+            def _locked():
+                with self._sync_lock:
+                    return fun(*args, **kwargs)
+            return loop.run_in_executor(executor, _locked)
+
+        # Network I/O happens outside the lock wherever possible, so
+        # concurrent calls don't have to wait for one another's requests.
+        await self._async_prefetch(_run, _run_locked)
+        ctx = await _run_locked(
+            self._prepare_signature, pdf_out, existing_fields_only,
+            bytes_reserved
+        )
+        md_algorithm = ctx.md_algorithm
+        # rendering and hashing the document only involves objects
+        # that are private to this call, so this can run in parallel
+        output, sig_start, sig_end, digest = await _run(
+            ctx.sig_obj.write_placeholder, pdf_out, md_algorithm
+        )
+        signature_cms = await self.signer.async_sign(
+            digest, md_algorithm, timestamp=ctx.timestamp,
+            use_pades=ctx.use_pades, revocation_info=ctx.revinfo
+        )
+        sig_contents = fill_signature_contents(
+            output, sig_start, sig_end, signature_cms
+        )
+        output.seek(0)
 
-        return output
+        signature_meta = self.signature_meta
+        if not (ctx.use_pades and signature_meta.embed_validation_info):
+            return output
+        validation_context = signature_meta.validation_context
+        writer = await _run_locked(
+            self._add_dss, output, sig_contents, ctx.validation_paths,
+            validation_context, pdf_out
+        )
+        if self.signer.timestamper is None \
+                or not signature_meta.use_pades_lta:
+            return output
+
+        # append an LTV document timestamp to the same stream
+        ts_writer = await _run(writer.chain, output)
+        wr, digest = await _run(
+            self._start_timestamp, ts_writer, md_algorithm, output=output
+        )
+        timestamp_cms = await self.signer.timestamper.async_timestamp(
+            digest, md_algorithm
+        )
+        return await _run_locked(
+            self._finish_timestamp, ts_writer, wr, timestamp_cms,
+            md_algorithm, validation_context,
+            validation_paths=ctx.ts_validation_paths
+        )
+
+    async def _async_prefetch(self, run, run_locked):
+        # Measure the TSA's tokens, collect its certificates and fetch
+        # revocation info before async_sign_pdf calls _prepare_signature,
+        # which would otherwise do these things while holding the lock.
+        signature_meta = self.signature_meta
+        timestamper = self.signer.timestamper
+        md_algorithm = signature_meta.md_algorithm or DEFAULT_MD
+        if timestamper is not None:
+            await timestamper.async_token_size_estimate(md_algorithm)
+            if signature_meta.embed_validation_info:
+                await timestamper.async_collect_certs(md_algorithm)
+        validation_context = signature_meta.validation_context
+        if not isinstance(validation_context, CachingValidationContext):
+            return
+        # noinspection PyProtectedMember
+        jobs = await run_locked(
+            validation_context._plan_prefetch, *self._prefetch_targets()
+        )
+        if jobs is not None:
+            # noinspection PyProtectedMember
+            results = await run(validation_context._run_prefetch, jobs)
+            # noinspection PyProtectedMember
+            await run_locked(
+                validation_context._register_prefetched, jobs, results
+            )
+
+    def prepare_pdf(self, pdf_out: IncrementalPdfFileWriter, output=None,
+                    existing_fields_only=False, bytes_reserved=None) \
+            -> 'PreparedSignature':
+        """
+        First half of a two-phase signing process.
+        Adds a signature object to the document and writes it to ``output``
+        with a placeholder for the signature, but doesn't actually sign
+        anything. The signature must be supplied later through
+        :meth:`finalise_pdf`.
+
+        The signature value to produce is a raw signature (i.e. the output
+        of :meth:`.Signer.sign_raw`) over
+        :attr:`.PreparedSignature.signed_attrs`.
+
+        :param pdf_out: The document to sign.
+        :param output:
+            Empty binary stream (seekable, readable and writable) to write the
+            prepared document to, e.g. a file opened in ``w+b`` mode.
+            If ``None``, a new :class:`io.BytesIO` is used.
+        :param existing_fields_only: See :meth:`sign_pdf`.
+        :param bytes_reserved: See :meth:`sign_pdf`.
+        :return:
+            A :class:`.PreparedSignature`. The output stream is not part of
+            it, so it can be closed in the meantime.
+        """
+        ctx = self._prepare_signature(
+            pdf_out, existing_fields_only, bytes_reserved
+        )
+        md_algorithm = ctx.md_algorithm
+        output, sig_start, sig_end, digest = ctx.sig_obj.write_placeholder(
+            pdf_out, md_algorithm, output=output
+        )
+        signed_attrs = self.signer.signed_attrs(
+            digest, ctx.timestamp, revocation_info=ctx.revinfo,
+            use_pades=ctx.use_pades
+        )
+        return PreparedSignature(
+            md_algorithm=md_algorithm, document_digest=digest,
+            signed_attrs=signed_attrs.dump(), sig_start=sig_start,
+            sig_end=sig_end, use_pades=ctx.use_pades
+        )
+
+    def finalise_pdf(self, prepared: 'PreparedSignature', output,
+                     signature: bytes):
+        """
+        Second half of a two-phase signing process.
+        Builds the CMS object for a signature over the signed attributes
+        of a :class:`.PreparedSignature`, and writes it into the placeholder.
+
+        If revocation info needs to be embedded into the document, it's
+        appended to the output stream afterwards, as in :meth:`sign_pdf`.
+
+        :param prepared:
+            The output of :meth:`prepare_pdf`.
+        :param output:
+            Seekable, readable and writable binary stream containing the
+            document produced by :meth:`prepare_pdf`.
+        :param signature:
+            The raw signature over ``prepared.signed_attrs``.
+        :return:
+            The stream containing the signed document. This is ``output``,
+            unless a document timestamp was added.
+        """
+        signed_attrs = cms.CMSAttributes.load(prepared.signed_attrs)
+        signature_cms = self.signer.build_cms(
+            prepared.md_algorithm, signed_attrs, signature
+        )
+        sig_contents = fill_signature_contents(
+            output, prepared.sig_start, prepared.sig_end, signature_cms
+        )
+        output.seek(0)
+        return self._post_sign(
+            output, sig_contents, prepared.md_algorithm, prepared.use_pades
+        )
 
     def timestamp_pdf(self, pdf_out: IncrementalPdfFileWriter,
                       md_algorithm, validation_context, bytes_reserved=None,
-                      validation_paths=None):
+                      validation_paths=None, output=None):
+        """
+        Add a document timestamp to a PDF, and embed validation info for it.
+
+        :param pdf_out: The document to timestamp.
+        :param md_algorithm: The digest algorithm to use.
+        :param validation_context:
+            Validation context to fetch revocation info with.
+        :param bytes_reserved:
+            Bytes to reserve for the timestamp token. If ``None``, an estimate
+            is computed.
+        :param validation_paths:
+            Validation paths for the TSA's certificates, if they're known
+            already.
+        :param output:
+            Stream to write to, see :meth:`sign_pdf`. If ``pdf_out`` was
+            obtained through :meth:`.IncrementalPdfFileWriter.chain`, this
+            should be the stream it appends to, positioned at the end.
+        :return:
+            The output stream.
+        """
+        wr, true_digest = self._start_timestamp(
+            pdf_out, md_algorithm, bytes_reserved=bytes_reserved, output=output
+        )
+        timestamp_cms = self.signer.timestamper.timestamp(
+            true_digest, md_algorithm
+        )
+        return self._finish_timestamp(
+            pdf_out, wr, timestamp_cms, md_algorithm, validation_context,
+            validation_paths=validation_paths
+        )
+
+    def _start_timestamp(self, pdf_out: IncrementalPdfFileWriter,
+                         md_algorithm, bytes_reserved=None, output=None):
+        # add the document timestamp field and compute the digest to
+        # timestamp
         timestamper = self.signer.timestamper
         field_name = self.signature_meta.timestamp_field_name or (
             'Timestamp-' + str(uuid.uuid4())
         )
-        if validation_paths is None:
-            validation_paths = list(
-                timestamper.validation_paths(validation_context)
-            )
         if bytes_reserved is None:
-            test_signature_cms = timestamper.dummy_response(md_algorithm)
-            test_len = len(test_signature_cms.dump()) * 2
-            # see sign_pdf comments
-            bytes_reserved = test_len + 2 * (test_len // 4)
+            bytes_reserved = _reserve_with_margin(
+                timestamper.token_size_estimate(md_algorithm), self.size_margin
+            )
 
         timestamp_obj = DocumentTimestamp(bytes_reserved=bytes_reserved)
         field_created, sig_field_ref = _get_or_create_sigfield(
@@ -977,16 +1672,237 @@ class PdfSigner:
         if not field_created:  # pragma: nocover
             pdf_out.mark_update(timestamp_obj_ref)
 
-        wr = timestamp_obj.write_signature(pdf_out, md_algorithm)
+        if output is not None:
+            # pdf_out might read from output as well, so we have to make sure
+            # that we start writing at the end
+            output.seek(0, os.SEEK_END)
+        wr = timestamp_obj.write_signature(pdf_out, md_algorithm, output=output)
         true_digest = next(wr)
-        timestamp_cms = timestamper.timestamp(true_digest, md_algorithm)
+        return wr, true_digest
+
+    def _finish_timestamp(self, pdf_out: IncrementalPdfFileWriter, wr,
+                          timestamp_cms, md_algorithm, validation_context,
+                          validation_paths=None):
+        # fill in the timestamp token, and embed validation info for it
         output, sig_contents = wr.send(timestamp_cms)
 
+        if validation_paths is None:
+            # the TSA's certificates have been collected from the response
+            # by now
+            validation_paths = list(
+                self.signer.timestamper.validation_paths(
+                    validation_context, md_algorithm
+                )
+            )
+
         # update the DSS
-        from pdfstamp.sign import validation
-        validation.DocumentSecurityStore.add_dss(
-            output_stream=output, sig_contents=sig_contents,
-            paths=validation_paths, validation_context=validation_context
+        self._add_dss(
+            output, sig_contents, validation_paths, validation_context,
+            pdf_out
         )
-
         return output
+
+
+DEFAULT_BATCH_CACHE_TTL = 600
+
+
+class _TTLCache:
+    # Tiny memo dict whose entries expire after a fixed number of seconds.
+    # A ttl of None means that entries never expire.
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._entries = {}
+
+    def get_or_compute(self, key, compute):
+        now = time.monotonic()
+        try:
+            expiry, value = self._entries[key]
+            if expiry is None or now < expiry:
+                return value
+        except KeyError:
+            pass
+        value = compute()
+        expiry = None if self.ttl is None else now + self.ttl
+        self._entries[key] = expiry, value
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+
+class _CacheNode:
+    # cache for data that depends on a sequence of objects, see
+    # BatchSigner._cache_for
+
+    def __init__(self, ttl):
+        self.cache = _TTLCache(ttl)
+        self.children = weakref.WeakKeyDictionary()
+
+
+class _NoOwner:
+    pass
+
+
+# stands in for a missing validation context or timestamper in
+# BatchSigner's caches
+_NO_OWNER = _NoOwner()
+
+
+@dataclass(frozen=True)
+class BatchSigningResult:
+    """
+    Outcome of signing a single document in a batch.
+    If signing failed, output is None and error holds the exception.
+    Elapsed time is measured in seconds.
+    """
+
+    index: int
+    output: Optional[IO] = None
+    elapsed: float = 0.0
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class BatchSigner(PdfSigner):
+    """
+    :class:`.PdfSigner` for signing many documents with the same signer and
+    signature settings.
+
+    The signer-level work done by :meth:`sign_pdf` (validating the signer's
+    certificate, fetching a dummy timestamp token and validating the TSA's
+    certificates, collecting Adobe-style revocation info and estimating the
+    size of the signature container) doesn't depend on the document being
+    signed, so it is computed once and reused for subsequent documents.
+    Cached values expire after ``cache_ttl`` seconds, to make sure that e.g.
+    revocation info doesn't go stale in long-running processes.
+
+    Anything that depends on the document itself (signature fields, seed
+    value dictionaries, certification constraints) is still processed for
+    every document.
+
+    :param signature_meta: Signature settings to apply to every document.
+    :param signer: The signer to use.
+    :param cache_ttl: Lifetime of cached signer-level data in seconds.
+        Pass ``None`` to cache indefinitely.
+    :param size_margin: See :class:`.PdfSigner`.
+    """
+
+    def __init__(self, signature_meta: PdfSignatureMetadata, signer: Signer,
+                 cache_ttl=DEFAULT_BATCH_CACHE_TTL,
+                 size_margin=DEFAULT_SIZE_MARGIN):
+        super().__init__(signature_meta, signer, size_margin=size_margin)
+        self.cache_ttl = cache_ttl
+        self._caches = _CacheNode(cache_ttl)
+
+    def invalidate(self):
+        """
+        Drop all cached signer-level data.
+        """
+        self._caches = _CacheNode(self.cache_ttl)
+
+    def _cache_for(self, *owners) -> _TTLCache:
+        # Cached data is attached to the validation contexts and
+        # timestampers it was computed with, without keeping them alive.
+        # Keying on id() isn't safe: once an object is freed, its id can
+        # be reused by a new one (e.g. a timestamper built from a seed
+        # value dictionary for a single document).
+        node = self._caches
+        for owner in owners:
+            owner = _NO_OWNER if owner is None else owner
+            try:
+                node = node.children[owner]
+            except KeyError:
+                child = _CacheNode(self.cache_ttl)
+                node.children[owner] = child
+                node = child
+        return node.cache
+
+    def _signer_validation_path(self, validation_context):
+        return self._cache_for(validation_context).get_or_compute(
+            'signer_path',
+            lambda: super(BatchSigner, self)._signer_validation_path(
+                validation_context
+            )
+        )
+
+    def _timestamper_validation_paths(self, md_algorithm, validation_context):
+        # the timestamper can be swapped out by a seed value dictionary
+        cache = self._cache_for(self.signer.timestamper, validation_context)
+        return cache.get_or_compute(
+            ('ts_paths', md_algorithm),
+            lambda: super(BatchSigner, self)._timestamper_validation_paths(
+                md_algorithm, validation_context
+            )
+        )
+
+    def _revocation_info(self, validation_context):
+        return self._cache_for(validation_context).get_or_compute(
+            'revinfo',
+            lambda: super(BatchSigner, self)._revocation_info(
+                validation_context
+            )
+        )
+
+    def _estimate_bytes_reserved(self, md_algorithm, timestamp, use_pades,
+                                 revinfo):
+        # the timestamp only affects the size of the signing time attribute,
+        # which is fixed-width, but the revocation info can be of any size
+        revinfo_size = None if revinfo is None else len(revinfo.dump())
+        key = ('bytes_reserved', md_algorithm, use_pades, revinfo_size)
+        return self._cache_for(self.signer.timestamper).get_or_compute(
+            key, lambda: super(BatchSigner, self)._estimate_bytes_reserved(
+                md_algorithm, timestamp, use_pades, revinfo
+            )
+        )
+
+    def sign_many(self, jobs: Iterable[Tuple[Any, Optional[IO]]],
+                  existing_fields_only=False, fail_fast=False) \
+            -> Iterator[BatchSigningResult]:
+        """
+        Sign a sequence of documents.
+
+        :param jobs:
+            Iterable of ``(input, output)`` pairs. The input can be an
+            :class:`.IncrementalPdfFileWriter` or a binary stream containing
+            a PDF file. The output is a writable binary stream, or ``None``,
+            in which case the result's output is the in-memory buffer
+            containing the signed document.
+            Jobs are consumed lazily, so this can be a generator.
+        :param existing_fields_only:
+            See :meth:`sign_pdf`.
+        :param fail_fast:
+            If ``True``, errors are raised immediately. Otherwise, they're
+            recorded in the :class:`.BatchSigningResult` of the offending
+            document, and processing continues.
+        :return:
+            An iterator yielding one :class:`.BatchSigningResult` per job,
+            in input order.
+        """
+        for ix, (pdf_in, output) in enumerate(jobs):
+            start = time.perf_counter()
+            try:
+                if isinstance(pdf_in, IncrementalPdfFileWriter):
+                    pdf_out = pdf_in
+                else:
+                    pdf_out = IncrementalPdfFileWriter(pdf_in)
+                result = self.sign_pdf(
+                    pdf_out, existing_fields_only=existing_fields_only
+                )
+                if output is not None:
+                    output.write(result.getbuffer())
+                    result = output
+            except Exception as e:
+                if fail_fast:
+                    raise
+                logger.warning(f'Failed to sign document #{ix}.', exc_info=e)
+                yield BatchSigningResult(
+                    index=ix, elapsed=time.perf_counter() - start, error=e
+                )
+                continue
+            yield BatchSigningResult(
+                index=ix, output=result, elapsed=time.perf_counter() - start
+            )
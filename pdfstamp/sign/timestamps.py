@@ -1,16 +1,29 @@
+import asyncio
 import hashlib
+import itertools
+import logging
 import struct
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dataclasses import dataclass
 from datetime import datetime
+from typing import Optional, List
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import tzlocal
 from asn1crypto import tsp, algos, cms, x509, keys, core
 from certvalidator import CertificateValidator
+from certvalidator.errors import ValidationError
+from certvalidator.validate import validate_path, validate_usage
 from oscrypto import asymmetric
 
 from . import general
+from .cache import TSACache, TSACacheEntry
+from .revinfo import CachingValidationContext
 from .general import (
     SignatureStatus, simple_cms_attribute, CertificateStore,
     SimpleCertificateStore,
@@ -18,14 +31,100 @@ from .general import (
 
 __all__ = [
     'TimestampSignatureStatus', 'TimeStamper', 'HTTPTimeStamper',
-    'TimestampRequestError',
+    'AsyncHTTPTimeStamper', 'TimestampRequestError', 'LatencyHistogram',
+    'CompositeTimeStamper', 'BackendStats',
 ]
 
+logger = logging.getLogger(__name__)
+
+
+# Defaults for the HTTP transport
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.1
+RETRY_STATUSES = (500, 502, 503, 504)
+
 
 class TimestampRequestError(IOError):
     pass
 
 
+class LatencyHistogram:
+    """
+    Thread-safe histogram of request latencies (in seconds).
+
+    :param bounds:
+        Upper bounds of the buckets, in increasing order. Latencies above the
+        last bound end up in an overflow bucket.
+    """
+
+    DEFAULT_BOUNDS = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+    )
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        ix = len(self.bounds)
+        for i, bound in enumerate(self.bounds):
+            if latency <= bound:
+                ix = i
+                break
+        with self._lock:
+            self._counts[ix] += 1
+            self.count += 1
+            self.total += latency
+            self.max = max(self.max, latency)
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate a quantile of the recorded latencies, by returning the upper
+        bound of the bucket it falls into (or the largest latency recorded,
+        if that is smaller).
+        Returns ``None`` if nothing has been recorded yet.
+        """
+        if not 0 <= q <= 1:
+            raise ValueError('Quantile must be between 0 and 1.')
+        with self._lock:
+            if not self.count:
+                return None
+            threshold = q * self.count
+            cumulative = 0
+            for bound, count in zip(self.bounds, self._counts):
+                cumulative += count
+                if count and cumulative >= threshold:
+                    return min(bound, self.max)
+            return self.max
+
+    def buckets(self):
+        """
+        Return a list of ``(upper_bound, count)`` tuples. The upper bound
+        of the overflow bucket is ``float('inf')``.
+        """
+        with self._lock:
+            return list(zip(self.bounds + (float('inf'),), self._counts))
+
+    def as_dict(self):
+        return {
+            'count': self.count, 'mean': self.mean, 'max': self.max,
+            'p50': self.quantile(0.5), 'p95': self.quantile(0.95),
+            'buckets': [
+                {'le': bound, 'count': count}
+                for bound, count in self.buckets()
+            ]
+        }
+
+
 def get_nonce():
     # generate a random 8-byte integer
     # we initialise it like this to guarantee a fixed width
@@ -55,6 +154,9 @@ def extract_ts_certs(ts_token, store: CertificateStore):
 
     for wrapped_c in ts_certs:
         c: cms.Certificate = wrapped_c.chosen
+        # asn1crypto parses lazily, which isn't thread-safe, and certificates
+        # in the store can be accessed from several threads at once
+        c.native
         store.register(c)
         if (c.issuer.dump(), c.serial_number) in ts_leaves:
             yield c
@@ -65,10 +167,106 @@ class TimeStamper:
     Class to make RFC3161 timestamp requests
     """
 
-    def __init__(self):
+    def __init__(self, cache: TSACache = None):
         self._dummy_response_cache = {}
+        self._token_sizes = {}
         self._certs = {}
         self.cert_registry = SimpleCertificateStore()
+        self.cache = cache
+        self._cache_entries = {}
+        # protects the state above, since timestamps can be requested
+        # from several threads at once
+        self._lock = threading.RLock()
+
+    @property
+    def cache_key(self):
+        """
+        Key identifying the TSA in a :class:`.TSACache`, or ``None`` if
+        this timestamper can't be cached.
+        """
+        return None
+
+    def _cache_entry(self, md_algorithm) -> Optional[TSACacheEntry]:
+        # load the cache entry for this TSA (at most once)
+        if self.cache is None or self.cache_key is None:
+            return None
+        with self._lock:
+            try:
+                return self._cache_entries[md_algorithm]
+            except KeyError:
+                pass
+            entry = self.cache.get(self.cache_key, md_algorithm)
+            self._cache_entries[md_algorithm] = entry
+            if entry is not None:
+                # parse everything we got from the cache right away, since
+                # asn1crypto's lazy parsing isn't thread-safe
+                for cert in itertools.chain(
+                        entry.certs, entry.other_certs, *entry.paths):
+                    cert.native
+                size = self._token_sizes.get(md_algorithm, 0)
+                self._token_sizes[md_algorithm] = max(size, entry.token_size)
+                self.cert_registry.register_multiple(entry.other_certs)
+                self.cert_registry.register_multiple(entry.certs)
+                for cert in entry.certs:
+                    self._certs.setdefault(cert.issuer_serial, cert)
+            return entry
+
+    def _update_cache(self, md_algorithm, paths=None):
+        if self.cache is None or self.cache_key is None:
+            return
+        with self._lock:
+            entry = self._cache_entries.get(md_algorithm)
+            if entry is None:
+                entry = TSACacheEntry(token_size=0)
+            entry.token_size = self._token_sizes.get(md_algorithm, 0)
+            entry.certs = list(self._certs.values())
+            signing_certs = set(self._certs.keys())
+            entry.other_certs = [
+                cert for cert in self.cert_registry
+                if cert.issuer_serial not in signing_certs
+            ]
+            if paths is not None:
+                entry.paths = [list(path) for path in paths]
+            self.cache.put(self.cache_key, md_algorithm, entry)
+            self._cache_entries[md_algorithm] = entry
+
+    def _known_token_size(self, md_algorithm) -> Optional[int]:
+        self._cache_entry(md_algorithm)
+        with self._lock:
+            try:
+                return self._token_sizes[md_algorithm]
+            except KeyError:
+                pass
+            if self._token_sizes:
+                # the digest size only accounts for a few bytes of difference
+                return max(self._token_sizes.values()) + 64
+        return None
+
+    def token_size_estimate(self, md_algorithm) -> int:
+        """
+        Estimate the size of a DER-encoded timestamp token for a digest
+        computed using the given algorithm.
+
+        The estimate is based on the largest token received from this TSA
+        so far, taking into account the persistent cache (if there is one).
+        If there are none, the size is measured by requesting a dummy
+        timestamp.
+        """
+        size = self._known_token_size(md_algorithm)
+        if size is None:
+            self.dummy_response(md_algorithm)
+            size = self._known_token_size(md_algorithm)
+        return size
+
+    async def async_token_size_estimate(self, md_algorithm) -> int:
+        """
+        Asynchronous version of :meth:`token_size_estimate`.
+        """
+        size = self._known_token_size(md_algorithm)
+        if size is None:
+            await self.async_dummy_response(md_algorithm)
+            size = self._known_token_size(md_algorithm)
+        return size
 
     def dummy_response(self, md_algorithm):
         # different hashes have different sizes, so the dummy responses
@@ -79,19 +277,144 @@ class TimeStamper:
             pass
         md = getattr(hashlib, md_algorithm)()
         dummy = self.timestamp(md.digest(), md_algorithm)
-        self._dummy_response_cache[md_algorithm] = dummy
-        for cert in extract_ts_certs(dummy, self.cert_registry):
-            self._certs[cert.issuer_serial] = cert
-        return dummy
+        return self._register_dummy(dummy, md_algorithm)
+
+    async def async_dummy_response(self, md_algorithm):
+        try:
+            return self._dummy_response_cache[md_algorithm]
+        except KeyError:
+            pass
+        md = getattr(hashlib, md_algorithm)()
+        dummy = await self.async_timestamp(md.digest(), md_algorithm)
+        return self._register_dummy(dummy, md_algorithm)
+
+    def _register_dummy(self, dummy, md_algorithm):
+        # dummy responses are shared between threads, so parse them fully
+        dummy.native
+        with self._lock:
+            return self._dummy_response_cache.setdefault(md_algorithm, dummy)
+
+    def _prime(self):
+        # asn1crypto parses lazily, which isn't thread-safe, so parse
+        # everything up front before handing this timestamper to
+        # other threads
+        with self._lock:
+            for cert in self.cert_registry:
+                cert.native
+            for dummy in self._dummy_response_cache.values():
+                dummy.native
 
-    def validation_paths(self, validation_context):
-        for cert in self._certs.values():
+    def _register_certs(self, ts_token):
+        new_certs = False
+        with self._lock:
+            for cert in extract_ts_certs(ts_token, self.cert_registry):
+                if cert.issuer_serial not in self._certs:
+                    new_certs = True
+                    self._certs[cert.issuer_serial] = cert
+        return new_certs
+
+    def collect_certs(self, md_algorithm):
+        """
+        Make sure the TSA's certificates are known, by looking them up
+        in the persistent cache or, failing that, by requesting a dummy
+        timestamp.
+        """
+        self._cache_entry(md_algorithm)
+        if not self._certs:
+            self.dummy_response(md_algorithm)
+
+    async def async_collect_certs(self, md_algorithm):
+        """
+        Asynchronous version of :meth:`collect_certs`.
+        """
+        self._cache_entry(md_algorithm)
+        if not self._certs:
+            await self.async_dummy_response(md_algorithm)
+
+    @property
+    def signing_certs(self) -> List[x509.Certificate]:
+        """
+        The TSA signing certificates encountered so far.
+        """
+        with self._lock:
+            return list(self._certs.values())
+
+    @property
+    def other_certs(self) -> List[x509.Certificate]:
+        """
+        All certificates in :attr:`cert_registry`, as a list.
+        """
+        with self._lock:
+            return list(self.cert_registry)
+
+    def prefetch_revinfo(self, validation_context):
+        """
+        Fetch revocation info for the TSA's certificates concurrently, if
+        the validation context supports it.
+        See :meth:`.CachingValidationContext.prefetch`.
+        """
+        if isinstance(validation_context, CachingValidationContext):
+            validation_context.prefetch(self.signing_certs, self.other_certs)
+
+    def validation_paths(self, validation_context, md_algorithm=None):
+        """
+        Validate the TSA's signing certificates, and return the resulting
+        validation paths.
+
+        If ``md_algorithm`` is specified and the timestamper has a cache,
+        the validation paths are cached as well. Cached paths are only reused
+        if the validation context doesn't allow fetching revocation info
+        (since validating the certificates again is the only way to gather
+        that), and if they end in one of the trust roots of the validation
+        context. Reusing a path saves the path building, but the path is
+        still validated against the validation context's moment and
+        revocation info; if that fails, the certificates are validated from
+        scratch.
+        """
+        entry = None
+        if md_algorithm is not None:
+            entry = self._cache_entry(md_algorithm)
+        # noinspection PyProtectedMember
+        if entry is not None and entry.paths \
+                and not validation_context._allow_fetching:
+            cached_paths = self._revalidate_cached(
+                validation_context, entry.validation_paths()
+            )
+            if cached_paths is not None:
+                return cached_paths
+
+        self.prefetch_revinfo(validation_context)
+        paths = []
+        other_certs = self.other_certs
+        for cert in self.signing_certs:
             validator = CertificateValidator(
                 cert,
-                intermediate_certs=self.cert_registry,
+                intermediate_certs=other_certs,
                 validation_context=validation_context
             )
-            yield validator.validate_usage(set(), {"time_stamping"})
+            paths.append(validator.validate_usage(set(), {"time_stamping"}))
+        if md_algorithm is not None:
+            self._update_cache(md_algorithm, paths=paths)
+        return paths
+
+    @staticmethod
+    def _revalidate_cached(validation_context, paths):
+        registry = validation_context.certificate_registry
+        if not all(registry.is_ca(path.first) for path in paths):
+            return None
+        try:
+            for path in paths:
+                validate_path(validation_context, path)
+                validate_usage(
+                    validation_context, path[-1], set(), {"time_stamping"},
+                    False
+                )
+        except ValidationError as e:
+            logger.debug(
+                'Cached TSA validation path no longer validates: %s', e
+            )
+            return None
+        return paths
 
     def request_cms(self, message_digest, md_algorithm):
         # see also
@@ -115,9 +438,28 @@ class TimeStamper:
     def request_tsa_response(self, req: tsp.TimeStampReq) -> tsp.TimeStampResp:
         raise NotImplementedError
 
+    async def async_request_tsa_response(self, req: tsp.TimeStampReq) \
+            -> tsp.TimeStampResp:
+        """
+        Asynchronous version of :meth:`request_tsa_response`.
+        By default, this runs :meth:`request_tsa_response` in the event loop's
+        default executor. Subclasses with a native asynchronous transport
+        should override it.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.request_tsa_response, req)
+
     def timestamp(self, message_digest, md_algorithm):
         nonce, req = self.request_cms(message_digest, md_algorithm)
         res = self.request_tsa_response(req)
+        return self._extract_token(nonce, res, md_algorithm)
+
+    async def async_timestamp(self, message_digest, md_algorithm):
+        nonce, req = self.request_cms(message_digest, md_algorithm)
+        res = await self.async_request_tsa_response(req)
+        return self._extract_token(nonce, res, md_algorithm)
+
+    def _extract_token(self, nonce, res: tsp.TimeStampResp, md_algorithm):
         pki_status_info = res['status']
         if pki_status_info['status'].native != 'granted':
             try:
@@ -140,8 +482,23 @@ class TimeStamper:
                 f'Time stamping authority sent back bad nonce value. Expected '
                 f'{nonce}, but got {nonce_received}.'
             )
+        self._register_token(tst, md_algorithm)
         return tst
 
+    def _register_token(self, tst, md_algorithm):
+        # load the cache entry first, so we can tell whether it needs updating
+        self._cache_entry(md_algorithm)
+        size = len(tst.dump())
+        with self._lock:
+            size_increased = size > self._token_sizes.get(md_algorithm, 0)
+            if size_increased:
+                self._token_sizes[md_algorithm] = size
+            # keep track of the TSA's certificates, so we can validate them
+            # later
+            new_certs = self._register_certs(tst)
+            if size_increased or new_certs:
+                self._update_cache(md_algorithm)
+
 
 class DummyTimeStamper(TimeStamper):
     """
@@ -161,6 +518,11 @@ class DummyTimeStamper(TimeStamper):
         self.fixed_dt = fixed_dt
         super().__init__()
 
+    def _prime(self):
+        super()._prime()
+        for asn1_value in [self.tsa_cert, self.tsa_key] + self.certs_to_embed:
+            asn1_value.native
+
     def request_tsa_response(self, req: tsp.TimeStampReq) -> tsp.TimeStampResp:
         # We pretend that certReq is always true in the request
 
@@ -244,14 +606,91 @@ class DummyTimeStamper(TimeStamper):
 
 
 class HTTPTimeStamper(TimeStamper):
+    """
+    Timestamper that sends its requests to a TSA over HTTP(S).
+
+    Requests go through a :class:`requests.Session` with a connection pool,
+    so connections to the TSA are kept alive between requests.
+    Connection errors and 5xx responses are retried with exponential backoff.
+    The latency of every request (including retries) is recorded in
+    :attr:`latency`.
 
-    def __init__(self, url, https=False, timeout=5, auth=None, headers=None):
+    :param pool_size:
+        Maximal number of connections to keep open to the TSA.
+    :param max_retries:
+        Maximal number of times to retry a failed request.
+    :param backoff_factor:
+        Backoff factor for retries, see :class:`urllib3.util.retry.Retry`.
+    :param session:
+        :class:`requests.Session` to use. If specified, ``pool_size``,
+        ``max_retries`` and ``backoff_factor`` are ignored.
+    """
+
+    def __init__(self, url, https=False, timeout=5, auth=None, headers=None,
+                 cache: TSACache = None, pool_size=DEFAULT_POOL_SIZE,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR,
+                 session: requests.Session = None):
         self.url = url
         self.https = https
         self.timeout = timeout
         self.auth = auth
         self.headers = headers
-        super().__init__()
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self._session = session
+        self._session_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.latency = LatencyHistogram()
+        self.error_count = 0
+        super().__init__(cache=cache)
+
+    def _create_session(self) -> requests.Session:
+        # timestamp requests have no side effects, so POSTs are safe to retry
+        retry_kwargs = {
+            'total': self.max_retries, 'status_forcelist': RETRY_STATUSES,
+            'backoff_factor': self.backoff_factor, 'raise_on_status': False
+        }
+        try:
+            retry = Retry(allowed_methods=None, **retry_kwargs)
+        except TypeError:
+            # urllib3 < 1.26 calls this parameter method_whitelist
+            retry = Retry(method_whitelist=False, **retry_kwargs)
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.pool_size,
+            max_retries=retry
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def close(self):
+        """
+        Close all pooled connections.
+        """
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def _record_request(self, start, failed):
+        self.latency.record(time.perf_counter() - start)
+        if failed:
+            with self._stats_lock:
+                self.error_count += 1
+
+    @property
+    def cache_key(self):
+        return self.url
 
     def request_headers(self):
         headers = self.headers or {}
@@ -264,12 +703,415 @@ class HTTPTimeStamper(TimeStamper):
         return super().timestamp(message_digest, md_algorithm)
 
     def request_tsa_response(self, req: tsp.TimeStampReq) -> tsp.TimeStampResp:
-        raw_res = requests.post(
-            self.url, req.dump(), headers=self.request_headers(),
-            auth=self.auth, timeout=self.timeout
-        )
-        if raw_res.headers.get('Content-Type') != 'application/timestamp-reply':
+        start = time.perf_counter()
+        try:
+            raw_res = self.session.post(
+                self.url, req.dump(), headers=self.request_headers(),
+                auth=self.auth, timeout=self.timeout
+            )
+        except requests.RequestException:
+            self._record_request(start, failed=True)
+            raise
+        content_type = raw_res.headers.get('Content-Type')
+        malformed = content_type != 'application/timestamp-reply'
+        self._record_request(start, failed=malformed)
+        if malformed:
             raise TimestampRequestError(
                 'Timestamp server response is malformed.', raw_res
             )
         return tsp.TimeStampResp.load(raw_res.content)
+
+
+class AsyncHTTPTimeStamper(HTTPTimeStamper):
+    """
+    :class:`.HTTPTimeStamper` that talks to the TSA using ``aiohttp`` when
+    used asynchronously. Synchronous requests still go through ``requests``.
+    This requires the ``async-http`` extra.
+
+    :param async_session:
+        ``aiohttp.ClientSession`` to use. If not specified, a session is
+        created (and closed again) for every request.
+    """
+
+    def __init__(self, url, https=False, timeout=5, auth=None, headers=None,
+                 cache: TSACache = None, async_session=None, **kwargs):
+        self.async_session = async_session
+        super().__init__(
+            url, https=https, timeout=timeout, auth=auth, headers=headers,
+            cache=cache, **kwargs
+        )
+
+    async def async_timestamp(self, message_digest, md_algorithm):
+        if self.https and not self.url.startswith('https:'):  # pragma: nocover
+            raise ValueError('Timestamp URL is not HTTPS.')
+        return await super().async_timestamp(message_digest, md_algorithm)
+
+    async def async_request_tsa_response(self, req: tsp.TimeStampReq) \
+            -> tsp.TimeStampResp:
+        try:
+            import aiohttp
+        except ImportError as e:  # pragma: nocover
+            raise ImportError(
+                'AsyncHTTPTimeStamper requires aiohttp, install the '
+                'async-http extra.'
+            ) from e
+
+        auth = None
+        if self.auth is not None:
+            auth = aiohttp.BasicAuth(*self.auth)
+        kwargs = {
+            'data': req.dump(), 'headers': self.request_headers(),
+            'auth': auth, 'timeout': aiohttp.ClientTimeout(total=self.timeout)
+        }
+
+        async def _post(session):
+            start = time.perf_counter()
+            try:
+                async with session.post(self.url, **kwargs) as raw_res:
+                    content_type = raw_res.headers.get('Content-Type')
+                    if content_type != 'application/timestamp-reply':
+                        raise TimestampRequestError(
+                            'Timestamp server response is malformed.', raw_res
+                        )
+                    res = tsp.TimeStampResp.load(await raw_res.read())
+            except (aiohttp.ClientError, asyncio.TimeoutError,
+                    TimestampRequestError):
+                self._record_request(start, failed=True)
+                raise
+            self._record_request(start, failed=False)
+            return res
+
+        if self.async_session is not None:
+            return await _post(self.async_session)
+        async with aiohttp.ClientSession() as session:
+            return await _post(session)
+
+
+class BackendStats:
+    """
+    Request statistics for one of the backends of a
+    :class:`.CompositeTimeStamper`.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure: Optional[float] = None
+        self.hedges = 0
+        self.wins = 0
+        self.in_flight = 0
+        self.latency = LatencyHistogram()
+
+    def as_dict(self):
+        return {
+            'name': self.name, 'requests': self.requests,
+            'successes': self.successes, 'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'hedges': self.hedges, 'wins': self.wins,
+            'in_flight': self.in_flight, 'latency': self.latency.as_dict(),
+        }
+
+
+class CompositeTimeStamper(TimeStamper):
+    """
+    Timestamper that spreads its requests over several other timestampers.
+
+    Every request goes to the healthiest backend, i.e. the one with
+    the lowest mean latency (weighted by the number of requests in flight)
+    that hasn't failed recently. Backends that fail are avoided for a while,
+    with exponential backoff.
+    If the chosen backend hasn't answered within its ``hedge_quantile``
+    latency, the request is also sent to the next best backend, and the first
+    answer wins. Failed requests are retried on the remaining backends.
+
+    Each backend generates and checks its own nonces, and keeps track of its
+    own certificates. The composite timestamper merges them, so that
+    validation info for all TSAs ends up in signed documents.
+    Since any of the TSAs might end up producing the token, the token size
+    estimate is the largest of the backends' estimates.
+
+    :param timestampers:
+        The backends to use.
+    :param hedge_quantile:
+        Latency quantile after which to send a hedged request.
+    :param default_hedge_delay:
+        Time to wait (in seconds) before sending a hedged request, as long as
+        there isn't enough latency data for a backend.
+    :param min_hedge_delay:
+        Never send hedged requests sooner than this (in seconds).
+    :param min_samples:
+        Number of latency samples required before using a backend's
+        latency quantile as the hedge delay.
+    :param max_hedges:
+        Maximal number of hedged requests to send per timestamp.
+    :param failure_cooldown:
+        Time (in seconds) to avoid a backend for after it fails. This is
+        doubled for every consecutive failure.
+    :param max_workers:
+        Maximal number of concurrent backend requests.
+    """
+
+    MAX_COOLDOWN = 300
+
+    def __init__(self, timestampers: List[TimeStamper], hedge_quantile=0.95,
+                 default_hedge_delay=1.0, min_hedge_delay=0.05,
+                 min_samples=10, max_hedges=1, failure_cooldown=5.0,
+                 max_workers=None):
+        if not timestampers:
+            raise ValueError('At least one timestamper is required.')
+        self.timestampers = list(timestampers)
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.max_hedges = max_hedges
+        self.failure_cooldown = failure_cooldown
+        self.max_workers = max_workers or 4 * len(self.timestampers)
+        self._stats = [
+            BackendStats(getattr(ts, 'url', None) or '%s-%d' % (
+                type(ts).__name__, ix
+            )) for ix, ts in enumerate(self.timestampers)
+        ]
+        self._lock = threading.Lock()
+        self._rotation = itertools.count()
+        self._executor = None
+        super().__init__()
+        # the backends will be called from the worker threads
+        self._prime()
+
+    def _prime(self):
+        super()._prime()
+        for ts in self.timestampers:
+            ts._prime()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='timestamp'
+                )
+            return self._executor
+
+    def close(self):
+        """
+        Shut down the worker threads. Requests still in flight are
+        allowed to finish.
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def stats(self) -> List[dict]:
+        """
+        Return request statistics for every backend, in the order in which
+        the backends were passed in.
+        """
+        with self._lock:
+            return [st.as_dict() for st in self._stats]
+
+    def _cooldown_left(self, st: BackendStats, now):
+        if not st.consecutive_failures:
+            return 0
+        cooldown = min(
+            self.failure_cooldown * 2 ** (st.consecutive_failures - 1),
+            self.MAX_COOLDOWN
+        )
+        return max(0, st.last_failure + cooldown - now)
+
+    def _ranked_backends(self):
+        # rotate first, so that ties are broken in round-robin fashion
+        n = len(self.timestampers)
+        offset = next(self._rotation) % n
+        ixs = [(offset + i) % n for i in range(n)]
+        now = time.monotonic()
+
+        def _score(ix):
+            st = self._stats[ix]
+            # backends without any successful requests yet are tried first
+            mean = st.latency.mean or 0
+            return self._cooldown_left(st, now) > 0, \
+                mean * (1 + st.in_flight)
+
+        with self._lock:
+            return sorted(ixs, key=_score)
+
+    def _hedge_delay(self, ix):
+        hist = self._stats[ix].latency
+        if hist.count < self.min_samples:
+            delay = self.default_hedge_delay
+        else:
+            delay = hist.quantile(self.hedge_quantile)
+        return max(delay, self.min_hedge_delay)
+
+    def _call_backend(self, ix, message_digest, md_algorithm):
+        st = self._stats[ix]
+        start = time.perf_counter()
+        try:
+            tst = self.timestampers[ix].timestamp(message_digest, md_algorithm)
+        except Exception:
+            with self._lock:
+                st.in_flight -= 1
+                st.failures += 1
+                st.consecutive_failures += 1
+                st.last_failure = time.monotonic()
+            raise
+        # the token is handed back to the calling thread
+        tst.native
+        st.latency.record(time.perf_counter() - start)
+        with self._lock:
+            st.in_flight -= 1
+            st.successes += 1
+            st.consecutive_failures = 0
+        return tst
+
+    def _submit(self, ix, message_digest, md_algorithm, hedged):
+        st = self._stats[ix]
+        with self._lock:
+            st.requests += 1
+            st.in_flight += 1
+            if hedged:
+                st.hedges += 1
+        return self.executor.submit(
+            self._call_backend, ix, message_digest, md_algorithm
+        )
+
+    def timestamp(self, message_digest, md_algorithm):
+        candidates = iter(self._ranked_backends())
+        pending = {}
+        errors = []
+        hedges = 0
+
+        def _launch(hedged=False):
+            ix = next(candidates, None)
+            if ix is None:
+                return False
+            fut = self._submit(ix, message_digest, md_algorithm, hedged)
+            pending[fut] = ix
+            return True
+
+        _launch()
+        can_hedge = True
+        while pending:
+            timeout = None
+            if can_hedge and hedges < self.max_hedges:
+                # hedge based on the slowest backend we're waiting for
+                timeout = max(self._hedge_delay(ix) for ix in pending.values())
+            done, _ = wait(pending, timeout=timeout,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                can_hedge = _launch(hedged=True)
+                hedges += can_hedge
+                continue
+            for fut in done:
+                ix = pending.pop(fut)
+                try:
+                    tst = fut.result()
+                except Exception as e:
+                    logger.warning(
+                        f'Timestamp request to {self._stats[ix].name} '
+                        f'failed: {e}'
+                    )
+                    errors.append(e)
+                    # fail over to the next backend
+                    _launch()
+                    continue
+                with self._lock:
+                    self._stats[ix].wins += 1
+                # the other requests finish in the background
+                self._register_token(tst, md_algorithm)
+                return tst
+        raise TimestampRequestError(
+            'All timestamp servers failed: '
+            + '; '.join(str(e) or repr(e) for e in errors)
+        )
+
+    def request_tsa_response(self, req: tsp.TimeStampReq) -> tsp.TimeStampResp:
+        # requests are routed at the timestamp() level, so that every
+        # backend can keep track of its own nonces
+        raise NotImplementedError
+
+    async def async_timestamp(self, message_digest, md_algorithm):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, self.timestamp, message_digest, md_algorithm
+        )
+
+    def token_size_estimate(self, md_algorithm) -> int:
+        """
+        The largest of the backends' estimates (computed concurrently).
+        Backends that fail to respond are skipped, unless all of them fail.
+        """
+        futures = [
+            self.executor.submit(ts.token_size_estimate, md_algorithm)
+            for ts in self.timestampers
+        ]
+        sizes = []
+        errors = []
+        for st, fut in zip(self._stats, futures):
+            try:
+                sizes.append(fut.result())
+            except Exception as e:
+                logger.warning(
+                    f'Failed to estimate the token size for {st.name}: {e}'
+                )
+                errors.append(e)
+        if not sizes:
+            raise TimestampRequestError(
+                'Failed to estimate the token size for any timestamp server: '
+                + '; '.join(str(e) or repr(e) for e in errors)
+            )
+        return max(sizes)
+
+    async def async_token_size_estimate(self, md_algorithm) -> int:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, self.token_size_estimate, md_algorithm
+        )
+
+    def _merge_certs(self, ts: TimeStamper):
+        self.cert_registry.register_multiple(ts.cert_registry)
+        for issuer_serial, cert in ts._certs.items():
+            self._certs.setdefault(issuer_serial, cert)
+
+    def collect_certs(self, md_algorithm):
+        """
+        Collect the certificates of all backends (concurrently). Backends
+        that fail to respond are skipped, unless all of them fail.
+        """
+        futures = [
+            self.executor.submit(ts.collect_certs, md_algorithm)
+            for ts in self.timestampers
+        ]
+        errors = []
+        for ts, st, fut in zip(self.timestampers, self._stats, futures):
+            try:
+                fut.result()
+            except Exception as e:
+                logger.warning(
+                    f'Failed to collect certificates from {st.name}: {e}'
+                )
+                errors.append(e)
+            self._merge_certs(ts)
+        if len(errors) == len(self.timestampers):
+            raise TimestampRequestError(
+                'Failed to collect certificates from any timestamp server: '
+                + '; '.join(str(e) or repr(e) for e in errors)
+            )
+
+    def validation_paths(self, validation_context, md_algorithm=None):
+        # fetch everything in one go before the backends get to it
+        self.prefetch_revinfo(validation_context)
+        # let the backends do the work, so their caches get used
+        paths = []
+        for ts in self.timestampers:
+            if ts._certs:
+                paths.extend(
+                    ts.validation_paths(validation_context, md_algorithm)
+                )
+        return paths
@@ -1,15 +1,15 @@
 import hashlib
 import os
 import logging
-from collections import namedtuple
+import threading
+from collections import namedtuple, OrderedDict, defaultdict
 from dataclasses import dataclass, field as data_field
 from datetime import datetime
 from enum import Enum, auto, unique
-from io import BytesIO
-from typing import TypeVar, Type, Optional
+from typing import TypeVar, Type, Optional, List
 
 from asn1crypto import (
-    cms, tsp, ocsp as asn1_ocsp, pdf as asn1_pdf, crl as asn1_crl
+    cms, tsp, ocsp as asn1_ocsp, pdf as asn1_pdf, crl as asn1_crl, algos, keys
 )
 from asn1crypto.x509 import Certificate
 from certvalidator import ValidationContext, CertificateValidator
@@ -26,15 +26,19 @@ from pdf_utils.reader import (
 )
 from pdf_utils.rw_common import PdfHandler
 from .fields import MDPPerm
+from .cache import SignatureResultEntry, ValidationResultStore
 from .general import (
     SignatureStatus, find_cms_attribute,
-    UnacceptableSignerError,
+    UnacceptableSignerError, ValidationPathCache, path_is_available,
+    trust_fingerprint,
 )
 from .timestamps import TimestampSignatureStatus
 
 __all__ = [
     'PdfSignatureStatus', 'validate_pdf_signature', 'validate_cms_signature',
-    'read_certification_data'
+    'read_certification_data', 'DocumentValidator', 'DocumentValidationReport',
+    'FieldValidationResult', 'compute_byte_range_digests',
+    'SignatureVerifier',
 ]
 
 logger = logging.getLogger(__name__)
@@ -75,6 +79,173 @@ def partition_certs(certs, signer_info):
     return cert, ca_chain
 
 
+DEFAULT_KEY_CACHE_SIZE = 256
+DEFAULT_RESULT_CACHE_SIZE = 4096
+
+
+def _lru_put(cache: OrderedDict, key, value, max_size):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > max_size:
+        cache.popitem(last=False)
+
+
+class SignatureVerifier:
+    """
+    Verifies the raw cryptographic signatures in CMS signer infos.
+
+    Public keys are parsed only once, and are cached by the hash of their
+    SubjectPublicKeyInfo. Optionally, the outcome of every verification is
+    remembered as well, so re-validating a signature that was verified before
+    doesn't repeat the public-key operation.
+
+    RSA (PKCS#1 v1.5 and PSS), ECDSA and DSA signatures are supported.
+    To support other mechanisms, override :meth:`supports` and
+    :meth:`verify_raw`.
+
+    :param key_cache_size:
+        Maximal number of public keys to keep around.
+    :param memoise_results:
+        Remember verification results.
+    :param result_cache_size:
+        Maximal number of verification results to keep around.
+    """
+
+    def __init__(self, key_cache_size=DEFAULT_KEY_CACHE_SIZE,
+                 memoise_results=False,
+                 result_cache_size=DEFAULT_RESULT_CACHE_SIZE):
+        self.key_cache_size = key_cache_size
+        self.memoise_results = memoise_results
+        self.result_cache_size = result_cache_size
+        self._keys = OrderedDict()
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load_public_key(self, public_key_info: keys.PublicKeyInfo):
+        """
+        Load a public key for use with ``oscrypto``, or get it from the
+        cache.
+        """
+        key_id = hashlib.sha256(public_key_info.dump()).digest()
+        with self._lock:
+            try:
+                public_key = self._keys[key_id]
+                self._keys.move_to_end(key_id)
+                return public_key
+            except KeyError:
+                pass
+        public_key = asymmetric.load_public_key(public_key_info)
+        with self._lock:
+            _lru_put(self._keys, key_id, public_key, self.key_cache_size)
+        return public_key
+
+    def supports(self, signature_algorithm: algos.SignedDigestAlgorithm):
+        try:
+            signature_algo = signature_algorithm.signature_algo
+        except ValueError:
+            return False
+        if signature_algo != 'rsassa_pss':
+            return signature_algo in ('rsassa_pkcs1v15', 'ecdsa', 'dsa')
+        # oscrypto only does PSS with MGF1 using the same digest as the
+        #  signature, and with a salt as long as that digest
+        params = signature_algorithm['parameters']
+        hash_algo = params['hash_algorithm']['algorithm'].native
+        mgf = params['mask_gen_algorithm']
+        return (
+            mgf['algorithm'].native == 'mgf1'
+            and mgf['parameters']['algorithm'].native == hash_algo
+            and params['salt_length'].native
+            == hashlib.new(hash_algo).digest_size
+        )
+
+    def check_supported(self, signature_algorithm):
+        if not self.supports(signature_algorithm):
+            raise NotImplementedError(
+                'Signature mechanism %s is not currently supported'
+                % signature_algorithm['algorithm'].native
+            )
+
+    def verify_raw(self, public_key, signed_data: bytes, signature: bytes,
+                   signature_algorithm: algos.SignedDigestAlgorithm,
+                   md_algorithm: str):
+        """
+        Verify a signature, raising
+        :class:`~oscrypto.errors.SignatureError` if it's not valid.
+        """
+        try:
+            verify_md = signature_algorithm.hash_algo
+        except ValueError:
+            verify_md = md_algorithm
+        signature_algo = signature_algorithm.signature_algo
+        if signature_algo == 'rsassa_pkcs1v15':
+            verify = asymmetric.rsa_pkcs1v15_verify
+        elif signature_algo == 'rsassa_pss':
+            verify = asymmetric.rsa_pss_verify
+        elif signature_algo == 'ecdsa':
+            verify = asymmetric.ecdsa_verify
+        elif signature_algo == 'dsa':
+            verify = asymmetric.dsa_verify
+        else:
+            raise NotImplementedError
+        verify(public_key, signature, signed_data, hash_algorithm=verify_md)
+
+    def verify(self, public_key_info: keys.PublicKeyInfo, signed_data: bytes,
+               signature: bytes,
+               signature_algorithm: algos.SignedDigestAlgorithm,
+               md_algorithm: str) -> bool:
+        """
+        Check whether a signature is valid.
+
+        :param public_key_info:
+            The signer's public key.
+        :param signed_data:
+            The signed data (typically the signed attributes).
+        :param signature:
+            The signature.
+        :param signature_algorithm:
+            The signature algorithm from the signer info.
+        :param md_algorithm:
+            The digest algorithm from the signer info, used if the signature
+            algorithm doesn't specify one.
+        :return:
+            ``True`` if the signature is valid, ``False`` otherwise.
+        """
+        result_key = None
+        if self.memoise_results:
+            h = hashlib.sha256()
+            for part in (public_key_info.dump(), signature_algorithm.dump(),
+                         md_algorithm.encode('ascii'), signed_data,
+                         signature):
+                h.update(len(part).to_bytes(8, 'big'))
+                h.update(part)
+            result_key = h.digest()
+            with self._lock:
+                try:
+                    result = self._results[result_key]
+                    self._results.move_to_end(result_key)
+                    return result
+                except KeyError:
+                    pass
+        try:
+            self.verify_raw(
+                self.load_public_key(public_key_info), signed_data,
+                signature, signature_algorithm, md_algorithm
+            )
+            result = True
+        except SignatureError:
+            result = False
+        if result_key is not None:
+            with self._lock:
+                _lru_put(
+                    self._results, result_key, result, self.result_cache_size
+                )
+        return result
+
+
+# public keys are fair game for sharing, verification results less so
+DEFAULT_VERIFIER = SignatureVerifier()
+
+
 StatusType = TypeVar('StatusType', bound=SignatureStatus)
 
 
@@ -82,7 +253,10 @@ def _validate_cms_signature(signed_data: cms.SignedData,
                             status_cls: Type[StatusType] = SignatureStatus,
                             raw_digest: bytes = None,
                             validation_context: ValidationContext = None,
-                            status_kwargs: dict = None):
+                            status_kwargs: dict = None,
+                            path_cache: ValidationPathCache = None,
+                            verifier: 'SignatureVerifier' = None,
+                            result_store: ValidationResultStore = None):
     """
     Validate CMS and PKCS#7 signatures.
     """
@@ -125,56 +299,106 @@ def _validate_cms_signature(signed_data: cms.SignedData,
         raise SignatureValidationError('Message digest not found in signature')
     intact = raw_digest == embedded_digest[0].native
 
-    # finally validate the signature
-    if mechanism not in MECHANISMS:
-        raise NotImplementedError(
-            'Signature mechanism %s is not currently supported'
-            % mechanism
+    status_kwargs = status_kwargs or {}
+    status_kwargs.update(
+        ca_chain=ca_chain, signing_cert=cert, md_algorithm=md_algorithm,
+        pkcs7_signature_mechanism=mechanism
+    )
+    result_key = None
+    # noinspection PyProtectedMember
+    if result_store is not None and validation_context is not None and (
+            result_store.include_fetched
+            or not validation_context._allow_fetching):
+        result_key = _signature_result_key(
+            signed_data, raw_digest, status_cls, validation_context
         )
-
-    valid = False
-    if intact:
-        try:
-            try:
-                verify_md = signature_algorithm.hash_algo
-            except ValueError:
-                verify_md = md_algorithm
-            asymmetric.rsa_pkcs1v15_verify(
-                asymmetric.load_public_key(cert.public_key), signature,
-                signed_blob, hash_algorithm=verify_md
+        entry = result_store.get_signature_result(
+            result_key, validation_context.moment
+        )
+        stored_path = None if entry is None else entry.validation_path()
+        # the stored verdict might rely on intermediate certificates that
+        # aren't around anymore
+        if stored_path is not None and not path_is_available(
+                stored_path, validation_context, ca_chain):
+            entry = None
+        if entry is not None:
+            status_kwargs.update(
+                intact=intact, valid=entry.valid, revoked=entry.revoked,
+                usage_ok=entry.usage_ok, trusted=entry.trusted,
+                validation_path=stored_path
             )
-            valid = True
-        except SignatureError:
-            valid = False
+            return status_kwargs
+
+    # finally validate the signature
+    verifier = verifier or DEFAULT_VERIFIER
+    verifier.check_supported(signature_algorithm)
+    valid = intact and verifier.verify(
+        cert.public_key, signed_blob, signature, signature_algorithm,
+        md_algorithm
+    )
 
     trusted = revoked = usage_ok = False
     path = None
     if valid:
-        validator = CertificateValidator(
-            cert, intermediate_certs=ca_chain,
-            validation_context=validation_context
-        )
+        if path_cache is not None:
+            validator = path_cache.validator(
+                cert, intermediate_certs=ca_chain,
+                validation_context=validation_context
+            )
+        else:
+            validator = CertificateValidator(
+                cert, intermediate_certs=ca_chain,
+                validation_context=validation_context
+            )
         trusted, revoked, usage_ok, path = \
             status_cls.validate_cert_usage(validator)
+        if trusted and path_cache is not None:
+            path_cache.put(cert, validation_context, path)
+
+    # A signature that validates, but can't be traced back to a trust root
+    # might validate later on, e.g. when more intermediate certs are
+    # available or revocation info can be fetched again, so we don't want to
+    # remember that.
+    if result_key is not None and not (valid and not trusted and not revoked):
+        result_store.put_signature_result(result_key, SignatureResultEntry(
+            intact=intact, valid=valid, trusted=trusted, revoked=revoked,
+            usage_ok=usage_ok, path=list(path) if path is not None else [],
+            moment=validation_context.moment
+        ))
 
-    status_kwargs = status_kwargs or {}
     status_kwargs.update(
-        intact=intact, ca_chain=ca_chain, valid=valid, signing_cert=cert,
-        md_algorithm=md_algorithm, pkcs7_signature_mechanism=mechanism,
-        revoked=revoked, usage_ok=usage_ok, trusted=trusted,
-        validation_path=path
+        intact=intact, valid=valid, revoked=revoked, usage_ok=usage_ok,
+        trusted=trusted, validation_path=path
     )
     return status_kwargs
 
 
+def _signature_result_key(signed_data: cms.SignedData, raw_digest,
+                          status_cls, validation_context) -> bytes:
+    # The outcome of validating a signature is determined by the signature
+    # itself (including the certificates it supplies), the data it covers,
+    # the status class (which determines the key usage requirements) and the
+    # trust settings. The validation time is dealt with by the result store,
+    # and other intermediate certificates by checking the stored path.
+    md = hashlib.sha256()
+    for part in (status_cls.__name__.encode('ascii'), signed_data.dump(),
+                 raw_digest, trust_fingerprint(validation_context)):
+        md.update(hashlib.sha256(part).digest())
+    return md.digest()
+
+
 def validate_cms_signature(signed_data: cms.SignedData,
                            status_cls: Type[StatusType] = SignatureStatus,
                            raw_digest: bytes = None,
                            validation_context: ValidationContext = None,
-                           status_kwargs: dict = None):
+                           status_kwargs: dict = None,
+                           path_cache: ValidationPathCache = None,
+                           verifier: 'SignatureVerifier' = None,
+                           result_store: ValidationResultStore = None):
     status_kwargs = _validate_cms_signature(
         signed_data, status_cls, raw_digest, validation_context,
-        status_kwargs
+        status_kwargs, path_cache=path_cache, verifier=verifier,
+        result_store=result_store
     )
     return status_cls(**status_kwargs)
 
@@ -301,11 +525,6 @@ class PdfSignatureStatus(SignatureStatus):
             )
 
 
-MECHANISMS = (
-    'rsassa_pkcs1v15', 'sha1_rsa', 'sha256_rsa', 'sha384_rsa', 'sha512_rsa'
-)
-
-
 def _extract_docmdp_for_sig(signature_obj) -> Optional[MDPPerm]:
     # all queries are raw because we don't want to trigger object resolution
     #  (this has to work for historic queries as well, and signature_obj
@@ -329,11 +548,148 @@ class SuspiciousModification(ValueError):
     pass
 
 
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+
+def _digest_byte_ranges_sequentially(stream, md_algorithm, byte_range):
+    md = getattr(hashlib, md_algorithm)()
+    # here, we allow arbitrary byte ranges
+    # for the coverage check, we'll impose more constraints
+    for lo, chunk_len in misc.pair_iter(byte_range):
+        stream.seek(lo)
+        md.update(stream.read(chunk_len))
+    return md.digest()
+
+
+def _sorted_ranges(byte_range):
+    # return the byte range as a list of (start, end) pairs, or None if
+    # the ranges can't be processed in a single forward pass
+    ranges = []
+    prev_end = 0
+    for lo, chunk_len in misc.pair_iter(byte_range):
+        if lo < prev_end or chunk_len < 0:
+            return None
+        prev_end = lo + chunk_len
+        ranges.append((lo, prev_end))
+    return ranges
+
+
+def compute_byte_range_digests(stream, digest_specs,
+                               chunk_size=DIGEST_CHUNK_SIZE) -> List[bytes]:
+    """
+    Compute the digests of several byte ranges in the same file, reading
+    the file only once.
+
+    Signatures in an incrementally updated file typically cover nested
+    prefixes of it, so all byte ranges starting at the beginning of the file
+    share a common prefix hash. The file is streamed once through one hasher
+    per digest algorithm, which is forked (using ``.copy()``) at the end of
+    each signature's first range. From then on, the forked hasher is only fed
+    the rest of that signature's byte range.
+
+    Byte ranges that can't be processed in a single forward pass (i.e. with
+    overlapping or out-of-order ranges) are hashed separately.
+
+    :param stream:
+        The file to read from.
+    :param digest_specs:
+        Pairs of digest algorithm names and byte ranges (as in /ByteRange).
+    :param chunk_size:
+        Size of the blocks in which the file is read.
+    :return:
+        A list of digests, in the same order as ``digest_specs``.
+    """
+    digest_specs = list(digest_specs)
+    results: List[Optional[bytes]] = [None] * len(digest_specs)
+    # fork offset -> list of (result index, algorithm, remaining ranges)
+    forks = {}
+    # hashers that are fed only the ranges they still need, as
+    #  [result index, hasher, remaining ranges]
+    active = []
+    prefix_hashers = {}
+    end = 0
+    for ix, (md_algorithm, byte_range) in enumerate(digest_specs):
+        ranges = _sorted_ranges(byte_range)
+        if ranges is None:
+            results[ix] = _digest_byte_ranges_sequentially(
+                stream, md_algorithm, byte_range
+            )
+            continue
+        if ranges:
+            end = max(end, ranges[-1][1])
+        if ranges and ranges[0][0] == 0:
+            fork_at = ranges[0][1]
+            forks.setdefault(fork_at, []).append(
+                (ix, md_algorithm, ranges[1:])
+            )
+            if md_algorithm not in prefix_hashers:
+                prefix_hashers[md_algorithm] = getattr(hashlib, md_algorithm)()
+        else:
+            md = getattr(hashlib, md_algorithm)()
+            active.append([ix, md, ranges])
+    last_fork = max(forks, default=0)
+
+    def _fork(offset):
+        for ix_, algo, rest in forks.pop(offset, ()):
+            active.append([ix_, prefix_hashers[algo].copy(), rest])
+
+    def _feed_active(seg_lo, data):
+        seg_hi = seg_lo + len(data)
+        for entry in active:
+            ranges_ = entry[2]
+            while ranges_ and ranges_[0][0] < seg_hi:
+                lo, hi = ranges_[0]
+                if hi > seg_lo:
+                    entry[1].update(
+                        data[max(lo, seg_lo) - seg_lo:min(hi, seg_hi) - seg_lo]
+                    )
+                if hi > seg_hi:
+                    break
+                del ranges_[0]
+
+    _fork(0)
+    # fork points in ascending order
+    fork_points = sorted(forks)
+    pos = 0
+    stream.seek(0)
+    while pos < end:
+        block = stream.read(min(chunk_size, end - pos))
+        if not block:
+            break
+        block = memoryview(block)
+        block_start = pos
+        block_end = pos + len(block)
+        # split the block at fork points, so the prefix hashers are in the
+        # right state when forking
+        while pos < block_end:
+            while fork_points and fork_points[0] <= pos:
+                fork_points.pop(0)
+            seg_end = min(block_end, fork_points[0]) if fork_points \
+                else block_end
+            segment = block[pos - block_start:seg_end - block_start]
+            if pos < last_fork:
+                for md in prefix_hashers.values():
+                    md.update(segment)
+            _feed_active(pos, segment)
+            pos = seg_end
+            _fork(pos)
+
+    # the file is shorter than some of the byte ranges claim
+    #  -> hash whatever is there, like a sequential read would
+    for fork_at in list(forks):
+        _fork(fork_at)
+    for ix, md, _ in active:
+        results[ix] = md.digest()
+    return results
+
+
 class EmbeddedPdfSignature:
 
     def __init__(self, reader: PdfFileReader,
-                 sig_object: generic.DictionaryObject):
+                 sig_object: generic.DictionaryObject,
+                 diff_cache: 'RevisionDiffCache' = None):
         self.reader = reader
+        self.diff_cache = diff_cache or RevisionDiffCache(reader)
 
         if isinstance(sig_object, generic.IndirectObject):
             sig_object = sig_object.get_object()
@@ -397,10 +753,9 @@ class EmbeddedPdfSignature:
             pass
 
     def compute_integrity_info(self):
-        self.compute_digest()
-
-        # TODO in scenarios where we have to verify multiple signatures, we're
-        #  doing a lot of double work here. This could be improved.
+        # the digest may have been computed in bulk already
+        if self.raw_digest is None:
+            self.compute_digest()
         self.coverage = self.evaluate_signature_coverage()
         self.modification_level = self.evaluate_modifications()
 
@@ -430,19 +785,9 @@ class EmbeddedPdfSignature:
         return docmdp
 
     def compute_digest(self):
-        md = getattr(hashlib, self.md_algorithm)()
-        stream = self.reader.stream
-
-        # compute the digest
-        # here, we allow arbitrary byte ranges
-        # for the coverage check, we'll impose more constraints
-        total_len = 0
-        for lo, chunk_len in misc.pair_iter(self.byte_range):
-            stream.seek(lo)
-            md.update(stream.read(chunk_len))
-            total_len += chunk_len
-
-        self.raw_digest = md.digest()
+        self.raw_digest, = compute_byte_range_digests(
+            self.reader.stream, [(self.md_algorithm, self.byte_range)]
+        )
 
     def evaluate_signature_coverage(self):
 
@@ -529,96 +874,435 @@ class EmbeddedPdfSignature:
         return current_max
 
     def _mod_level_for_revision(self, revision) -> ModificationLevel:
-        # refs in this set are cleared at level LTA_UPDATES
-        explained_refs_lta = set()
-        # refs in this set are cleared at level FORM_FILLING
-        explained_refs_formfill = set()
-        signed_revision = self.signed_revision
-        signed_root = self.reader.get_historical_root(signed_revision)
-        current_root = self.reader.get_historical_root(revision)
-
-        signed_resolver = self.reader.get_historical_resolver(signed_revision)
-        current_resolver = self.reader.get_historical_resolver(revision)
-
-        whitelist_lta_if_fresh = _whitelist_callback(
-            explained_refs_lta, signed_revision, self.reader.xrefs
+        return self.diff_cache.mod_level(self.signed_revision, revision)
+
+
+class RevisionDiffCache:
+    """
+    Remembers the outcome of comparing a signed revision of a document with a
+    later revision, so that validating the same signature again doesn't diff
+    the same pair of revisions twice. Different signatures cover different
+    revisions, so they never share a pair: within a single validation run,
+    the cache doesn't save any diffs.
+
+    Suspicious modifications are cached as well, and re-raised on every
+    lookup.
+
+    The form field tree and page tree of every signed revision are indexed
+    once (see :class:`_SignedRevisionIndex`), which allows the diff to skip
+    all fields and pages that don't involve any of the objects changed since
+    the signed revision. Those objects are accumulated as the later
+    revisions are compared in order, instead of being collected from scratch
+    for every pair.
+
+    If a :class:`~pdfstamp.sign.cache.ValidationResultStore` is provided,
+    outcomes are also persisted there, keyed by the positions of both
+    revisions and a digest of the file up to the end of the later one.
+    Since incremental updates never touch the existing part of the file,
+    a document that gained a revision only needs the new revision to be
+    analysed.
+    """
+
+    def __init__(self, reader: PdfFileReader,
+                 result_store: ValidationResultStore = None):
+        self.reader = reader
+        self.result_store = result_store
+        self._results = {}
+        self._indexes = {}
+        # signed revision -> (last revision seen, refs changed up to there)
+        self._changed_refs = {}
+        self.prefix_digests = None
+
+    def _index_for(self, signed_revision) -> '_SignedRevisionIndex':
+        try:
+            return self._indexes[signed_revision]
+        except KeyError:
+            index = _SignedRevisionIndex(self.reader, signed_revision)
+            self._indexes[signed_revision] = index
+            return index
+
+    def delta(self, signed_revision, revision) -> '_RevisionDelta':
+        """
+        Collect the objects changed between a signed revision and a later
+        one, together with the fields and pages that depend on them.
+        """
+        last, changed_refs = self._changed_refs.get(
+            signed_revision, (signed_revision, frozenset())
         )
-        # we're about to vet changes to the root, so this object ID
-        #  will be whitelisted when we go over object updates later.
-        current_root_ref = current_root.get_container_ref()
-        if current_root_ref != signed_root.get_container_ref():
-            # The document catalog has a different ID now. Weird, but OK.
-            # Do check that it doesn't clobber an existing object, though.
-            whitelist_lta_if_fresh(current_root_ref)
+        if revision < last:
+            last, changed_refs = signed_revision, frozenset()
+        xrefs = self.reader.xrefs
+        for rev in range(last + 1, revision + 1):
+            changed_refs = changed_refs | xrefs.explicit_refs_in_revision(rev)
+        self._changed_refs[signed_revision] = (revision, changed_refs)
+        return _RevisionDelta(self._index_for(signed_revision), changed_refs)
+
+    def revision_prefix_ranges(self):
+        """
+        Return byte ranges covering the file up to the end of every revision,
+        for revisions whose end can be located.
+        """
+        ranges = {}
+        for revision in range(self.reader.xrefs.total_revisions):
+            end = _revision_end(self.reader, revision)
+            if end is not None:
+                ranges[revision] = [0, end]
+        return ranges
+
+    def _stored_result_key(self, signed_revision, revision):
+        if self.prefix_digests is None:
+            ranges = self.revision_prefix_ranges()
+            digests = compute_byte_range_digests(
+                self.reader.stream,
+                [('sha256', byte_range) for byte_range in ranges.values()]
+            )
+            self.prefix_digests = dict(zip(ranges.keys(), digests))
+        try:
+            prefix_digest = self.prefix_digests[revision]
+        except KeyError:
+            return None
+        xrefs = self.reader.xrefs
+        return b'%d:%d:%d:' % (
+            REVISION_DIFF_VERSION,
+            xrefs.get_startxref_for_revision(signed_revision),
+            xrefs.get_startxref_for_revision(revision)
+        ) + prefix_digest
+
+    def _load_result(self, stored_key):
+        stored = self.result_store.get_revision_diff(stored_key)
+        if stored is None:
+            return None
+        if 'suspicious' in stored:
+            return SuspiciousModification(stored['suspicious'])
+        try:
+            return ModificationLevel[stored['level']]
+        except KeyError:
+            return None
+
+    def _store_result(self, stored_key, result):
+        if isinstance(result, SuspiciousModification):
+            self.result_store.put_revision_diff(
+                stored_key, suspicious=str(result)
+            )
         else:
-            explained_refs_lta.add(current_root_ref)
+            self.result_store.put_revision_diff(stored_key, level=result.name)
 
-        # first, check if the keys in the document catalog are unchanged
-        _compare_dicts(signed_root, current_root, {'/AcroForm', '/DSS'})
+    def mod_level(self, signed_revision, revision) -> ModificationLevel:
+        key = (signed_revision, revision)
+        try:
+            result = self._results[key]
+        except KeyError:
+            stored_key = result = None
+            if self.result_store is not None:
+                stored_key = self._stored_result_key(signed_revision, revision)
+                if stored_key is not None:
+                    result = self._load_result(stored_key)
+            if result is None:
+                try:
+                    result = _diff_revisions(
+                        self.reader, signed_revision, revision,
+                        delta=self.delta(signed_revision, revision)
+                    )
+                except SuspiciousModification as e:
+                    result = e
+                if stored_key is not None:
+                    self._store_result(stored_key, result)
+            self._results[key] = result
+        if isinstance(result, SuspiciousModification):
+            raise result
+        return result
+
+
+# bump this when changing the rules for comparing revisions, to make sure
+# stale results in result stores are ignored
+REVISION_DIFF_VERSION = 1
+
+# how far to look past the end of an xref container for the EOF marker
+REVISION_TAIL_SCAN_LIMIT = 64 * 1024
+
+
+def _revision_end(reader: PdfFileReader, revision) -> Optional[int]:
+    # Find the end of the EOF marker that terminates a revision, i.e. the
+    # first one after the revision's xref container that's preceded by the
+    # startxref value pointing to that container.
+    xrefs = reader.xrefs
+    stream = reader.stream
+    _, container_end = xrefs.get_xref_container_info(revision)
+    expected = xrefs.get_startxref_for_revision(revision)
+    stream.seek(container_end)
+    tail = stream.read(REVISION_TAIL_SCAN_LIMIT)
+    pos = tail.find(b'%%EOF')
+    while pos != -1:
+        end = container_end + pos + 5
+        stream.seek(end)
+        try:
+            if process_data_at_eof(stream) == expected:
+                return end
+        except (misc.PdfReadError, ValueError):
+            pass
+        pos = tail.find(b'%%EOF', pos + 1)
+    return None
 
-        # Now we compare the /AcroForm entries
-        signed_acroform, current_acroform = _compare_key_refs(
-            '/AcroForm', signed_root, current_root,
-            signed_resolver, current_resolver, explained_refs_lta
-        )
 
-        # first, compare the entries that aren't /Fields
-        _compare_dicts(signed_acroform, current_acroform, {'/Fields'})
+class _SignedRevisionIndex:
+    """
+    Reverse reference index of the form fields and pages in a signed
+    revision: for every object that the diff engine would look at while
+    processing a form field (or the /Annots of a page), it records which
+    fields (resp. pages) refer to it.
 
-        # next, walk the field tree, and collect newly added signature fields
-        new_sigfield_refs = set(_diff_field_tree(
-            signed_acroform.raw_get('/Fields'),
-            current_acroform.raw_get('/Fields'),
-            signed_resolver, current_resolver, explained_refs_lta,
-            explained_refs_formfill
-        ))
+    Fields that couldn't be indexed properly are left out, and their parents
+    are marked as opaque. Both are always processed in full.
+    """
 
-        # for the DSS, we only have to be careful not to allow non-DSS
-        # objects to be overridden.
-        #  -> collect refs from both, and whitelist all references in the
-        #  current DSS that either (a) occur in the previous DSS, or (b)
-        #  are fresh.
-        _allow_dict_key_update(
-            signed_root, current_root, '/DSS', signed_resolver,
-            current_resolver, explained_refs_lta, allow_removal=False
-        )
+    def __init__(self, reader: PdfFileReader, signed_revision):
+        # field ref -> (partial name, whether it's a signature field)
+        self.fields = {}
+        # field ref -> refs of the fields whose /Kids list it
+        self.field_parents = defaultdict(set)
+        # object ref -> refs of the fields whose comparison involves it
+        self.field_containers = defaultdict(set)
+        self.opaque_fields = set()
+        # object ref -> refs of the page objects whose /Annots involve it
+        self.page_containers = defaultdict(set)
+
+        resolver = reader.get_historical_resolver(signed_revision)
+        root = reader.get_historical_root(signed_revision)
+        try:
+            acroform = root.raw_get('/AcroForm')
+            if isinstance(acroform, generic.IndirectObject):
+                acroform = resolver(acroform.reference)
+            self._index_fields(resolver, acroform.raw_get('/Fields'), None)
+        except KeyError:
+            pass
+        try:
+            self._index_pages(resolver, root.raw_get('/Pages').reference)
+        except (KeyError, AttributeError, misc.PdfReadError):
+            # the page tree walk will complain about this, if necessary
+            self.page_containers = None
+
+    def _index_fields(self, resolver, field_list, parent):
+        if isinstance(field_list, generic.IndirectObject):
+            field_list = resolver(field_list.reference)
+        for field_ref in field_list:
+            if not isinstance(field_ref, generic.IndirectObject):
+                self.opaque_fields.add(parent)
+                continue
+            ref = field_ref.reference
+            if parent is not None:
+                self.field_parents[ref].add(parent)
+            if ref in self.fields:
+                continue
+            try:
+                self._index_field(resolver, ref)
+            except (KeyError, misc.PdfReadError):
+                if parent is not None:
+                    self.opaque_fields.add(parent)
 
-        # Next, check annotations: newly added signature fields may be added
-        #  to the /Annots entry of any page. These are processed as LTA updates,
-        #  because even invisible signature fields / timestamps are sometimes
-        #  added to /Annots, unnecessary as that may be.
-        # Note: we don't descend into the annotation dictionaries themselves.
-        #  For modifications to form field values, this has been taken care of
-        #  already.
-        # TODO allow other annotation modifications, but at level ANNOTATIONS
-        if new_sigfield_refs:
-            # if no new sigfields were added, we skip this step.
-            #  Any modifications to /Annots will be flagged by the xref
-            #  crawler later.
-
-            # note: this is guaranteed to be equal to its signed counterpart,
-            # since we already checked the document catalog for unauthorised
-            # modifications
+    def _index_field(self, resolver, ref):
+        field = resolver(ref)
+        name = field.raw_get('/T')
+        field_type, lookup_refs = _lookup_field_type(resolver, field, name)
+        # the refs the field diff would explain or resolve
+        involved_refs = {ref}
+        involved_refs.update(lookup_refs)
+        for key in ('/V', '/AP', '/AS'):
+            try:
+                value = field.raw_get(key)
+            except KeyError:
+                continue
+            involved_refs.update(resolver.collect_indirect_references(value))
+        try:
+            kids = field.raw_get('/Kids')
+        except KeyError:
+            kids = None
+        if isinstance(kids, generic.IndirectObject):
+            involved_refs.add(kids.reference)
+        for involved_ref in involved_refs:
+            self.field_containers[involved_ref].add(ref)
+        is_sig = field_type == '/Sig'
+        self.fields[ref] = (name, is_sig)
+        # the field diff doesn't descend into signature fields
+        if kids is not None and not is_sig:
+            self._index_fields(resolver, kids, ref)
+
+    def _index_pages(self, resolver, page_tree_ref):
+        pages_obj = resolver(page_tree_ref)
+        kids = pages_obj.raw_get('/Kids')
+        if isinstance(kids, generic.IndirectObject):
+            kids = resolver(kids.reference)
+        for kid in kids:
+            kid_ref = kid.reference
+            kid_obj = resolver(kid_ref)
+            node_type = kid_obj['/Type']
+            if node_type == '/Pages':
+                self._index_pages(resolver, kid_ref)
+            elif node_type == '/Page':
+                self.page_containers[kid_ref].add(kid_ref)
+                try:
+                    annots = kid_obj.raw_get('/Annots')
+                except KeyError:
+                    continue
+                if isinstance(annots, generic.IndirectObject):
+                    self.page_containers[annots.reference].add(kid_ref)
+
+    def affected_fields(self, changed_refs):
+        """
+        Determine the fields that have to be compared, given a set of
+        changed objects. These are the fields involving any of the changed
+        objects, the opaque fields, and all their ancestors.
+        """
+        containers = self.field_containers
+        todo = list(self.opaque_fields)
+        for ref in changed_refs:
+            todo.extend(containers.get(ref, ()))
+        affected = set()
+        while todo:
+            field_ref = todo.pop()
+            if field_ref in affected:
+                continue
+            affected.add(field_ref)
+            todo.extend(self.field_parents.get(field_ref, ()))
+        return affected
+
+    def affected_pages(self, changed_refs):
+        containers = self.page_containers
+        affected = set()
+        for ref in changed_refs:
+            affected.update(containers.get(ref, ()))
+        return sorted(affected, key=lambda r: (r.idnum, r.generation))
+
+
+class _RevisionDelta:
+    """
+    The objects that changed between a signed revision and a later one,
+    and the fields/pages affected by those changes.
+    """
+
+    def __init__(self, index: _SignedRevisionIndex, changed_refs):
+        self.index = index
+        self.changed_refs = changed_refs
+        self.affected_fields = index.affected_fields(changed_refs)
+
+    def field_is_clean(self, ref):
+        """
+        Check whether a field and all of its descendants are identical in
+        both revisions.
+        """
+        return ref in self.index.fields and ref not in self.affected_fields
+
+    @property
+    def can_skip_page_tree(self):
+        return self.index.page_containers is not None
+
+    def affected_pages(self):
+        return self.index.affected_pages(self.changed_refs)
+
+
+def _diff_revisions(reader: PdfFileReader, signed_revision, revision,
+                    delta: _RevisionDelta = None) -> ModificationLevel:
+    # If delta is provided, only the fields and pages affected by the
+    # objects changed since the signed revision are compared. Everything
+    # else is identical in both revisions, so it can't contain anything
+    # suspicious, nor anything that needs to be explained.
+    # refs in this set are cleared at level LTA_UPDATES
+    explained_refs_lta = set()
+    # refs in this set are cleared at level FORM_FILLING
+    explained_refs_formfill = set()
+    signed_root = reader.get_historical_root(signed_revision)
+    current_root = reader.get_historical_root(revision)
+
+    signed_resolver = reader.get_historical_resolver(signed_revision)
+    current_resolver = reader.get_historical_resolver(revision)
+
+    whitelist_lta_if_fresh = _whitelist_callback(
+        explained_refs_lta, signed_revision, reader.xrefs
+    )
+    # we're about to vet changes to the root, so this object ID
+    #  will be whitelisted when we go over object updates later.
+    current_root_ref = current_root.get_container_ref()
+    if current_root_ref != signed_root.get_container_ref():
+        # The document catalog has a different ID now. Weird, but OK.
+        # Do check that it doesn't clobber an existing object, though.
+        whitelist_lta_if_fresh(current_root_ref)
+    else:
+        explained_refs_lta.add(current_root_ref)
+
+    # first, check if the keys in the document catalog are unchanged
+    _compare_dicts(signed_root, current_root, {'/AcroForm', '/DSS'})
+
+    # Now we compare the /AcroForm entries
+    signed_acroform, current_acroform = _compare_key_refs(
+        '/AcroForm', signed_root, current_root,
+        signed_resolver, current_resolver, explained_refs_lta
+    )
+
+    # first, compare the entries that aren't /Fields
+    _compare_dicts(signed_acroform, current_acroform, {'/Fields'})
+
+    # next, walk the field tree, and collect newly added signature fields
+    new_sigfield_refs = set(_diff_field_tree(
+        signed_acroform.raw_get('/Fields'),
+        current_acroform.raw_get('/Fields'),
+        signed_resolver, current_resolver, explained_refs_lta,
+        explained_refs_formfill, delta=delta
+    ))
+
+    # for the DSS, we only have to be careful not to allow non-DSS
+    # objects to be overridden.
+    #  -> collect refs from both, and whitelist all references in the
+    #  current DSS that either (a) occur in the previous DSS, or (b)
+    #  are fresh.
+    _allow_dict_key_update(
+        signed_root, current_root, '/DSS', signed_resolver,
+        current_resolver, explained_refs_lta, allow_removal=False
+    )
+
+    # Next, check annotations: newly added signature fields may be added
+    #  to the /Annots entry of any page. These are processed as LTA updates,
+    #  because even invisible signature fields / timestamps are sometimes
+    #  added to /Annots, unnecessary as that may be.
+    # Note: we don't descend into the annotation dictionaries themselves.
+    #  For modifications to form field values, this has been taken care of
+    #  already.
+    # TODO allow other annotation modifications, but at level ANNOTATIONS
+    if new_sigfield_refs:
+        # if no new sigfields were added, we skip this step.
+        #  Any modifications to /Annots will be flagged by the xref
+        #  crawler later.
+
+        # note: this is guaranteed to be equal to its signed counterpart,
+        # since we already checked the document catalog for unauthorised
+        # modifications
+        if delta is not None and delta.can_skip_page_tree:
+            # only pages that were changed themselves (or whose /Annots
+            # array was changed) can have acquired new annotations
+            for page_ref in delta.affected_pages():
+                _diff_page_annots(
+                    page_ref, signed_resolver(page_ref), new_sigfield_refs,
+                    signed_resolver, current_resolver, explained_refs_lta
+                )
+        else:
             current_page_root = current_root.raw_get('/Pages').reference
             _walk_page_tree_annots(
                 current_page_root, new_sigfield_refs, signed_resolver,
                 current_resolver, explained_refs_lta
             )
 
-        # finally, verify that there are no xrefs in the revision's xref table
-        # other than the ones we can justify.
-        new_xrefs = self.reader.xrefs.explicit_refs_in_revision(revision)
-        unexplained_lta = new_xrefs - explained_refs_lta
-        unexplained_formfill = unexplained_lta - explained_refs_formfill
-        if unexplained_formfill:
-            raise SuspiciousModification(
-                f"There are unexplained xrefs in revision {revision}: "
-                f"{', '.join(repr(x) for x in unexplained_formfill)}."
-            )
-        elif unexplained_lta:
-            return ModificationLevel.FORM_FILLING
-        else:
-            return ModificationLevel.LTA_UPDATES
+    # finally, verify that there are no xrefs in the revision's xref table
+    # other than the ones we can justify.
+    new_xrefs = reader.xrefs.explicit_refs_in_revision(revision)
+    unexplained_lta = new_xrefs - explained_refs_lta
+    unexplained_formfill = unexplained_lta - explained_refs_formfill
+    if unexplained_formfill:
+        raise SuspiciousModification(
+            f"There are unexplained xrefs in revision {revision}: "
+            f"{', '.join(repr(x) for x in unexplained_formfill)}."
+        )
+    elif unexplained_lta:
+        return ModificationLevel.FORM_FILLING
+    else:
+        return ModificationLevel.LTA_UPDATES
 
 
 def _walk_page_tree_annots(page_root_ref, new_sigfield_refs, signed_resolver,
@@ -647,52 +1331,60 @@ def _walk_page_tree_annots(page_root_ref, new_sigfield_refs, signed_resolver,
                 explained_refs
             )
         elif node_type == '/Page':
-            current_kid = current_resolver(kid_ref)
-            current_annots_ref = None
-            try:
-                current_annots = current_kid.raw_get('/Annots')
-                if isinstance(current_annots, generic.IndirectObject):
-                    current_annots_ref = current_annots.reference
-                    current_annots = current_resolver(current_annots_ref)
-                current_annots = set(c.reference for c in current_annots)
-            except KeyError:
-                # no annotations, continue
-                continue
-            signed_annots = signed_kid.raw_get('/Annots')
-            signed_annots_ref = None
-            if isinstance(signed_annots, generic.IndirectObject):
-                signed_annots_ref = signed_annots.reference
-                signed_annots = signed_resolver(signed_annots.reference)
-            signed_annots = set(c.reference for c in signed_annots)
-
-            # check if annotations were added
-            if not (signed_annots <= current_annots):
-                continue
-            annots_diff = current_annots - signed_annots
-            if not annots_diff or not (annots_diff <= new_sigfield_refs):
-                continue
-            # there are new annotations, and they're all for new
-            # signature fields. => cleared to edit
-            # Make sure the page dictionaries are the same, so that we
-            #  can safely clear them for modification
-            #  (not necessary if both /Annots entries are indirect references,
-            #   but adding even more cases is pushing things)
-            _compare_dicts(signed_kid, current_kid, {'/Annots'})
-            explained_refs.add(kid_ref)
-            if current_annots_ref:
-                # current /Annots entry is an indirect reference
-                if signed_annots_ref == current_annots_ref:
-                    explained_refs.add(current_annots_ref)
-                else:
-                    # either the /Annots array got reassigned to another
-                    # object ID, or it was moved from a direct object to an
-                    # indirect one. This is fine, provided that the new  object
-                    # ID doesn't clobber an existing one.
-                    whitelist_if_fresh = _whitelist_callback(
-                        explained_refs, signed_resolver.revision,
-                        signed_resolver.reader.xrefs
-                    )
-                    whitelist_if_fresh(current_annots_ref)
+            _diff_page_annots(
+                kid_ref, signed_kid, new_sigfield_refs, signed_resolver,
+                current_resolver, explained_refs
+            )
+
+
+def _diff_page_annots(kid_ref, signed_kid, new_sigfield_refs, signed_resolver,
+                      current_resolver, explained_refs):
+    current_kid = current_resolver(kid_ref)
+    current_annots_ref = None
+    try:
+        current_annots = current_kid.raw_get('/Annots')
+        if isinstance(current_annots, generic.IndirectObject):
+            current_annots_ref = current_annots.reference
+            current_annots = current_resolver(current_annots_ref)
+        current_annots = set(c.reference for c in current_annots)
+    except KeyError:
+        # no annotations, nothing to do
+        return
+    signed_annots = signed_kid.raw_get('/Annots')
+    signed_annots_ref = None
+    if isinstance(signed_annots, generic.IndirectObject):
+        signed_annots_ref = signed_annots.reference
+        signed_annots = signed_resolver(signed_annots.reference)
+    signed_annots = set(c.reference for c in signed_annots)
+
+    # check if annotations were added
+    if not (signed_annots <= current_annots):
+        return
+    annots_diff = current_annots - signed_annots
+    if not annots_diff or not (annots_diff <= new_sigfield_refs):
+        return
+    # there are new annotations, and they're all for new
+    # signature fields. => cleared to edit
+    # Make sure the page dictionaries are the same, so that we
+    #  can safely clear them for modification
+    #  (not necessary if both /Annots entries are indirect references,
+    #   but adding even more cases is pushing things)
+    _compare_dicts(signed_kid, current_kid, {'/Annots'})
+    explained_refs.add(kid_ref)
+    if current_annots_ref:
+        # current /Annots entry is an indirect reference
+        if signed_annots_ref == current_annots_ref:
+            explained_refs.add(current_annots_ref)
+        else:
+            # either the /Annots array got reassigned to another
+            # object ID, or it was moved from a direct object to an
+            # indirect one. This is fine, provided that the new  object
+            # ID doesn't clobber an existing one.
+            whitelist_if_fresh = _whitelist_callback(
+                explained_refs, signed_resolver.revision,
+                signed_resolver.reader.xrefs
+            )
+            whitelist_if_fresh(current_annots_ref)
 
 
 # mark a dictionary key in a revision as safely updatable.
@@ -746,37 +1438,49 @@ def _allow_dict_key_update(signed_dict, current_dict, key,
 # TODO confirm the rules on name uniqueness
 #  (in particular for things like choice fields, where there are potentially
 #   multiple widgets)
-def _split_sig_fields(resolver, field_list):
+def _split_sig_fields(resolver, field_list, delta=None):
     sig_fields = {}
     other_fields = {}
     for field_ref in field_list:
         assert isinstance(field_ref, generic.IndirectObject)
-        # look up the field type by moving up the hierarchy
-        _field = field = resolver(field_ref)
-        name = field.raw_get('/T')
-        while True:
-            try:
-                ft = _field.raw_get('/FT')
-                break
-            except KeyError:
-                try:
-                    parent_ref = _field.raw_get('/Parent')
-                except KeyError:  # pragma: nocover
-                    raise misc.PdfReadError(
-                        f"Could not resolve /FT attribute for field {name}."
-                    )
-                _field = resolver(parent_ref)
-        if ft == '/Sig':
-            sig_fields[name] = field_ref.reference
+        ref = field_ref.reference
+        if delta is not None and delta.field_is_clean(ref):
+            name, is_sig = delta.index.fields[ref]
+        else:
+            field = resolver(field_ref)
+            name = field.raw_get('/T')
+            ft, _ = _lookup_field_type(resolver, field, name)
+            is_sig = ft == '/Sig'
+        if is_sig:
+            sig_fields[name] = ref
         else:
-            other_fields[name] = field_ref.reference
+            other_fields[name] = ref
     return sig_fields, other_fields
 
 
+def _lookup_field_type(resolver, field, name):
+    # look up the field type by moving up the hierarchy, and keep track
+    # of the refs we passed through on the way
+    parent_refs = []
+    while True:
+        try:
+            return field.raw_get('/FT'), parent_refs
+        except KeyError:
+            try:
+                parent_ref = field.raw_get('/Parent')
+            except KeyError:  # pragma: nocover
+                raise misc.PdfReadError(
+                    f"Could not resolve /FT attribute for field {name}."
+                )
+            if isinstance(parent_ref, generic.IndirectObject):
+                parent_refs.append(parent_ref.reference)
+            field = resolver(parent_ref)
+
+
 def _diff_field_tree(signed_fields, current_fields,
                      signed_resolver, current_resolver,
                      explained_refs_lta, explained_refs_formfill,
-                     parent_name=""):
+                     parent_name="", delta: '_RevisionDelta' = None):
     # compare & resolve
     signed_fields, current_fields = _compare_values(
         signed_fields, current_fields, signed_resolver,
@@ -784,9 +1488,9 @@ def _diff_field_tree(signed_fields, current_fields,
     )
     # set signature fields aside for separate processing
     signed_fields_sigfields, signed_fields_other = \
-        _split_sig_fields(signed_resolver, signed_fields)
+        _split_sig_fields(signed_resolver, signed_fields, delta)
     current_fields_sigfields, current_fields_other = \
-        _split_sig_fields(current_resolver, current_fields)
+        _split_sig_fields(current_resolver, current_fields, delta)
 
     # the "other" fields should be matched one-to-one
     nonsig_field_names = set(signed_fields_other.keys())
@@ -798,9 +1502,16 @@ def _diff_field_tree(signed_fields, current_fields,
             }
         )
     for name in nonsig_field_names:
+        signed_ref = signed_fields_other[name]
+        current_ref = current_fields_other[name]
+        if delta is not None and signed_ref == current_ref \
+                and delta.field_is_clean(signed_ref):
+            # nothing in this part of the tree changed since signing, so
+            # there's nothing to compare (or to explain)
+            continue
         fq_name = parent_name + "." + name if parent_name else name
         signed_field, current_field = _diff_field(
-            signed_fields_other[name], current_fields_other[name],
+            signed_ref, current_ref,
             signed_resolver, current_resolver, explained_refs_formfill,
             fq_name=fq_name
         )
@@ -829,7 +1540,7 @@ def _diff_field_tree(signed_fields, current_fields,
             yield from _diff_field_tree(
                 signed_kids, current_kids, signed_resolver,
                 current_resolver, explained_refs_lta, explained_refs_formfill,
-                parent_name=fq_name
+                parent_name=fq_name, delta=delta
             )
         except KeyError:
             pass
@@ -840,6 +1551,10 @@ def _diff_field_tree(signed_fields, current_fields,
         raise SuspiciousModification("Some signature fields were removed.")
 
     for name, sigfield_ref in current_fields_sigfields.items():
+        if delta is not None and name in old_sigfield_set \
+                and signed_fields_sigfields[name] == sigfield_ref \
+                and delta.field_is_clean(sigfield_ref):
+            continue
         fq_name = parent_name + "." + name if parent_name else name
         explained_refs_lta.add(sigfield_ref)
         # The treatment of the value depends on whether it's a document
@@ -1165,29 +1880,53 @@ def _validate_sv_constraints(sig_field, emb_sig: EmbeddedPdfSignature,
             )
 
 
-def validate_pdf_signature(reader: PdfFileReader, sig_field,
-                           signer_validation_context: ValidationContext = None,
-                           ts_validation_context: ValidationContext = None) \
-                           -> PdfSignatureStatus:
+def _get_sig_object(sig_field, check_subfilter=True):
     try:
         sig_object = sig_field.get_object()['/V']
     except KeyError:
         raise SignatureValidationError('Signature is empty')
 
-    # check whether the subfilter type is one we support
-    subfilter_str = sig_object['/SubFilter']
-    try:
-        from pdfstamp.sign.fields import SigSeedSubFilter
-        SigSeedSubFilter(subfilter_str)
-    except ValueError:
-        raise NotImplementedError(
-            "%s is not a recognized SubFilter type." % subfilter_str
-        )
+    if sig_object is None:
+        raise ValueError('Signature is empty')
+
+    if check_subfilter:
+        # check whether the subfilter type is one we support
+        subfilter_str = sig_object['/SubFilter']
+        try:
+            from pdfstamp.sign.fields import SigSeedSubFilter
+            SigSeedSubFilter(subfilter_str)
+        except ValueError:
+            raise NotImplementedError(
+                "%s is not a recognized SubFilter type." % subfilter_str
+            )
+    return sig_object
+
 
+def validate_pdf_signature(reader: PdfFileReader, sig_field,
+                           signer_validation_context: ValidationContext = None,
+                           ts_validation_context: ValidationContext = None,
+                           result_store: ValidationResultStore = None) \
+                           -> PdfSignatureStatus:
+    embedded_sig = EmbeddedPdfSignature(
+        reader, _get_sig_object(sig_field),
+        diff_cache=RevisionDiffCache(reader, result_store=result_store)
+    )
+    return _validate_pdf_signature(
+        sig_field, embedded_sig, signer_validation_context,
+        ts_validation_context, result_store=result_store
+    )
+
+
+def _validate_pdf_signature(sig_field, embedded_sig: EmbeddedPdfSignature,
+                            signer_validation_context: ValidationContext,
+                            ts_validation_context: ValidationContext,
+                            path_cache: ValidationPathCache = None,
+                            verifier: SignatureVerifier = None,
+                            result_store: ValidationResultStore = None) \
+                            -> PdfSignatureStatus:
     if ts_validation_context is None:
         ts_validation_context = signer_validation_context
 
-    embedded_sig = EmbeddedPdfSignature(reader, sig_object)
     status_kwargs = embedded_sig.summarise_integrity_info()
 
     # try to find an embedded timestamp
@@ -1208,7 +1947,8 @@ def validate_pdf_signature(reader: PdfFileReader, sig_field,
         tst_validity = validate_cms_signature(
             tst_signed_data, status_cls=TimestampSignatureStatus,
             validation_context=ts_validation_context,
-            status_kwargs={'timestamp': timestamp}
+            status_kwargs={'timestamp': timestamp}, path_cache=path_cache,
+            verifier=verifier, result_store=result_store
         )
         status_kwargs['timestamp_validity'] = tst_validity
 
@@ -1216,7 +1956,8 @@ def validate_pdf_signature(reader: PdfFileReader, sig_field,
         embedded_sig.signed_data, status_cls=PdfSignatureStatus,
         raw_digest=embedded_sig.raw_digest,
         validation_context=signer_validation_context,
-        status_kwargs=status_kwargs
+        status_kwargs=status_kwargs, path_cache=path_cache,
+        verifier=verifier, result_store=result_store
     )
     timestamp_found = (
         tst_validity is not None
@@ -1247,23 +1988,36 @@ class RevocationInfoValidationType(Enum):
 def validate_pdf_ltv_signature(reader: PdfFileReader, sig_field,
                                validation_type: RevocationInfoValidationType,
                                validation_context_kwargs=None,
-                               force_revinfo=False):
-    validation_context_kwargs = validation_context_kwargs or {}
+                               force_revinfo=False,
+                               result_store: ValidationResultStore = None):
+    embedded_sig = EmbeddedPdfSignature(
+        reader, _get_sig_object(sig_field, check_subfilter=False),
+        diff_cache=RevisionDiffCache(reader, result_store=result_store)
+    )
+    return _validate_pdf_ltv_signature(
+        sig_field, embedded_sig, validation_type,
+        validation_context_kwargs=validation_context_kwargs,
+        force_revinfo=force_revinfo, result_store=result_store
+    )
+
+
+def _validate_pdf_ltv_signature(sig_field, embedded_sig: EmbeddedPdfSignature,
+                                validation_type: RevocationInfoValidationType,
+                                validation_context_kwargs=None,
+                                force_revinfo=False,
+                                dss_contents: '_DSSContents' = None,
+                                path_cache: ValidationPathCache = None,
+                                verifier: SignatureVerifier = None,
+                                result_store: ValidationResultStore = None):
+    # don't clobber the caller's kwargs, they may be reused for other
+    # signatures
+    validation_context_kwargs = dict(validation_context_kwargs or {})
     validation_context_kwargs['allow_fetching'] = False
     # certs with OCSP/CRL endpoints should have the relevant revocation data
     # embedded.
     validation_context_kwargs['revocation_mode'] = \
         "require" if force_revinfo else "hard-fail"
 
-    try:
-        sig_object = sig_field.get_object()['/V']
-    except KeyError:
-        raise SignatureValidationError('Signature is empty')
-
-    if sig_object is None:
-        raise ValueError('Signature is empty')
-
-    embedded_sig = EmbeddedPdfSignature(reader, sig_object)
     status_kwargs = embedded_sig.summarise_integrity_info()
     tst_signed_data = embedded_sig.external_timestamp_data
     if tst_signed_data is None:
@@ -1273,28 +2027,50 @@ def validate_pdf_ltv_signature(reader: PdfFileReader, sig_field,
     timestamp = tst_info['gen_time'].native
     validation_context_kwargs['moment'] = timestamp
 
-    if validation_type == RevocationInfoValidationType.ADOBE_STYLE:
-        vc = read_adobe_revocation_info(
-            embedded_sig.signer_info,
-            validation_context_kwargs=validation_context_kwargs
-        )
-    else:
-        dss, vc = DocumentSecurityStore.read_dss(
-            reader, validation_context_kwargs=validation_context_kwargs
+    def _validation_contexts():
+        if validation_type == RevocationInfoValidationType.ADOBE_STYLE:
+            yield read_adobe_revocation_info(
+                embedded_sig.signer_info,
+                validation_context_kwargs=validation_context_kwargs
+            )
+            return
+        dss = dss_contents
+        if dss is None:
+            dss_ref = _get_dss_ref(embedded_sig.reader)
+            dss = _DSSContents.read(dss_ref.get_object())
+        # Try to get by with the DSS entries relevant to this signature
+        # first. /VRI entries are optional, and not always complete, so if
+        # that doesn't work out, fall back to everything in the DSS.
+        vri_key = DocumentSecurityStore.sig_content_identifier(
+            embedded_sig.pkcs7_content
         )
+        if vri_key in dss.vri_entries:
+            yield dss.validation_context(
+                validation_context_kwargs, vri_key=vri_key
+            )
+        yield dss.validation_context(validation_context_kwargs)
 
-    status_kwargs.update({
-        'signed_dt': timestamp,
-        'timestamp_validity': validate_cms_signature(
+    integrity_kwargs = status_kwargs
+    for vc in _validation_contexts():
+        timestamp_validity = validate_cms_signature(
             tst_signed_data, status_cls=TimestampSignatureStatus,
-            validation_context=vc, status_kwargs={'timestamp': timestamp}
+            validation_context=vc, status_kwargs={'timestamp': timestamp},
+            path_cache=path_cache, verifier=verifier,
+            result_store=result_store
         )
-    })
-    status_kwargs = _validate_cms_signature(
-        embedded_sig.signed_data, status_cls=PdfSignatureStatus,
-        raw_digest=embedded_sig.raw_digest,
-        validation_context=vc, status_kwargs=status_kwargs
-    )
+        status_kwargs = dict(
+            integrity_kwargs, signed_dt=timestamp,
+            timestamp_validity=timestamp_validity
+        )
+        status_kwargs = _validate_cms_signature(
+            embedded_sig.signed_data, status_cls=PdfSignatureStatus,
+            raw_digest=embedded_sig.raw_digest,
+            validation_context=vc, status_kwargs=status_kwargs,
+            path_cache=path_cache, verifier=verifier,
+            result_store=result_store
+        )
+        if status_kwargs['trusted'] and timestamp_validity.trusted:
+            break
 
     try:
         _validate_sv_constraints(
@@ -1308,6 +2084,252 @@ def validate_pdf_ltv_signature(reader: PdfFileReader, sig_field,
     return PdfSignatureStatus(seed_value_ok=seed_value_ok, **status_kwargs)
 
 
+@dataclass(frozen=True)
+class FieldValidationResult:
+    """
+    Outcome of validating one signature field. If the signature couldn't be
+    validated at all, ``status`` is ``None`` and ``error`` says why:
+    a :class:`.SignatureValidationError` if the signature is invalid, or
+    a :class:`ValueError` or :class:`~pdf_utils.misc.PdfReadError` if the
+    signature or the document structure is malformed.
+    """
+
+    field_name: str
+    status: Optional[PdfSignatureStatus] = None
+    error: Optional[Exception] = None
+
+    @property
+    def bottom_line(self) -> bool:
+        return self.status is not None and self.status.bottom_line
+
+
+@dataclass(frozen=True)
+class DocumentValidationReport:
+    """
+    Validation results for all filled signature fields in a document, in the
+    order in which they appear in the form.
+    """
+
+    results: List[FieldValidationResult]
+
+    def __getitem__(self, field_name) -> FieldValidationResult:
+        for result in self.results:
+            if result.field_name == field_name:
+                return result
+        raise KeyError(field_name)
+
+    @property
+    def bottom_line(self) -> bool:
+        """
+        ``True`` if the document has at least one signature, and all of them
+        are valid.
+        """
+        return bool(self.results) and all(r.bottom_line for r in self.results)
+
+
+class DocumentValidator:
+    """
+    Validates all signatures in a document together, sharing as much work as
+    possible between them:
+
+    * all signatures are validated against the same validation contexts;
+    * the outcome of comparing a signed revision with a later revision is
+      cached, so no pair of revisions is ever diffed twice (the historical
+      resolvers involved are cached by the reader);
+    * for PAdES LTV validation, the DSS is only parsed once;
+    * validated certificate paths are cached, see
+      :class:`~pdfstamp.sign.general.ValidationPathCache`;
+    * optionally, results are persisted in a result store, so they can be
+      reused when the same document is validated again later (possibly
+      after acquiring more revisions).
+
+    Note that every signature still has to be compared with all revisions
+    that came after it: comparing consecutive revisions only is not
+    equivalent, since e.g. a DSS that was added after a signature can
+    legitimately be removed again.
+
+    :param reader:
+        The document to validate.
+    :param signer_validation_context:
+        Validation context for signer certificates.
+    :param ts_validation_context:
+        Validation context for timestamp tokens. Defaults to
+        ``signer_validation_context``.
+    :param path_cache:
+        Cache for validated certificate paths. Pass the same cache to several
+        validators to share it between documents.
+    :param verifier:
+        The :class:`.SignatureVerifier` to use for the signatures themselves.
+    :param result_store:
+        Persistent store for signature validation results and revision
+        comparisons, to skip work that was done in an earlier run.
+        See :class:`~pdfstamp.sign.cache.ValidationResultStore`.
+    """
+
+    def __init__(self, reader: PdfFileReader,
+                 signer_validation_context: ValidationContext = None,
+                 ts_validation_context: ValidationContext = None,
+                 path_cache: ValidationPathCache = None,
+                 verifier: SignatureVerifier = None,
+                 result_store: ValidationResultStore = None):
+        self.reader = reader
+        self.signer_validation_context = signer_validation_context
+        self.ts_validation_context = ts_validation_context
+        if path_cache is None:
+            path_cache = ValidationPathCache()
+        self.path_cache = path_cache
+        self.verifier = verifier
+        self.result_store = result_store
+        self.diff_cache = RevisionDiffCache(reader, result_store=result_store)
+        self._dss_contents = None
+
+    def embedded_signature(self, sig_field, check_subfilter=True) \
+            -> EmbeddedPdfSignature:
+        return EmbeddedPdfSignature(
+            self.reader, _get_sig_object(sig_field, check_subfilter),
+            diff_cache=self.diff_cache
+        )
+
+    def _read_dss_contents(self) -> '_DSSContents':
+        if self._dss_contents is None:
+            dss_ref = _get_dss_ref(self.reader)
+            self._dss_contents = _DSSContents.read(dss_ref.get_object())
+        return self._dss_contents
+
+    def compute_digests(self, embedded_sigs):
+        """
+        Compute the digests of several signatures in a single pass over
+        the document.
+        See :func:`compute_byte_range_digests`.
+        """
+        embedded_sigs = [
+            emb_sig for emb_sig in embedded_sigs if emb_sig.raw_digest is None
+        ]
+        digest_specs = [
+            (emb_sig.md_algorithm, emb_sig.byte_range)
+            for emb_sig in embedded_sigs
+        ]
+        # if there's a result store, we also need digests of the file up to
+        # the end of every revision, which we can compute in the same pass
+        diff_cache = self.diff_cache
+        prefix_ranges = {}
+        if self.result_store is not None and diff_cache.prefix_digests is None:
+            prefix_ranges = diff_cache.revision_prefix_ranges()
+            digest_specs.extend(
+                ('sha256', byte_range) for byte_range in prefix_ranges.values()
+            )
+        digests = compute_byte_range_digests(self.reader.stream, digest_specs)
+        for emb_sig, digest in zip(embedded_sigs, digests):
+            emb_sig.raw_digest = digest
+        if prefix_ranges:
+            diff_cache.prefix_digests = dict(
+                zip(prefix_ranges.keys(), digests[len(embedded_sigs):])
+            )
+
+    def validate_signature(self, sig_field,
+                           embedded_sig: EmbeddedPdfSignature = None) \
+            -> PdfSignatureStatus:
+        """
+        Validate a single signature field, like
+        :func:`validate_pdf_signature` does.
+        """
+        if embedded_sig is None:
+            embedded_sig = self.embedded_signature(sig_field)
+        return _validate_pdf_signature(
+            sig_field, embedded_sig,
+            self.signer_validation_context, self.ts_validation_context,
+            path_cache=self.path_cache, verifier=self.verifier,
+            result_store=self.result_store
+        )
+
+    def validate_ltv_signature(self, sig_field,
+                               validation_type: RevocationInfoValidationType,
+                               validation_context_kwargs=None,
+                               force_revinfo=False,
+                               embedded_sig: EmbeddedPdfSignature = None) \
+            -> PdfSignatureStatus:
+        """
+        Validate a single signature field, like
+        :func:`validate_pdf_ltv_signature` does.
+        """
+        if embedded_sig is None:
+            embedded_sig = self.embedded_signature(
+                sig_field, check_subfilter=False
+            )
+        dss_contents = None
+        if validation_type == RevocationInfoValidationType.PADES_LT:
+            dss_contents = self._read_dss_contents()
+        return _validate_pdf_ltv_signature(
+            sig_field, embedded_sig, validation_type,
+            validation_context_kwargs=validation_context_kwargs,
+            force_revinfo=force_revinfo, dss_contents=dss_contents,
+            path_cache=self.path_cache, verifier=self.verifier,
+            result_store=self.result_store
+        )
+
+    def validate_all(self,
+                     validation_type: RevocationInfoValidationType = None,
+                     validation_context_kwargs=None, force_revinfo=False) \
+            -> DocumentValidationReport:
+        """
+        Validate all filled signature fields in the document.
+        Validation and parse errors (:class:`ValueError` and
+        :class:`~pdf_utils.misc.PdfReadError`) for individual signatures are
+        recorded in the report; other exceptions propagate.
+
+        :param validation_type:
+            If not ``None``, validate signatures as LTV signatures using
+            the given type of embedded revocation info.
+        :param validation_context_kwargs:
+            Keyword arguments for the validation contexts used in LTV
+            validation. Ignored otherwise.
+        :param force_revinfo:
+            Require revocation info for all certificates in LTV validation.
+        :return:
+            A :class:`.DocumentValidationReport`.
+        """
+        from pdfstamp.sign.fields import enumerate_sig_fields
+        results = {}
+        embedded_sigs = {}
+        sig_fields = list(
+            enumerate_sig_fields(self.reader, filled_status=True)
+        )
+        for ix, (name, _, field_ref) in enumerate(sig_fields):
+            try:
+                embedded_sigs[ix] = self.embedded_signature(
+                    field_ref, check_subfilter=validation_type is None
+                )
+            except (ValueError, misc.PdfReadError) as e:
+                results[ix] = FieldValidationResult(name, error=e)
+
+        # hash everything in one go
+        self.compute_digests(embedded_sigs.values())
+
+        for ix, embedded_sig in embedded_sigs.items():
+            name, _, field_ref = sig_fields[ix]
+            try:
+                if validation_type is None:
+                    status = self.validate_signature(
+                        field_ref, embedded_sig=embedded_sig
+                    )
+                else:
+                    status = self.validate_ltv_signature(
+                        field_ref, validation_type,
+                        validation_context_kwargs=validation_context_kwargs,
+                        force_revinfo=force_revinfo,
+                        embedded_sig=embedded_sig
+                    )
+            except (ValueError, misc.PdfReadError) as e:
+                logger.debug(f'Failed to validate signature {name}.',
+                             exc_info=e)
+                results[ix] = FieldValidationResult(name, error=e)
+                continue
+            results[ix] = FieldValidationResult(name, status=status)
+        return DocumentValidationReport(
+            [results[ix] for ix in range(len(sig_fields))]
+        )
+
+
 def read_adobe_revocation_info(signer_info: cms.SignerInfo,
                                validation_context_kwargs=None) \
                                -> ValidationContext:
@@ -1380,12 +2402,131 @@ def enumerate_ocsp_certs(ocsp_response):
             yield from response['certs']
 
 
+def _get_dss_ref(handler: PdfHandler):
+    try:
+        return handler.root.raw_get(pdf_name('/DSS'))
+    except KeyError:
+        raise ValueError("No DSS found")
+
+
+class _DSSContents:
+    """
+    Contents of a DSS dictionary, loaded lazily: streams are only decoded
+    when a validation context needs them, and the decoded objects are
+    kept around, so that validation contexts for several signatures (or with
+    different settings) can be built without reparsing anything.
+
+    If the signature being validated has a /VRI entry, the certificates and
+    revocation info referenced there are loaded first. Since /VRI entries are
+    optional and often incomplete, the validation code falls back to
+    the full DSS if they turn out not to be sufficient.
+    """
+
+    def __init__(self, dss_dict):
+        self.cert_refs = list(dss_dict.get('/Certs', ()))
+        self.ocsp_refs = list(dss_dict.get('/OCSPs', ()))
+        self.crl_refs = list(dss_dict.get('/CRLs', ()))
+        try:
+            self.vri_entries = dict(dss_dict['/VRI'])
+        except KeyError:
+            self.vri_entries = {}
+        self._loaded = {}
+
+    @classmethod
+    def read(cls, dss_dict) -> '_DSSContents':
+        return cls(dss_dict)
+
+    def _load(self, ref, asn1_type):
+        try:
+            return self._loaded[ref]
+        except KeyError:
+            pass
+        stream: generic.StreamObject = ref.get_object()
+        value = asn1_type.load(stream.data)
+        self._loaded[ref] = value
+        return value
+
+    @property
+    def certs(self) -> List[Certificate]:
+        return [self._load(ref, Certificate) for ref in self.cert_refs]
+
+    @property
+    def ocsps(self) -> List[asn1_ocsp.OCSPResponse]:
+        return [
+            self._load(ref, asn1_ocsp.OCSPResponse) for ref in self.ocsp_refs
+        ]
+
+    @property
+    def crls(self) -> List[asn1_crl.CertificateList]:
+        return [
+            self._load(ref, asn1_crl.CertificateList) for ref in self.crl_refs
+        ]
+
+    def cert_index(self) -> dict:
+        """
+        Index the certificates in the DSS by issuer and serial number.
+        """
+        return {
+            self._load(ref, Certificate).issuer_serial: ref
+            for ref in self.cert_refs
+        }
+
+    def _vri_refs(self, vri_key):
+        try:
+            vri = self.vri_entries[vri_key].get_object()
+        except KeyError:
+            return None
+        return (
+            list(vri.get('/Cert', ())), list(vri.get('/OCSP', ())),
+            list(vri.get('/CRL', ()))
+        )
+
+    def validation_context(self, validation_context_kwargs=None,
+                           vri_key=None) -> ValidationContext:
+        """
+        Build a validation context from the DSS.
+
+        :param validation_context_kwargs:
+            Constructor kwargs for the ValidationContext.
+        :param vri_key:
+            Key of the signature's /VRI entry
+            (see :meth:`.DocumentSecurityStore.sig_content_identifier`).
+            If the entry exists, only the data referenced there is used,
+            otherwise everything in the DSS is.
+        """
+        refs = None if vri_key is None else self._vri_refs(vri_key)
+        if refs is None:
+            refs = self.cert_refs, self.ocsp_refs, self.crl_refs
+        cert_refs, ocsp_refs, crl_refs = refs
+        kwargs = dict(validation_context_kwargs or {})
+        other_certs = [self._load(ref, Certificate) for ref in cert_refs]
+        other_certs.extend(kwargs.pop('other_certs', ()))
+        return ValidationContext(
+            crls=[self._load(ref, asn1_crl.CertificateList)
+                  for ref in crl_refs],
+            ocsps=[self._load(ref, asn1_ocsp.OCSPResponse)
+                   for ref in ocsp_refs],
+            other_certs=other_certs, **kwargs
+        )
+
+
+def _digest_index(stream_refs):
+    return {
+        hashlib.sha256(ref.get_object().data).digest(): ref
+        for ref in stream_refs
+    }
+
+
 class DocumentSecurityStore:
 
     def __init__(self, writer, certs=None, ocsps=None, crls=None,
-                 vri_entries=None, backing_pdf_object=None):
+                 vri_entries=None, backing_pdf_object=None,
+                 contents: _DSSContents = None):
         self.vri_entries = vri_entries if vri_entries is not None else {}
-        self.certs = certs if certs is not None else {}
+        if certs is None and contents is None:
+            certs = {}
+        self._certs = certs
+        self._contents = contents
         self.ocsps = ocsps if ocsps is not None else []
         self.crls = crls if crls is not None else []
 
@@ -1395,28 +2536,31 @@ class DocumentSecurityStore:
             else generic.DictionaryObject()
         )
 
-        ocsps_seen = {}
-        for ocsp_ref in self.ocsps:
-            ocsp_bytes = ocsp_ref.get_object().data
-            ocsps_seen[ocsp_bytes] = ocsp_ref
-        self._ocsps_seen = ocsps_seen
+        # digests of the OCSP responses and CRLs in the DSS, only computed
+        # when we need to add new ones
+        self._ocsps_seen = None
+        self._crls_seen = None
 
-        crls_seen = {}
-        for crl_ref in self.crls:
-            crl_bytes = crl_ref.get_object().data
-            crls_seen[crl_bytes] = crl_ref
-        self._crls_seen = crls_seen
+    @property
+    def certs(self) -> dict:
+        """
+        Certificates in the DSS, indexed by issuer and serial number.
+        """
+        if self._certs is None:
+            self._certs = self._contents.cert_index()
+        return self._certs
 
     def _cms_objects_to_streams(self, objs, seen, dest):
         for obj in objs:
             obj_bytes = obj.dump()
+            obj_digest = hashlib.sha256(obj_bytes).digest()
             try:
-                yield seen[obj_bytes]
+                yield seen[obj_digest]
             except KeyError:
                 ref = self.writer.add_object(
                     generic.StreamObject(stream_data=obj_bytes)
                 )
-                seen[obj_bytes] = ref
+                seen[obj_digest] = ref
                 dest.append(ref)
                 yield ref
 
@@ -1466,6 +2610,10 @@ class DocumentSecurityStore:
         if self.writer is None:
             raise TypeError('This DSS does not support updates.')
 
+        if self._ocsps_seen is None:
+            self._ocsps_seen = _digest_index(self.ocsps)
+            self._crls_seen = _digest_index(self.crls)
+
         # embed any hardcoded ocsp responses and CRLs, if applicable
         ocsps = set(
             self._cms_objects_to_streams(
@@ -1521,56 +2669,23 @@ class DocumentSecurityStore:
             A DocumentSecurityStore object describing the current state of the
             DSS, and a validation context.
         """
-        # TODO remember where we're reading from for modification detection
-        #  purposes
-        try:
-            dss_ref = handler.root.raw_get(pdf_name('/DSS'))
-        except KeyError:
-            raise ValueError("No DSS found")
-
-        dss_dict = dss_ref.get_object()
-
-        if validation_context is None and validation_context_kwargs is None:
-            validation_context_kwargs = {}
-
-        cert_refs = {}
-        certs = []
-        for cert_ref in dss_dict.get('/Certs', ()):
-            cert_stream: generic.StreamObject = cert_ref.get_object()
-            cert: Certificate = Certificate.load(cert_stream.data)
-            cert_refs[cert.issuer_serial] = cert_ref
-
-            if validation_context is not None:
+        dss, contents = cls._read(handler)
+        if validation_context is not None:
+            for cert in contents.certs:
                 validation_context.certificate_registry.add_other_cert(cert)
-            else:
-                certs.append(cert)
-
-        ocsp_refs = list(dss_dict.get('/OCSPs', ()))
-        ocsps = []
-        for ocsp_ref in ocsp_refs:
-            ocsp_stream: generic.StreamObject = ocsp_ref.get_object()
-            resp = asn1_ocsp.OCSPResponse.load(ocsp_stream.data)
-            ocsps.append(resp)
-
-        crl_refs = list(dss_dict.get('/CRLs', ()))
-        crls = []
-        for crl_ref in crl_refs:
-            crl_stream: generic.StreamObject = crl_ref.get_object()
-            crl = asn1_crl.CertificateList.load(crl_stream.data)
-            crls.append(crl)
-
-        if validation_context is None:
-            certs += validation_context_kwargs.get('other_certs', [])
-            validation_context = ValidationContext(
-                crls=crls,
-                ocsps=ocsps, other_certs=certs, **validation_context_kwargs
+        else:
+            validation_context = contents.validation_context(
+                validation_context_kwargs
             )
+        return dss, validation_context
 
-        # shallow-copy the VRI dictionary
-        try:
-            vri_entries = dict(dss_dict['/VRI'])
-        except KeyError:
-            vri_entries = None
+    @classmethod
+    def _read(cls, handler: PdfHandler):
+        # TODO remember where we're reading from for modification detection
+        #  purposes
+        dss_ref = _get_dss_ref(handler)
+        dss_dict = dss_ref.get_object()
+        contents = _DSSContents.read(dss_dict)
 
         # if the handler is a writer, the DSS will support updates
         if isinstance(handler, IncrementalPdfFileWriter):
@@ -1581,28 +2696,51 @@ class DocumentSecurityStore:
 
         # the DSS returned will be backed by the original DSS object, so CRLs
         # are automagically preserved if they happened to be included in
-        # the original file
+        # the original file.
+        # Nothing is decoded at this point, the certificates are only indexed
+        # when they're needed.
         dss = cls(
-            writer=writer, certs=cert_refs, ocsps=ocsp_refs,
-            vri_entries=vri_entries, crls=crl_refs, backing_pdf_object=dss_dict
+            writer=writer, ocsps=list(contents.ocsp_refs),
+            crls=list(contents.crl_refs),
+            vri_entries=dict(contents.vri_entries),
+            backing_pdf_object=dss_dict, contents=contents
         )
-        return dss, validation_context
+        return dss, contents
 
     @classmethod
     def add_dss(cls, output_stream, sig_contents, paths,
-                validation_context):
-        output_stream.seek(0)
-        # TODO is it actually necessary to create a separate stream here?
-        #  and if so, can we somehow do this in a way that doesn't require the
-        #  data to be copied around, provided the output_stream is BytesIO
-        #  already?
-        writer = IncrementalPdfFileWriter(
-            BytesIO(output_stream.read()), skip_original=True
-        )
+                validation_context, writer: IncrementalPdfFileWriter = None):
+        """
+        Append a DSS update to a document, adding validation info for a
+        signature.
+
+        :param output_stream:
+            Stream containing the document. The update is appended to it.
+        :param sig_contents:
+            The signature's /Contents value.
+        :param paths:
+            Validation paths to add revocation info for.
+        :param validation_context:
+            Validation context to fetch revocation info with.
+        :param writer:
+            Writer appending to ``output_stream``, e.g. obtained from
+            :meth:`.IncrementalPdfFileWriter.chain`. If ``None``, the document
+            is parsed again.
+        :return:
+            The writer used to write the update.
+        """
+        if writer is None:
+            output_stream.seek(0)
+            # the update is appended to output_stream, so there's no need to
+            # copy the original. All objects that end up in the update are
+            # loaded before we start writing.
+            writer = IncrementalPdfFileWriter(
+                output_stream, skip_original=True
+            )
 
         try:
-            # we're not interested in this validation context
-            dss, vc = cls.read_dss(writer)
+            # no need for a validation context here
+            dss, _ = cls._read(writer)
             created = False
         except ValueError:
             # FIXME ValueError is way too general
@@ -1622,3 +2760,4 @@ class DocumentSecurityStore:
             writer.update_root()
         output_stream.seek(0, os.SEEK_END)
         writer.write(output_stream)
+        return writer
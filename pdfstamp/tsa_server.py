@@ -0,0 +1,247 @@
+"""
+Local RFC 3161 timestamping service backed by
+:class:`~pdfstamp.sign.timestamps.DummyTimeStamper`, for benchmarking and
+load testing without network access.
+
+Run it using ``python -m pdfstamp.tsa_server --tsa-cert ... --tsa-key ...``.
+In a source checkout, the TSA certificate and key of the testing CA
+(under ``pdfstamp_tests/data/crypto/testing-ca``) will do; the key's
+passphrase (``secret``) can be passed using ``--passfile``.
+Artificial latency, jitter and failures can be injected to see how
+:class:`~pdfstamp.sign.timestamps.HTTPTimeStamper` copes with a misbehaving
+TSA.
+
+Besides ``POST`` requests with timestamp queries, the server answers
+``GET /stats`` with some request counters (in JSON).
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import click
+from asn1crypto import tsp
+from oscrypto import keys as oskeys
+
+from pdfstamp.sign.timestamps import DummyTimeStamper
+
+__all__ = ['TSAServer', 'TSARequestHandler', 'serve']
+
+logger = logging.getLogger(__name__)
+
+class TSARequestHandler(BaseHTTPRequestHandler):
+    # keep connections alive, like a real TSA would
+    protocol_version = 'HTTP/1.1'
+    server: 'TSAServer'
+
+    def _send(self, status, content=b'', content_type=None):
+        self.send_response(status)
+        if content_type is not None:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/stats':
+            self._send(404)
+            return
+        content = json.dumps(self.server.stats()).encode('utf-8')
+        self._send(200, content, 'application/json')
+
+    def do_POST(self):
+        req_len = int(self.headers.get('Content-Length', 0))
+        req_data = self.rfile.read(req_len)
+        action = self.server.next_action()
+        if action == 'drop':
+            # hang up without answering
+            self.close_connection = True
+            return
+        elif action == 'fail':
+            self._send(self.server.failure_status)
+            return
+
+        content_type = self.headers.get('Content-Type')
+        if content_type != 'application/timestamp-query':
+            self.server.count('bad_requests')
+            self._send(415)
+            return
+        try:
+            req = tsp.TimeStampReq.load(req_data)
+            res = self.server.timestamper.request_tsa_response(req).dump()
+        except ValueError as e:
+            logger.debug(f'Failed to process timestamp request: {e}')
+            self.server.count('bad_requests')
+            self._send(400)
+            return
+        self.server.count('granted')
+        self._send(200, res, 'application/timestamp-reply')
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt % args)
+
+
+class TSAServer(ThreadingHTTPServer):
+    """
+    HTTP server exposing a :class:`.DummyTimeStamper`.
+
+    :param server_address:
+        Address to listen on. Use port 0 to pick a free port.
+    :param timestamper:
+        The timestamper answering requests.
+    :param latency:
+        Artificial latency added to every request (in seconds).
+    :param jitter:
+        Maximal random deviation from ``latency`` (in seconds).
+    :param failure_rate:
+        Fraction of requests answered with ``failure_status``.
+    :param drop_rate:
+        Fraction of requests for which the connection is closed without
+        answering.
+    :param failure_status:
+        HTTP status code to use for failed requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address, timestamper: DummyTimeStamper,
+                 latency=0.0, jitter=0.0, failure_rate=0.0, drop_rate=0.0,
+                 failure_status=503):
+        self.timestamper = timestamper
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.failure_status = failure_status
+        self.fail_next = 0
+        self._counters = {
+            'requests': 0, 'connections': 0, 'granted': 0, 'failed': 0,
+            'dropped': 0, 'bad_requests': 0,
+        }
+        self._lock = threading.Lock()
+        # asn1crypto parses lazily, which isn't thread-safe
+        for asn1_value in [timestamper.tsa_cert, timestamper.tsa_key] \
+                + timestamper.certs_to_embed:
+            asn1_value.native
+        super().__init__(server_address, TSARequestHandler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%d/tsa' % (host, port)
+
+    def process_request(self, request, client_address):
+        self.count('connections')
+        super().process_request(request, client_address)
+
+    def count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def next_action(self):
+        """
+        Decide what to do with the next request (``'fail'``, ``'drop'`` or
+        ``'answer'``), and sleep for a while to simulate latency.
+        """
+        with self._lock:
+            self._counters['requests'] += 1
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                action = 'fail'
+            else:
+                roll = random.random()
+                if roll < self.drop_rate:
+                    action = 'drop'
+                elif roll < self.drop_rate + self.failure_rate:
+                    action = 'fail'
+                else:
+                    action = 'answer'
+            if action == 'fail':
+                self._counters['failed'] += 1
+            elif action == 'drop':
+                self._counters['dropped'] += 1
+        delay = self.latency
+        if self.jitter:
+            delay += random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        return action
+
+
+def _load_timestamper(tsa_cert, tsa_key, passphrase, chain, md_algorithm):
+    with open(tsa_cert, 'rb') as f:
+        cert = oskeys.parse_certificate(f.read())
+    with open(tsa_key, 'rb') as f:
+        key = oskeys.parse_private(f.read(), password=passphrase)
+    certs_to_embed = []
+    for chain_file in chain:
+        with open(chain_file, 'rb') as f:
+            certs_to_embed.append(oskeys.parse_certificate(f.read()))
+    return DummyTimeStamper(
+        tsa_cert=cert, tsa_key=key, certs_to_embed=certs_to_embed,
+        md_algorithm=md_algorithm
+    )
+
+
+readable_file = click.Path(exists=True, readable=True, dir_okay=False)
+
+
+@click.command(help='run a local timestamping service for testing purposes')
+@click.option('--host', help='address to listen on', default='127.0.0.1',
+              show_default=True)
+@click.option('--port', help='port to listen on', type=int, default=8080,
+              show_default=True)
+@click.option('--tsa-cert', help='TSA certificate (PEM/DER)',
+              type=readable_file, required=True)
+@click.option('--tsa-key', help='TSA private key (PEM/DER)',
+              type=readable_file, required=True)
+@click.option('--passfile', help='file containing the TSA key passphrase',
+              required=False, type=click.File('rb'), show_default=False)
+@click.option('--chain', type=readable_file, multiple=True,
+              help='other certificates to embed in responses')
+@click.option('--md-algorithm', help='digest algorithm for the TSA signature',
+              default='sha256', show_default=True)
+@click.option('--latency', help='artificial latency (seconds)', type=float,
+              default=0.0, show_default=True)
+@click.option('--jitter', help='maximal random latency deviation (seconds)',
+              type=float, default=0.0, show_default=True)
+@click.option('--failure-rate', type=click.FloatRange(0, 1), default=0.0,
+              help='fraction of requests to fail', show_default=True)
+@click.option('--drop-rate', type=click.FloatRange(0, 1), default=0.0,
+              help='fraction of connections to drop without answering',
+              show_default=True)
+@click.option('--failure-status', type=int, default=503, show_default=True,
+              help='HTTP status code for failed requests')
+def serve(host, port, tsa_cert, tsa_key, passfile, chain, md_algorithm,
+          latency, jitter, failure_rate, drop_rate, failure_status):
+    if passfile is not None:
+        passphrase = passfile.readline().strip()
+        passfile.close()
+    else:
+        passphrase = None
+    timestamper = _load_timestamper(
+        tsa_cert, tsa_key, passphrase, chain, md_algorithm
+    )
+    server = TSAServer(
+        (host, port), timestamper, latency=latency, jitter=jitter,
+        failure_rate=failure_rate, drop_rate=drop_rate,
+        failure_status=failure_status
+    )
+    click.echo(f'Serving timestamps on {server.url}', err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    serve()
@@ -1,30 +1,58 @@
+import asyncio
+import gc
+import glob
+import hashlib
+import json
+import os
 import re
-from datetime import datetime
+import shutil
+import subprocess
+import threading
+import time
+import tracemalloc
+import weakref
+from datetime import datetime, timedelta
+from types import SimpleNamespace
 
 import pytest
 from io import BytesIO
 
+import aiohttp
 import pytz
-from asn1crypto import ocsp, tsp
+import requests
+from asn1crypto import algos, keys, ocsp, tsp, x509
 
 import pdfstamp.sign.fields
 from certvalidator import ValidationContext, CertificateValidator
+from certvalidator.errors import PathBuildingError, PathValidationError
 from ocspbuilder import OCSPResponseBuilder
-from oscrypto import keys as oskeys
+from oscrypto import asymmetric, keys as oskeys
 
 from pdf_utils import generic
 from pdf_utils.font import pdf_name
 from pdf_utils.writer import PdfFileWriter
-from pdfstamp.sign import timestamps, fields, signers
-from pdfstamp.sign.general import UnacceptableSignerError, SigningError
+from pdf_utils.optimise import optimise_pdf
+from pdfstamp.sign import (
+    timestamps, fields, signers, revinfo, validation, batch,
+)
+from pdfstamp.sign.cache import TSACache, ValidationResultStore
+from pdfstamp.sign.general import (
+    UnacceptableSignerError, SigningError, SimpleCertificateStore,
+    ValidationPathCache,
+)
+from pdfstamp.sign.pkcs11 import PKCS11Signer, PKCS11SessionPool
+from pdfstamp.sign.revinfo import CachingValidationContext, RevocationInfoCache
 from pdfstamp.sign.validation import (
     validate_pdf_signature, read_certification_data, DocumentSecurityStore,
     EmbeddedPdfSignature, read_adobe_revocation_info,
     validate_pdf_ltv_signature, RevocationInfoValidationType,
-    SignatureCoverageLevel, ModificationLevel,
+    SignatureCoverageLevel, ModificationLevel, DocumentValidator,
+    compute_byte_range_digests, SignatureVerifier, SignatureValidationError,
 )
+from pdf_utils.misc import PdfReadError
 from pdf_utils.reader import PdfFileReader
 from pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pdfstamp.tsa_server import TSAServer
 from .samples import *
 
 
@@ -102,10 +130,11 @@ def dummy_ocsp_vc():
     return vc
 
 
-def live_testing_vc(requests_mock):
-    vc = ValidationContext(
+def live_testing_vc(requests_mock, **kwargs):
+    # stand-in OCSP responder and CRL server for the testing CA
+    vc = CachingValidationContext(
         trust_roots=TRUST_ROOTS, allow_fetching=True,
-        other_certs=[]
+        other_certs=[], **kwargs
     )
 
     def serve_ca_file(request, _context):
@@ -117,7 +146,6 @@ def live_testing_vc(requests_mock):
     requests_mock.register_uri(
         'GET', re.compile(r"^http://ca\.example\.com/"), content=serve_ca_file
     )
-    # FIXME this is all moot since certvalidator uses urlopen()
 
     def serve_ocsp_response(request, _context):
         req: ocsp.OCSPRequest = ocsp.OCSPRequest.load(request.body)
@@ -139,6 +167,11 @@ def live_testing_vc(requests_mock):
 
             bld.nonce = nonce
             bld.certificate_issuer = INTERM_CERT
+            # backdate a little, like real responders do, since the
+            # validation time is fixed when the validation context is created
+            this_update = datetime.now(tz=pytz.utc) - timedelta(minutes=5)
+            bld.this_update = this_update
+            bld.next_update = this_update + timedelta(days=7)
             return bld.build(
                 responder_certificate=OCSP_CERT, responder_private_key=OCSP_KEY
             ).dump()
@@ -236,6 +269,36 @@ def test_null_sign():
         )
 
 
+def test_optimise_refuses_signed():
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL))
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    out = signers.sign_pdf(w, meta, signer=SELF_SIGN)
+
+    with pytest.raises(ValueError):
+        optimise_pdf(out, BytesIO())
+
+    out.seek(0)
+    rewritten = BytesIO()
+    optimise_pdf(out, rewritten, force=True)
+    r = PdfFileReader(rewritten)
+    assert r.total_revisions == 1
+    field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+    assert field_name == 'Sig1'
+    assert sig_obj is not None
+
+
+def test_sign_linearized():
+    linearized = BytesIO()
+    optimise_pdf(BytesIO(MINIMAL_ONE_FIELD), linearized, linearize=True)
+    w = IncrementalPdfFileWriter(linearized)
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    out = signers.sign_pdf(w, meta, signer=SELF_SIGN)
+    r = PdfFileReader(out)
+    field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+    assert field_name == 'Sig1'
+    val_untrusted(r, sig_field)
+
+
 def test_sign_with_trust():
     w = IncrementalPdfFileWriter(BytesIO(MINIMAL))
     out = signers.sign_pdf(
@@ -1070,6 +1133,608 @@ def test_pades_revinfo_ts_dummydata():
     assert len(dss.ocsps) == 1
 
 
+def test_pades_lta_dummydata():
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+    output = BytesIO()
+    out = signers.sign_pdf(
+        w, signers.PdfSignatureMetadata(
+            field_name='Sig1', validation_context=dummy_ocsp_vc(),
+            subfilter=PADES, embed_validation_info=True, use_pades_lta=True
+        ), signer=FROM_CA_TS, output=output
+    )
+    # the DSS and the document timestamp are appended to the same stream
+    assert out is output
+    r = PdfFileReader(out)
+    # signature, DSS, document timestamp, DSS
+    assert r.total_revisions == 6
+    dss, vc = DocumentSecurityStore.read_dss(handler=r)
+    assert dss is not None
+    assert len(dss.vri_entries) == 2
+    assert len(dss.ocsps) == 1
+    field_iter = fields.enumerate_sig_fields(r)
+    field_name, sig_obj, sig_field = next(field_iter)
+    assert field_name == 'Sig1'
+    status = validate_pdf_signature(r, sig_field, SIMPLE_V_CONTEXT)
+    assert status.intact and status.valid and status.trusted
+    assert status.modification_level == ModificationLevel.LTA_UPDATES
+
+    field_name, sig_obj, sig_field = next(field_iter)
+    assert sig_obj.get_object()['/Type'] == pdf_name('/DocTimeStamp')
+
+
+def test_batch_sign():
+    meta = signers.PdfSignatureMetadata(
+        field_name='Sig1', validation_context=dummy_ocsp_vc(),
+        subfilter=PADES, embed_validation_info=True
+    )
+    batch_signer = signers.BatchSigner(meta, FROM_CA_TS)
+    calls = []
+    orig_sign = FROM_CA_TS.sign
+    orig_estimate = FROM_CA_TS.estimate_cms_size
+
+    def counting_sign(*args, **kwargs):
+        calls.append('sign')
+        return orig_sign(*args, **kwargs)
+
+    def counting_estimate(*args, **kwargs):
+        calls.append('estimate')
+        return orig_estimate(*args, **kwargs)
+
+    FROM_CA_TS.sign = counting_sign
+    FROM_CA_TS.estimate_cms_size = counting_estimate
+    try:
+        outputs = [BytesIO() for _ in range(3)]
+        jobs = [(BytesIO(MINIMAL_ONE_FIELD), out) for out in outputs]
+        jobs.append((BytesIO(b'not a PDF file'), BytesIO()))
+        results = list(batch_signer.sign_many(jobs))
+    finally:
+        del FROM_CA_TS.sign
+        del FROM_CA_TS.estimate_cms_size
+
+    # the size estimate is only computed once
+    assert calls.count('estimate') == 1
+    assert calls.count('sign') == 3
+    assert [res.index for res in results] == [0, 1, 2, 3]
+    for res, out in zip(results, outputs):
+        assert res.ok
+        assert res.output is out
+        assert res.elapsed > 0
+        r = PdfFileReader(out)
+        field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+        assert field_name == 'Sig1'
+        val_trusted(r, sig_field, extd=True)
+        dss, vc = DocumentSecurityStore.read_dss(handler=r)
+        assert len(dss.certs) == 5
+    assert not results[3].ok
+    assert results[3].output is None
+
+    with pytest.raises(Exception):
+        list(batch_signer.sign_many(
+            [(BytesIO(b'not a PDF file'), None)], fail_fast=True
+        ))
+
+
+def test_batch_sign_cache_expiry():
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    batch_signer = signers.BatchSigner(meta, FROM_CA, cache_ttl=0)
+    in_memory = [
+        BytesIO(MINIMAL_ONE_FIELD), IncrementalPdfFileWriter(BytesIO(MINIMAL))
+    ]
+    results = list(batch_signer.sign_many((inp, None) for inp in in_memory))
+    for res in results:
+        assert res.ok
+        r = PdfFileReader(res.output)
+        field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+        assert field_name == 'Sig1'
+        val_untrusted(r, sig_field)
+
+
+def test_batch_sign_cache_scope():
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    batch_signer = signers.BatchSigner(meta, FROM_CA_TS)
+    vc = dummy_ocsp_vc()
+    vc_cache = batch_signer._cache_for(vc)
+    assert batch_signer._cache_for(vc) is vc_cache
+    assert batch_signer._cache_for(dummy_ocsp_vc()) is not vc_cache
+    # different timestampers never share cached data
+    ts_cache = batch_signer._cache_for(FROM_CA_TS.timestamper, vc)
+    other_ts = timestamps.DummyTimeStamper(
+        tsa_cert=DUMMY_TS.tsa_cert, tsa_key=DUMMY_TS.tsa_key,
+        certs_to_embed=DUMMY_TS.certs_to_embed
+    )
+    assert batch_signer._cache_for(other_ts, vc) is not ts_cache
+    assert batch_signer._cache_for(None, vc) is not ts_cache
+
+    # the caches don't keep their owners alive
+    vc_ref = weakref.ref(vc)
+    del vc, vc_cache, ts_cache
+    gc.collect()
+    assert vc_ref() is None
+
+
+def test_batch_sign_revinfo_size():
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    batch_signer = signers.BatchSigner(meta, FROM_CA)
+    small = signers.Signer.format_revinfo(ocsp_responses=[FIXED_OCSP])
+    large = signers.Signer.format_revinfo(
+        ocsp_responses=[FIXED_OCSP, FIXED_OCSP, FIXED_OCSP]
+    )
+    small_estimate = batch_signer._estimate_bytes_reserved(
+        'sha256', None, False, small
+    )
+    # revocation info of a different size doesn't reuse the estimate
+    large_estimate = batch_signer._estimate_bytes_reserved(
+        'sha256', None, False, large
+    )
+    assert large_estimate > small_estimate
+    assert batch_signer._estimate_bytes_reserved(
+        'sha256', None, False, small
+    ) == small_estimate
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_batch_sign_files(tmp_path, max_workers):
+    for ix in range(3):
+        (tmp_path / ('doc%d.pdf' % ix)).write_bytes(MINIMAL_ONE_FIELD)
+    (tmp_path / 'broken.pdf').write_bytes(b'not a PDF file')
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    jobs = list(
+        batch.jobs_from_glob([str(tmp_path / '*.pdf')], output_dir=out_dir)
+    )
+    assert len(jobs) == 4
+    key_spec = batch.KeyMaterialSpec(
+        key_file=TESTING_CA_DIR + '/keys/signer.key.pem',
+        cert_file=TESTING_CA_DIR + '/intermediate/newcerts/signer.cert.pem',
+        ca_chain_files=(
+            TESTING_CA_DIR + '/intermediate/certs/ca-chain.cert.pem',
+        ),
+        passphrase=b'secret'
+    )
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    results = list(batch.sign_files(
+        jobs, key_spec, meta, max_workers=max_workers
+    ))
+    assert [res.input_file for res in results] == \
+        [job.input_file for job in jobs]
+    by_name = {os.path.basename(res.input_file): res for res in results}
+    broken = by_name.pop('broken.pdf')
+    assert not broken.ok
+    assert broken.as_json_dict()['status'] == 'error'
+    assert not os.path.exists(broken.output_file)
+    for fname, res in by_name.items():
+        assert res.ok
+        assert res.output_file == str(out_dir / fname.replace('.', '-signed.'))
+        with open(res.output_file, 'rb') as f:
+            r = PdfFileReader(BytesIO(f.read()))
+        field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+        val_trusted(r, sig_field)
+
+
+def test_batch_manifest(tmp_path):
+    csv_manifest = tmp_path / 'manifest.csv'
+    csv_manifest.write_text('input,output\na.pdf,x.pdf\nb/b.pdf,\n')
+    jobs = list(batch.read_manifest(str(csv_manifest), suffix='-s'))
+    # relative paths are resolved relative to the manifest
+    assert jobs == [
+        batch.BatchJob(str(tmp_path / 'a.pdf'), str(tmp_path / 'x.pdf')),
+        batch.BatchJob(
+            str(tmp_path / 'b' / 'b.pdf'), str(tmp_path / 'b' / 'b-s.pdf')
+        )
+    ]
+
+    jsonl_manifest = tmp_path / 'manifest.jsonl'
+    abs_input = str(tmp_path / 'elsewhere' / 'c.pdf')
+    jsonl_manifest.write_text(
+        '{"input": "a.pdf", "output": "x.pdf"}\n\n{"input": "b.pdf"}\n'
+        + json.dumps({'input': abs_input}) + '\n'
+    )
+    jobs = list(batch.read_manifest(str(jsonl_manifest), output_dir='out'))
+    assert jobs == [
+        batch.BatchJob(str(tmp_path / 'a.pdf'), str(tmp_path / 'x.pdf')),
+        batch.BatchJob(
+            str(tmp_path / 'b.pdf'), os.path.join('out', 'b-signed.pdf')
+        ),
+        batch.BatchJob(abs_input, os.path.join('out', 'c-signed.pdf')),
+    ]
+    assert list(batch.read_input_manifest(str(jsonl_manifest))) == [
+        str(tmp_path / 'a.pdf'), str(tmp_path / 'b.pdf'), abs_input
+    ]
+
+    bad_manifest = tmp_path / 'bad.csv'
+    bad_manifest.write_text('file\na.pdf\n')
+    with pytest.raises(ValueError):
+        list(batch.read_manifest(str(bad_manifest)))
+
+
+def test_batch_sign_in_place(tmp_path):
+    doc = tmp_path / 'doc.pdf'
+    doc.write_bytes(MINIMAL_ONE_FIELD)
+    manifest = tmp_path / 'manifest.csv'
+    manifest.write_text('input,output\ndoc.pdf,./doc.pdf\n')
+    with pytest.raises(ValueError, match='line 2'):
+        list(batch.read_manifest(str(manifest)))
+    with pytest.raises(ValueError):
+        list(batch.jobs_from_glob([str(doc)], suffix=''))
+
+    key_spec = batch.KeyMaterialSpec(
+        key_file=TESTING_CA_DIR + '/keys/signer.key.pem',
+        cert_file=TESTING_CA_DIR + '/intermediate/newcerts/signer.cert.pem',
+        passphrase=b'secret'
+    )
+    broken = tmp_path / 'broken.pdf'
+    broken.write_bytes(b'not a PDF file')
+    # this one already exists
+    broken_out = tmp_path / 'broken-out.pdf'
+    broken_out.write_bytes(b'precious')
+    jobs = [
+        batch.BatchJob(str(doc), str(doc)),
+        batch.BatchJob(str(broken), str(broken_out)),
+    ]
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    results = list(batch.sign_files(jobs, key_spec, meta))
+    assert not any(res.ok for res in results)
+    assert 'same as the input' in results[0].error
+    # nothing was overwritten, and no temporary files were left behind
+    assert doc.read_bytes() == MINIMAL_ONE_FIELD
+    assert broken_out.read_bytes() == b'precious'
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'broken-out.pdf', 'broken.pdf', 'doc.pdf', 'manifest.csv'
+    ]
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_batch_validate(tmp_path, max_workers):
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    signed = signers.sign_pdf(w, meta, signer=FROM_CA).getvalue()
+    (tmp_path / 'signed.pdf').write_bytes(signed)
+    # tamper with the signed data
+    tampered = signed.replace(b'/Type /Page', b'/Type /Pag ', 1)
+    assert tampered != signed
+    (tmp_path / 'tampered.pdf').write_bytes(tampered)
+    (tmp_path / 'unsigned.pdf').write_bytes(MINIMAL_ONE_FIELD)
+    (tmp_path / 'broken.pdf').write_bytes(b'not a PDF file')
+
+    input_files = list(batch.inputs_from_glob([str(tmp_path / '*.pdf')]))
+    results = list(batch.validate_many(
+        input_files, validation_context_kwargs={'trust_roots': [ROOT_CERT]},
+        max_workers=max_workers
+    ))
+    assert [res.input_file for res in results] == input_files
+    by_name = {
+        os.path.basename(res.input_file): res.as_json_dict()
+        for res in results
+    }
+    # everything should be serialisable
+    json.dumps(by_name)
+    assert by_name['broken.pdf']['status'] == 'error'
+    assert by_name['unsigned.pdf']['status'] == 'unsigned'
+    assert by_name['tampered.pdf']['status'] == 'invalid'
+    signed_result = by_name['signed.pdf']
+    assert signed_result['status'] == 'valid'
+    sig_result, = signed_result['signatures']
+    assert sig_result['field'] == 'Sig1'
+    assert sig_result['status'] == 'VALID'
+    assert sig_result['coverage'] == 'ENTIRE_FILE'
+    assert sig_result['modification_level'] == 'NONE'
+
+    manifest = tmp_path / 'manifest.jsonl'
+    manifest.write_text('{"input": "a.pdf"}\n\n{"input": "b.pdf"}\n')
+    assert list(batch.read_input_manifest(str(manifest))) == \
+        [str(tmp_path / 'a.pdf'), str(tmp_path / 'b.pdf')]
+
+
+def _sign_without_chain():
+    # sign without embedding the intermediate CA certificate
+    signer_only = SimpleCertificateStore()
+    signer_only.register(FROM_CA.signing_cert)
+    no_chain = signers.SimpleSigner(
+        signing_cert=FROM_CA.signing_cert, signing_key=FROM_CA.signing_key,
+        cert_registry=signer_only
+    )
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    return signers.sign_pdf(w, meta, signer=no_chain).getvalue()
+
+
+def test_batch_validate_documents_isolated(tmp_path):
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+    (tmp_path / 'a.pdf').write_bytes(
+        signers.sign_pdf(w, meta, signer=FROM_CA).getvalue()
+    )
+    (tmp_path / 'b.pdf').write_bytes(_sign_without_chain())
+    input_files = [str(tmp_path / 'a.pdf'), str(tmp_path / 'b.pdf')]
+    results = list(batch.validate_many(
+        input_files, validation_context_kwargs={'trust_roots': [ROOT_CERT]}
+    ))
+    # the intermediate CA certificate in a.pdf doesn't help with b.pdf
+    a_sig, = results[0].signatures
+    b_sig, = results[1].signatures
+    assert a_sig['trusted']
+    assert not b_sig['trusted']
+
+
+def test_two_phase_sign(tmp_path):
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    pdf_signer = signers.PdfSigner(meta, FROM_CA)
+    out_file = tmp_path / 'prepared.pdf'
+    with open(out_file, 'w+b') as out:
+        prepared = pdf_signer.prepare_pdf(
+            IncrementalPdfFileWriter(BytesIO(MINIMAL)), output=out
+        )
+    serialised = json.dumps(prepared.as_json_dict())
+
+    # ... sign the attributes elsewhere ...
+    prepared = signers.PreparedSignature.from_json_dict(
+        json.loads(serialised)
+    )
+    signature = FROM_CA.sign_raw(prepared.signed_attrs, prepared.md_algorithm)
+
+    with open(out_file, 'r+b') as out:
+        pdf_signer.finalise_pdf(prepared, out, signature)
+    with open(out_file, 'rb') as f:
+        r = PdfFileReader(BytesIO(f.read()))
+    field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+    assert field_name == 'Sig1'
+    status = val_trusted(r, sig_field)
+    assert status.md_algorithm == prepared.md_algorithm
+
+    with pytest.raises(ValueError):
+        signers.PreparedSignature.from_json_dict({'md_algorithm': 'sha256'})
+
+
+def test_two_phase_sign_pades_revinfo():
+    meta = signers.PdfSignatureMetadata(
+        field_name='Sig1', validation_context=dummy_ocsp_vc(),
+        subfilter=PADES, embed_validation_info=True
+    )
+    pdf_signer = signers.PdfSigner(meta, FROM_CA_TS)
+    out = BytesIO()
+    prepared = pdf_signer.prepare_pdf(
+        IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD)), output=out
+    )
+    signature = FROM_CA_TS.sign_raw(
+        prepared.signed_attrs, prepared.md_algorithm
+    )
+    out = pdf_signer.finalise_pdf(prepared, out, signature)
+    r = PdfFileReader(out)
+    field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+    assert sig_obj.get_object()['/SubFilter'] == '/ETSI.CAdES.detached'
+    val_trusted(r, sig_field, extd=True)
+    dss, vc = DocumentSecurityStore.read_dss(handler=r)
+    assert len(dss.certs) == 5
+    assert len(dss.ocsps) == 1
+
+
+def test_size_estimate():
+    md_algorithm = 'sha256'
+    digest = hashlib.sha256(b'abc').digest()
+    # make sure the timestamper has seen a token before
+    DUMMY_TS.dummy_response(md_algorithm)
+    for signer in (FROM_CA, FROM_CA_TS):
+        estimate = signer.estimate_cms_size(md_algorithm)
+        actual = len(signer.sign(digest, md_algorithm).dump())
+        assert actual <= estimate <= actual + 128
+
+
+def test_size_estimate_dry_run(requests_mock):
+    # without embedding validation info, the only extra request to the TSA
+    # is the dry run to measure its tokens, and that only happens once
+    requests_mock.post(
+        DUMMY_HTTP_TS.url, content=ts_response_callback,
+        headers={'Content-Type': 'application/timestamp-reply'}
+    )
+    ts = timestamps.HTTPTimeStamper(DUMMY_HTTP_TS.url)
+    signer = signers.SimpleSigner(
+        signing_cert=FROM_CA.signing_cert, cert_registry=FROM_CA.cert_registry,
+        signing_key=FROM_CA.signing_key, timestamper=ts
+    )
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    for call_count in (2, 3):
+        w = IncrementalPdfFileWriter(BytesIO(MINIMAL))
+        out = signers.sign_pdf(w, meta, signer=signer)
+        assert requests_mock.call_count == call_count
+        r = PdfFileReader(out)
+        field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+        validity = val_trusted(r, sig_field)
+        assert validity.timestamp_validity.trusted
+
+
+def test_size_estimate_large_token(requests_mock):
+    # a TSA that embeds lots of certificates in its tokens
+    embedded = list(signers.load_ca_chain(
+        glob.glob(TESTING_CA_DIR + '/**/*.pem', recursive=True)
+    ))
+    big_ts = timestamps.DummyTimeStamper(
+        tsa_cert=DUMMY_TS.tsa_cert, tsa_key=DUMMY_TS.tsa_key,
+        certs_to_embed=embedded * 2
+    )
+
+    def big_response(request, _context):
+        req = tsp.TimeStampReq.load(request.body)
+        return big_ts.request_tsa_response(req=req).dump()
+
+    requests_mock.post(
+        DUMMY_HTTP_TS.url, content=big_response,
+        headers={'Content-Type': 'application/timestamp-reply'}
+    )
+    ts = timestamps.HTTPTimeStamper(DUMMY_HTTP_TS.url)
+    signer = signers.SimpleSigner(
+        signing_cert=FROM_CA.signing_cert, cert_registry=FROM_CA.cert_registry,
+        signing_key=FROM_CA.signing_key, timestamper=ts
+    )
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL))
+    out = signers.sign_pdf(w, meta, signer=signer)
+    # the tokens are measured before signing, whatever their size
+    assert ts.token_size_estimate('sha256') > 12000
+    r = PdfFileReader(out)
+    field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+    val_trusted(r, sig_field)
+
+
+def test_sign_insufficient_space():
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    with pytest.raises(SigningError):
+        signers.sign_pdf(
+            IncrementalPdfFileWriter(BytesIO(MINIMAL)), meta, FROM_CA,
+            bytes_reserved=128
+        )
+
+
+@pytest.fixture
+def local_tsa_server():
+    server = TSAServer(('127.0.0.1', 0), DUMMY_TS)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def local_tsa(local_tsa_server):
+    return local_tsa_server.url
+
+
+def _async_sign_all(signer, count):
+    meta = signers.PdfSignatureMetadata(
+        field_name='Sig1', validation_context=dummy_ocsp_vc(),
+        subfilter=PADES, embed_validation_info=True
+    )
+    pdf_signer = signers.PdfSigner(meta, signer)
+
+    async def _sign_all():
+        return await asyncio.gather(*(
+            pdf_signer.async_sign_pdf(
+                IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+            ) for _ in range(count)
+        ))
+
+    for out in asyncio.run(_sign_all()):
+        r = PdfFileReader(out)
+        field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+        assert field_name == 'Sig1'
+        status = val_trusted(r, sig_field, extd=True)
+        assert status.timestamp_validity is not None
+        dss, vc = DocumentSecurityStore.read_dss(handler=r)
+        assert len(dss.certs) == 5
+
+
+def test_async_sign(local_tsa):
+    signer = signers.SimpleSigner(
+        signing_cert=FROM_CA.signing_cert, cert_registry=FROM_CA.cert_registry,
+        signing_key=FROM_CA.signing_key,
+        timestamper=timestamps.HTTPTimeStamper(local_tsa)
+    )
+    _async_sign_all(signer, 5)
+
+
+class _BarrierTimeStamper(timestamps.DummyTimeStamper):
+    # only answers once another request is in progress at the same time
+
+    def __init__(self, barrier, **kwargs):
+        self.barrier = barrier
+        super().__init__(**kwargs)
+
+    def request_tsa_response(self, req):
+        self.barrier.wait()
+        return super().request_tsa_response(req)
+
+
+def test_async_sign_lta_concurrent_tsa_requests():
+    # Every signature involves the same number of TSA requests. If any of
+    # them happened while holding the signer's lock, the other signature
+    # could never catch up, and the barrier would time out.
+    timestamper = _BarrierTimeStamper(
+        threading.Barrier(2, timeout=10), tsa_cert=DUMMY_TS.tsa_cert,
+        tsa_key=DUMMY_TS.tsa_key, certs_to_embed=DUMMY_TS.certs_to_embed
+    )
+    signer = signers.SimpleSigner(
+        signing_cert=FROM_CA.signing_cert, cert_registry=FROM_CA.cert_registry,
+        signing_key=FROM_CA.signing_key, timestamper=timestamper
+    )
+    meta = signers.PdfSignatureMetadata(
+        field_name='Sig1', validation_context=dummy_ocsp_vc(),
+        subfilter=PADES, embed_validation_info=True, use_pades_lta=True
+    )
+    pdf_signer = signers.PdfSigner(meta, signer)
+
+    async def _sign_all():
+        return await asyncio.gather(*(
+            pdf_signer.async_sign_pdf(
+                IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+            ) for _ in range(2)
+        ))
+
+    for out in asyncio.run(_sign_all()):
+        r = PdfFileReader(out)
+        # signature, DSS, document timestamp, DSS
+        assert r.total_revisions == 6
+        field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+        status = val_trusted(r, sig_field, extd=True)
+        assert status.modification_level == ModificationLevel.LTA_UPDATES
+
+
+def test_async_sign_aiohttp(local_tsa):
+    signer = signers.SimpleSigner(
+        signing_cert=FROM_CA.signing_cert, cert_registry=FROM_CA.cert_registry,
+        signing_key=FROM_CA.signing_key,
+        timestamper=timestamps.AsyncHTTPTimeStamper(local_tsa)
+    )
+    _async_sign_all(signer, 5)
+
+
+def test_async_http_timestamper(local_tsa_server):
+    digest = hashlib.sha256(b'abc').digest()
+
+    def imprint(token):
+        tst_info = token['content']['encap_content_info']['content'].parsed
+        return tst_info['message_imprint']['hashed_message'].native
+
+    async def _run():
+        # a session is created for every request
+        ts = timestamps.AsyncHTTPTimeStamper(local_tsa_server.url)
+        token = await ts.async_timestamp(digest, 'sha256')
+        assert imprint(token) == digest
+
+        # the server answers with an error status
+        local_tsa_server.failure_rate = 1
+        with pytest.raises(timestamps.TimestampRequestError):
+            await ts.async_timestamp(digest, 'sha256')
+        local_tsa_server.failure_rate = 0
+        # the server hangs up without answering
+        local_tsa_server.drop_rate = 1
+        with pytest.raises(aiohttp.ClientError):
+            await ts.async_timestamp(digest, 'sha256')
+        local_tsa_server.drop_rate = 0
+        assert ts.error_count == 2
+        assert ts.latency.count == 3
+        ts.close()
+
+        # requests through a shared session reuse its connection
+        async with aiohttp.ClientSession() as session:
+            ts = timestamps.AsyncHTTPTimeStamper(
+                local_tsa_server.url, async_session=session
+            )
+            tokens = [
+                await ts.async_timestamp(digest, 'sha256') for _ in range(3)
+            ]
+        assert all(imprint(token) == digest for token in tokens)
+        assert ts.error_count == 0
+
+    connections = local_tsa_server.stats()['connections']
+    asyncio.run(_run())
+    stats = local_tsa_server.stats()
+    assert stats['requests'] == 6
+    assert stats['granted'] == 4
+    # one connection per request without a session, and one for the
+    # shared session
+    assert stats['connections'] - connections == 4
+
+
 def test_pades_revinfo_http_ts_dummydata(requests_mock):
     w = IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
     requests_mock.post(
@@ -1214,6 +1879,262 @@ def test_pades_revinfo_live_lta(requests_mock):
     assert sig_obj.get_object()['/Type'] == pdf_name('/DocTimeStamp')
     # TODO implement and run actual LTA verification checks
 
+
+def test_dss_lazy_vri(requests_mock):
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+    vc = live_testing_vc(requests_mock)
+    out = signers.sign_pdf(
+        w, signers.PdfSignatureMetadata(
+            field_name='Sig1', validation_context=vc,
+            subfilter=PADES, embed_validation_info=True,
+            use_pades_lta=True
+        ), signer=FROM_CA_TS
+    )
+    r = PdfFileReader(out)
+    dss_ref = r.root.raw_get('/DSS')
+    contents = validation._DSSContents.read(dss_ref.get_object())
+    # nothing is decoded up front
+    assert not contents._loaded
+
+    field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+    emb_sig = EmbeddedPdfSignature(r, sig_obj.get_object())
+    vri_key = DocumentSecurityStore.sig_content_identifier(
+        emb_sig.pkcs7_content
+    )
+    vri = contents.vri_entries[vri_key].get_object()
+    vri_refs = set(vri['/Cert']) | set(vri['/OCSP']) | set(vri['/CRL'])
+    vc = contents.validation_context(
+        {'trust_roots': TRUST_ROOTS}, vri_key=vri_key
+    )
+    # only the data for this signature was loaded
+    assert set(contents._loaded) == vri_refs
+    assert len(vc.ocsps) == len(vri['/OCSP'])
+    assert len(vc.crls) == len(vri['/CRL'])
+
+    # without a /VRI entry, everything is used
+    vc = contents.validation_context(
+        {'trust_roots': TRUST_ROOTS}, vri_key=pdf_name('/NOPE')
+    )
+    assert len(contents._loaded) == (
+        len(contents.cert_refs) + len(contents.ocsp_refs)
+        + len(contents.crl_refs)
+    )
+    assert len(vc.ocsps) == 1 and len(vc.crls) == 1
+
+    status = validate_pdf_ltv_signature(
+        r, sig_field, RevocationInfoValidationType.PADES_LT,
+        {'trust_roots': TRUST_ROOTS}
+    )
+    assert status.valid and status.trusted
+
+
+def test_dss_incomplete_vri(requests_mock):
+    vc = live_testing_vc(requests_mock)
+    vc.certificate_registry.add_other_cert(INTERM_CERT)
+    # the intermediate CA certificate only ends up in the DSS
+    signer_only = SimpleCertificateStore()
+    signer_only.register(FROM_CA.signing_cert)
+    timestamper = timestamps.DummyTimeStamper(
+        tsa_cert=DUMMY_TS.tsa_cert, tsa_key=DUMMY_TS.tsa_key,
+        certs_to_embed=[]
+    )
+    signer = signers.SimpleSigner(
+        signing_cert=FROM_CA.signing_cert, signing_key=FROM_CA.signing_key,
+        cert_registry=signer_only, timestamper=timestamper
+    )
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+    out = signers.sign_pdf(
+        w, signers.PdfSignatureMetadata(
+            field_name='Sig1', validation_context=vc,
+            subfilter=PADES, embed_validation_info=True
+        ), signer=signer
+    )
+    # leave the certificates out of the signature's /VRI entry, like some
+    # other producers do
+    w = IncrementalPdfFileWriter(out)
+    field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(w.prev))
+    vri_key = DocumentSecurityStore.sig_content_identifier(
+        EmbeddedPdfSignature(w.prev, sig_obj.get_object()).pkcs7_content
+    )
+    vri = w.root['/DSS']['/VRI'].raw_get(vri_key).get_object()
+    vri[pdf_name('/Cert')] = generic.ArrayObject()
+    w.update_container(vri)
+    out = BytesIO()
+    w.write(out)
+
+    r = PdfFileReader(out)
+    field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+    # the rest of the DSS should be used instead
+    status = validate_pdf_ltv_signature(
+        r, sig_field, RevocationInfoValidationType.PADES_LT,
+        {'trust_roots': TRUST_ROOTS}
+    )
+    assert status.valid and status.trusted
+    assert status.timestamp_validity.trusted
+
+
+def test_revinfo_cache(requests_mock, tmp_path):
+    cache = RevocationInfoCache(directory=str(tmp_path))
+
+    def _sign():
+        vc = live_testing_vc(requests_mock, revinfo_cache=cache)
+        w = IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+        out = signers.sign_pdf(
+            w, signers.PdfSignatureMetadata(
+                field_name='Sig1', validation_context=vc,
+                subfilter=PADES, embed_validation_info=True
+            ), signer=FROM_CA
+        )
+        dss, _ = DocumentSecurityStore.read_dss(handler=PdfFileReader(out))
+        assert len(dss.ocsps) == 1
+        assert len(dss.crls) == 1
+
+    def _fetch_count():
+        return sum(
+            1 for req in requests_mock.request_history
+            if 'ocsp' in req.url or req.url.endswith('.crl.pem')
+        )
+
+    _sign()
+    fetches = _fetch_count()
+    assert fetches > 0
+    # the second signature uses the cached OCSP response and CRL
+    _sign()
+    assert _fetch_count() == fetches
+
+    signer_cert = FROM_CA.signing_cert
+    assert cache.get_ocsp(signer_cert) is not None
+    crl_url = signer_cert.crl_distribution_points[0].url
+    certificate_list = cache.get_crl(crl_url)
+    assert certificate_list is not None
+
+    # certificates of the CRL issuer are cached along with the CRL
+    cache.put_crl(crl_url, certificate_list, [INTERM_CERT])
+
+    def _no_fetch(_url):
+        raise AssertionError('CRL should be cached')
+
+    vc = CachingValidationContext(
+        trust_roots=TRUST_ROOTS, allow_fetching=True, revinfo_cache=cache,
+        crl_fetcher=_no_fetch
+    )
+    cached_crl, certs = vc._load_crl(crl_url)
+    assert cached_crl.dump() == certificate_list.dump()
+    assert [c.dump() for c in certs] == [INTERM_CERT.dump()]
+
+    # garbage is ignored
+    for fname in os.listdir(str(tmp_path)):
+        with open(os.path.join(str(tmp_path), fname), 'w') as f:
+            f.write('{')
+    assert cache.get_ocsp(signer_cert) is None
+    assert cache.get_crl(crl_url) is None
+    cache.invalidate()
+    assert not os.listdir(str(tmp_path))
+
+
+def test_revinfo_cache_expiry(tmp_path, monkeypatch):
+    cache = RevocationInfoCache(directory=str(tmp_path))
+    now = datetime.now(tz=pytz.utc)
+    signer_cert = FROM_CA.signing_cert
+
+    def _response(this_update, next_update):
+        bld = OCSPResponseBuilder('successful', signer_cert, 'good')
+        bld.certificate_issuer = INTERM_CERT
+        bld.this_update = this_update
+        bld.next_update = next_update
+        return bld.build(
+            responder_certificate=OCSP_CERT, responder_private_key=OCSP_KEY
+        )
+
+    # responses past their nextUpdate aren't cached
+    cache.put_ocsp(
+        signer_cert,
+        _response(now - timedelta(days=2), now - timedelta(days=1))
+    )
+    assert cache.get_ocsp(signer_cert) is None
+
+    cache.put_ocsp(signer_cert, _response(now, now + timedelta(days=1)))
+    assert cache.get_ocsp(signer_cert) is not None
+
+    # max_age takes precedence over nextUpdate
+    cache = RevocationInfoCache(
+        directory=str(tmp_path), max_age=timedelta(hours=1)
+    )
+    cache.invalidate()
+    good_response = _response(now, now + timedelta(days=1))
+    cache.put_ocsp(signer_cert, good_response)
+    assert cache.get_ocsp(signer_cert) is not None
+    monkeypatch.setattr(
+        revinfo, '_now', lambda: now + timedelta(hours=2)
+    )
+    assert cache.get_ocsp(signer_cert) is None
+    monkeypatch.undo()
+
+    # unsuccessful responses aren't cached either, and don't replace
+    # a response that is
+    cache = RevocationInfoCache(directory=str(tmp_path))
+    cache.put_ocsp(signer_cert, good_response)
+    cache.put_ocsp(signer_cert, OCSPResponseBuilder('try_later').build())
+    cached = cache.get_ocsp(signer_cert)
+    assert cached is not None and cached.dump() == good_response.dump()
+
+
+def test_revinfo_prefetch(requests_mock):
+    # Both fetches have to be in flight at the same time to get past
+    # the barrier.
+    barrier = threading.Barrier(2, timeout=5)
+    calls = []
+
+    def ocsp_fetcher(cert, issuer):
+        calls.append('ocsp')
+        barrier.wait()
+        return revinfo.fetch_ocsp(cert, issuer)
+
+    def crl_fetcher(url):
+        calls.append(url)
+        barrier.wait()
+        return revinfo.fetch_crl(url)
+
+    vc = live_testing_vc(
+        requests_mock, ocsp_fetcher=ocsp_fetcher, crl_fetcher=crl_fetcher
+    )
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+    out = signers.sign_pdf(
+        w, signers.PdfSignatureMetadata(
+            field_name='Sig1', validation_context=vc,
+            subfilter=PADES, embed_validation_info=True
+        ), signer=FROM_CA_TS
+    )
+    # the TSA's certificate is on the same CRL as the intermediate CA
+    assert sorted(calls) == [
+        'http://ca.example.com/root/crl/ca.crl.pem', 'ocsp'
+    ]
+    dss, _ = DocumentSecurityStore.read_dss(handler=PdfFileReader(out))
+    assert len(dss.ocsps) == 1
+    assert len(dss.crls) == 1
+
+
+def test_revinfo_prefetch_failure(requests_mock):
+    calls = []
+
+    def ocsp_fetcher(cert, issuer):
+        calls.append('ocsp')
+        raise requests.ConnectionError('nope')
+
+    vc = live_testing_vc(
+        requests_mock, ocsp_fetcher=ocsp_fetcher, revocation_mode='hard-fail'
+    )
+    vc.prefetch([FROM_CA.signing_cert], FROM_CA.cert_registry)
+    assert calls == ['ocsp']
+    # the error is reported during validation, without fetching again
+    with pytest.raises(requests.ConnectionError):
+        CertificateValidator(
+            FROM_CA.signing_cert, intermediate_certs=FROM_CA.cert_registry,
+            validation_context=vc
+        ).validate_usage({"non_repudiation"})
+    assert calls == ['ocsp']
+
+
 # TODO test multiple PAdES signatures
 
 
@@ -1815,6 +2736,287 @@ def test_pades_double_sign_delete_dss(requests_mock):
     val_trusted_but_modified(r, sig_field)
 
 
+def _pades_double_sign(requests_mock, delete_dss=False):
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL_TWO_FIELDS))
+    for field_name in ('Sig1', 'Sig2'):
+        meta = signers.PdfSignatureMetadata(
+            field_name=field_name,
+            validation_context=live_testing_vc(requests_mock),
+            subfilter=PADES, embed_validation_info=True,
+        )
+        out = signers.sign_pdf(w, meta, signer=FROM_CA_TS)
+        w = IncrementalPdfFileWriter(out)
+    if delete_dss:
+        del w.root['/DSS']
+        w.update_root()
+        out = BytesIO()
+        w.write(out)
+    return PdfFileReader(out)
+
+
+def test_document_validator(requests_mock, monkeypatch):
+    r = _pades_double_sign(requests_mock, delete_dss=True)
+
+    diffs = []
+    orig_diff_revisions = validation._diff_revisions
+
+    def _diff_revisions(reader, signed_revision, revision, **kwargs):
+        diffs.append((signed_revision, revision))
+        return orig_diff_revisions(
+            reader, signed_revision, revision, **kwargs
+        )
+
+    monkeypatch.setattr(validation, '_diff_revisions', _diff_revisions)
+
+    validator = DocumentValidator(r, SIMPLE_V_CONTEXT)
+    report = validator.validate_all()
+    assert [res.field_name for res in report.results] == ['Sig1', 'Sig2']
+    assert not report.bottom_line
+    # same verdicts as validating the signatures one by one
+    assert report['Sig1'].bottom_line
+    assert report['Sig1'].status.coverage \
+        == SignatureCoverageLevel.ENTIRE_REVISION
+    assert report['Sig1'].status.modification_level \
+        <= ModificationLevel.FORM_FILLING
+    assert not report['Sig2'].bottom_line
+    assert report['Sig2'].status.modification_level == ModificationLevel.OTHER
+    assert not report['Sig2'].status.docmdp_ok
+
+    # the diff cache only pays off when the same signatures are validated
+    # again: the second round doesn't diff anything
+    diff_count = len(diffs)
+    assert diff_count
+    for _, _, sig_field in fields.enumerate_sig_fields(r):
+        validator.validate_signature(sig_field)
+    assert len(diffs) == diff_count
+
+
+def test_document_validator_errors(monkeypatch):
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    r = PdfFileReader(signers.sign_pdf(w, meta, signer=FROM_CA))
+    validator = DocumentValidator(r, SIMPLE_V_CONTEXT)
+
+    def _fail_with(err):
+        def _validate_signature(*_args, **_kwargs):
+            raise err
+        monkeypatch.setattr(
+            validator, 'validate_signature', _validate_signature
+        )
+
+    # structure errors are recorded as malformed signatures
+    _fail_with(PdfReadError('broken xref'))
+    result = validator.validate_all()['Sig1']
+    assert isinstance(result.error, PdfReadError)
+    assert batch._field_result_json(result)['status'] == 'MALFORMED'
+
+    _fail_with(SignatureValidationError('bad signature'))
+    result = validator.validate_all()['Sig1']
+    assert batch._field_result_json(result)['status'] == 'INVALID'
+
+    # anything else is a bug, not a verdict on the signature
+    _fail_with(TypeError('oops'))
+    with pytest.raises(TypeError):
+        validator.validate_all()
+    result = validation.FieldValidationResult('Sig1', error=TypeError('oops'))
+    with pytest.raises(TypeError):
+        batch._field_result_json(result)
+
+
+def test_document_validator_ltv(requests_mock):
+    r = _pades_double_sign(requests_mock)
+    vc_kwargs = {'trust_roots': TRUST_ROOTS}
+    report = DocumentValidator(r).validate_all(
+        RevocationInfoValidationType.PADES_LT, vc_kwargs
+    )
+    # the kwargs can be reused
+    assert vc_kwargs == {'trust_roots': TRUST_ROOTS}
+    assert report.bottom_line
+    for result, (name, _, sig_field) in \
+            zip(report.results, fields.enumerate_sig_fields(r)):
+        assert result.field_name == name
+        status = validate_pdf_ltv_signature(
+            r, sig_field, RevocationInfoValidationType.PADES_LT,
+            {'trust_roots': TRUST_ROOTS}
+        )
+        assert result.status.bottom_line == status.bottom_line
+        assert result.status.modification_level == status.modification_level
+
+    # no DSS -> every signature is reported as malformed
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL_TWO_FIELDS))
+    meta = signers.PdfSignatureMetadata(field_name='Sig1', subfilter=PADES)
+    r = PdfFileReader(signers.sign_pdf(w, meta, signer=FROM_CA_TS))
+    report = DocumentValidator(r).validate_all(
+        RevocationInfoValidationType.PADES_LT, vc_kwargs
+    )
+    assert not report.bottom_line
+    assert all(isinstance(res.error, ValueError) for res in report.results)
+
+
+@pytest.mark.parametrize('chunk_size', [100, 4096, 1024 * 1024])
+def test_multi_digest(requests_mock, chunk_size):
+    r = _pades_double_sign(requests_mock)
+    embedded_sigs = [
+        EmbeddedPdfSignature(r, sig_field.get_object()['/V'])
+        for _, _, sig_field in fields.enumerate_sig_fields(r)
+    ]
+    specs = [(emb.md_algorithm, emb.byte_range) for emb in embedded_sigs]
+    # throw in some other algorithms and byte ranges for good measure
+    file_len = len(r.stream.getvalue())
+    specs += [
+        ('sha1', embedded_sigs[0].byte_range),
+        ('sha512', [0, file_len]),
+        ('sha256', [100, 200, 500, file_len]),
+        # out of order -> processed separately
+        ('sha256', [500, 100, 0, 100]),
+        # past the end of the file
+        ('sha256', [0, 100, file_len - 10, 1000]),
+    ]
+    digests = compute_byte_range_digests(
+        r.stream, specs, chunk_size=chunk_size
+    )
+    for (md_algorithm, byte_range), digest in zip(specs, digests):
+        md = getattr(hashlib, md_algorithm)()
+        for lo, chunk_len in zip(byte_range[::2], byte_range[1::2]):
+            md.update(r.stream.getvalue()[lo:lo + chunk_len])
+        assert digest == md.digest()
+
+    for emb in embedded_sigs:
+        emb.compute_digest()
+    assert [emb.raw_digest for emb in embedded_sigs] == digests[:2]
+
+
+def test_path_cache():
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    r = PdfFileReader(signers.sign_pdf(w, meta, signer=FROM_CA_TS))
+    path_cache = ValidationPathCache()
+    vc = ValidationContext(trust_roots=[ROOT_CERT])
+
+    def _validate(validation_context):
+        report = DocumentValidator(
+            r, validation_context, path_cache=path_cache
+        ).validate_all()
+        assert report.bottom_line
+        return report['Sig1'].status
+
+    status = _validate(vc)
+    # signer and TSA
+    assert len(path_cache) == 2
+    assert path_cache.hits == 0
+    cached_status = _validate(vc)
+    assert path_cache.hits == 2
+    assert list(cached_status.validation_path) \
+        == list(status.validation_path)
+    assert cached_status.timestamp_validity.trusted
+
+    # other validation time -> no reuse
+    _validate(ValidationContext(
+        trust_roots=[ROOT_CERT], moment=vc.moment + timedelta(seconds=1)
+    ))
+    assert path_cache.hits == 2
+    assert len(path_cache) == 4
+
+    # other trust roots -> no reuse either
+    report = DocumentValidator(
+        r, ValidationContext(trust_roots=[], moment=vc.moment),
+        path_cache=path_cache
+    ).validate_all()
+    assert not report['Sig1'].status.trusted
+    assert path_cache.hits == 2
+
+    small_cache = ValidationPathCache(max_size=1)
+    DocumentValidator(r, vc, path_cache=small_cache).validate_all()
+    assert len(small_cache) == 1
+
+
+def _pss_algorithm(salt_length=32):
+    return algos.SignedDigestAlgorithm({
+        'algorithm': 'rsassa_pss',
+        'parameters': algos.RSASSAPSSParams({
+            'hash_algorithm': {'algorithm': 'sha256'},
+            'mask_gen_algorithm': {
+                'algorithm': 'mgf1', 'parameters': {'algorithm': 'sha256'}
+            },
+            'salt_length': salt_length
+        })
+    })
+
+
+def test_signature_verifier_mechanisms():
+    verifier = SignatureVerifier()
+    data = b'Hello world!'
+    rsa_key = asymmetric.load_private_key(FROM_CA.signing_key)
+    rsa_pub = FROM_CA.signing_cert.public_key
+    ec_pub, ec_key = asymmetric.generate_pair('ec', curve='secp256r1')
+    cases = [
+        (rsa_pub, algos.SignedDigestAlgorithm({'algorithm': 'rsassa_pkcs1v15'}),
+         asymmetric.rsa_pkcs1v15_sign(rsa_key, data, 'sha256')),
+        (rsa_pub, _pss_algorithm(),
+         asymmetric.rsa_pss_sign(rsa_key, data, 'sha256')),
+        (ec_pub.asn1, algos.SignedDigestAlgorithm({'algorithm': 'sha256_ecdsa'}),
+         asymmetric.ecdsa_sign(ec_key, data, 'sha256')),
+    ]
+    for public_key_info, algorithm, signature in cases:
+        verifier.check_supported(algorithm)
+        assert verifier.verify(
+            public_key_info, data, signature, algorithm, 'sha256'
+        )
+        assert not verifier.verify(
+            public_key_info, data + b'!', signature, algorithm, 'sha256'
+        )
+
+    # oscrypto can't do PSS with other salt lengths
+    with pytest.raises(NotImplementedError):
+        verifier.check_supported(_pss_algorithm(salt_length=20))
+
+
+def test_signature_verifier_caching(monkeypatch):
+    key_loads = []
+
+    def _load_public_key(public_key_info):
+        key_loads.append(public_key_info)
+        return asymmetric.load_public_key(public_key_info)
+
+    # certvalidator loads public keys too, so only intercept calls made
+    # by the verifier
+    overrides = dict(vars(asymmetric), load_public_key=_load_public_key)
+    monkeypatch.setattr(
+        validation, 'asymmetric', SimpleNamespace(**overrides)
+    )
+
+    class CountingVerifier(SignatureVerifier):
+        verify_count = 0
+
+        def verify_raw(self, *args, **kwargs):
+            CountingVerifier.verify_count += 1
+            return super().verify_raw(*args, **kwargs)
+
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    r = PdfFileReader(signers.sign_pdf(w, meta, signer=FROM_CA_TS))
+
+    verifier = CountingVerifier(memoise_results=True)
+    for _ in range(3):
+        report = DocumentValidator(
+            r, SIMPLE_V_CONTEXT, verifier=verifier
+        ).validate_all()
+        assert report.bottom_line
+    # signature + timestamp token, verified once each
+    assert CountingVerifier.verify_count == 2
+    assert len(key_loads) == 2
+
+    # without memoisation, only the keys are reused
+    CountingVerifier.verify_count = 0
+    key_loads.clear()
+    verifier = CountingVerifier(key_cache_size=1)
+    for _ in range(2):
+        DocumentValidator(r, SIMPLE_V_CONTEXT, verifier=verifier).validate_all()
+    assert CountingVerifier.verify_count == 4
+    # the cache is too small to hold both keys
+    assert len(key_loads) == 4
+
+
 def test_pades_dss_object_clobber(requests_mock):
     w = IncrementalPdfFileWriter(BytesIO(MINIMAL_TWO_FIELDS))
     meta1 = signers.PdfSignatureMetadata(
@@ -1896,3 +3098,788 @@ def test_delete_signature():
     field_name, sig_obj, sig_field = next(sig_fields)
     assert field_name == 'Sig2'
     val_trusted_but_modified(r, sig_field)
+
+
+def _sign_then_update(form, update, prefill=None):
+    w = IncrementalPdfFileWriter(BytesIO(form))
+    if prefill is not None:
+        prefill(w)
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    w = IncrementalPdfFileWriter(signers.sign_pdf(w, meta, signer=FROM_CA))
+    out = update(w)
+    if out is None:
+        out = BytesIO()
+        w.write(out)
+    return PdfFileReader(out)
+
+
+def _add_field_copy(w):
+    field_arr = w.root['/AcroForm']['/Fields']
+    tf = generic.DictionaryObject(field_arr[1].get_object())
+    field_arr.append(w.add_object(tf))
+    w.update_container(field_arr)
+
+
+def _sign_second_field(w):
+    meta = signers.PdfSignatureMetadata(field_name='Sig2')
+    return signers.sign_pdf(w, meta, signer=FROM_CA)
+
+
+MODIFICATION_SCENARIOS = {
+    'fill': lambda: _sign_then_update(
+        SIMPLE_FORM, lambda w: set_text_field(w, 'Some text')
+    ),
+    'modify': lambda: _sign_then_update(
+        SIMPLE_FORM, lambda w: set_text_field(w, 'Some other text'),
+        prefill=lambda w: set_text_field(w, 'Some text')
+    ),
+    'group_fill': lambda: _sign_then_update(
+        TEXTFIELD_GROUP, lambda w: set_text_field_in_group(w, 0, 'Some text')
+    ),
+    'group_var_fill': lambda: _sign_then_update(
+        TEXTFIELD_GROUP_VAR,
+        lambda w: set_text_field_in_group(w, 1, 'Some text')
+    ),
+    'group_modify': lambda: _sign_then_update(
+        TEXTFIELD_GROUP, lambda w: set_text_field_in_group(w, 0, 'Other'),
+        prefill=lambda w: set_text_field_in_group(w, 0, 'Some text')
+    ),
+    'structure': lambda: _sign_then_update(SIMPLE_FORM, _add_field_copy),
+    'second_sig': lambda: _sign_then_update(
+        MINIMAL_TWO_FIELDS, _sign_second_field
+    ),
+}
+
+
+@pytest.mark.parametrize('scenario', list(MODIFICATION_SCENARIOS))
+def test_delta_diff_matches_full_diff(scenario):
+    r = MODIFICATION_SCENARIOS[scenario]()
+
+    def _outcome(**kwargs):
+        try:
+            return validation._diff_revisions(r, signed_rev, rev, **kwargs)
+        except Exception as e:
+            # the unsigned revisions of the samples don't all have forms
+            return type(e)
+
+    cache = validation.RevisionDiffCache(r)
+    for signed_rev in range(r.xrefs.total_revisions):
+        for rev in range(signed_rev + 1, r.xrefs.total_revisions):
+            assert _outcome() == _outcome(
+                delta=cache.delta(signed_rev, rev)
+            ), (signed_rev, rev)
+    # the changed refs are accumulated, but looking back still works
+    for signed_rev in range(r.xrefs.total_revisions - 1):
+        rev = signed_rev + 1
+        fresh = validation.RevisionDiffCache(r).delta(signed_rev, rev)
+        assert cache.delta(signed_rev, rev).changed_refs == fresh.changed_refs
+
+
+def test_delta_diff_skips_unchanged_fields(monkeypatch):
+    r = MODIFICATION_SCENARIOS['group_fill']()
+    diffed = []
+    orig_diff_field = validation._diff_field
+
+    def _diff_field(signed_ref, current_ref, *args, fq_name):
+        diffed.append(fq_name)
+        return orig_diff_field(signed_ref, current_ref, *args, fq_name=fq_name)
+
+    monkeypatch.setattr(validation, '_diff_field', _diff_field)
+    signed_rev = r.xrefs.total_revisions - 2
+    rev = signed_rev + 1
+    full = validation._diff_revisions(r, signed_rev, rev)
+    full_diffed = set(diffed)
+    diffed.clear()
+    delta = validation.RevisionDiffCache(r).delta(signed_rev, rev)
+    assert validation._diff_revisions(r, signed_rev, rev, delta=delta) \
+        == full == ModificationLevel.FORM_FILLING
+    # only the filled-in field and its parent are looked at
+    assert len(set(diffed)) == 2
+    assert set(diffed) < full_diffed
+
+
+def test_tsa_cache(requests_mock, tmp_path):
+    requests_mock.post(
+        DUMMY_HTTP_TS.url, content=ts_response_callback,
+        headers={'Content-Type': 'application/timestamp-reply'}
+    )
+    md_algorithm = 'sha256'
+    cache = TSACache(directory=str(tmp_path))
+    ts = timestamps.HTTPTimeStamper(DUMMY_HTTP_TS.url, cache=cache)
+    ts.collect_certs(md_algorithm)
+    assert requests_mock.call_count == 1
+    paths = ts.validation_paths(SIMPLE_V_CONTEXT, md_algorithm)
+    assert len(paths) == 1
+    token_size = ts.token_size_estimate(md_algorithm)
+
+    # a fresh timestamper should get everything from the cache
+    ts = timestamps.HTTPTimeStamper(
+        DUMMY_HTTP_TS.url, cache=TSACache(directory=str(tmp_path))
+    )
+    ts.collect_certs(md_algorithm)
+    assert requests_mock.call_count == 1
+    assert ts.token_size_estimate(md_algorithm) == token_size
+    cached_paths = ts.validation_paths(SIMPLE_V_CONTEXT, md_algorithm)
+    assert [c.dump() for c in cached_paths[0]] \
+        == [c.dump() for c in paths[0]]
+
+    # cached paths that don't end in a trust root are ignored
+    with pytest.raises(PathBuildingError):
+        ts.validation_paths(NOTRUST_V_CONTEXT, md_algorithm)
+
+    # cached paths are still validated against the validation context
+    not_yet_valid_vc = ValidationContext(
+        trust_roots=[ROOT_CERT],
+        moment=datetime(2000, 1, 1, tzinfo=pytz.utc)
+    )
+    with pytest.raises(PathValidationError):
+        ts.validation_paths(not_yet_valid_vc, md_algorithm)
+    require_vc = ValidationContext(
+        trust_roots=[ROOT_CERT], crls=[], ocsps=[], revocation_mode='require'
+    )
+    with pytest.raises(PathValidationError):
+        ts.validation_paths(require_vc, md_algorithm)
+
+    cache.invalidate(DUMMY_HTTP_TS.url, md_algorithm)
+    assert cache.get(DUMMY_HTTP_TS.url, md_algorithm) is None
+
+
+def _count_work(monkeypatch):
+    work = {'diffs': 0, 'verifications': 0}
+    orig_diff_revisions = validation._diff_revisions
+    orig_verify = SignatureVerifier.verify
+
+    def _diff_revisions(*args, **kwargs):
+        work['diffs'] += 1
+        return orig_diff_revisions(*args, **kwargs)
+
+    def _verify(self, *args, **kwargs):
+        work['verifications'] += 1
+        return orig_verify(self, *args, **kwargs)
+
+    monkeypatch.setattr(validation, '_diff_revisions', _diff_revisions)
+    monkeypatch.setattr(SignatureVerifier, 'verify', _verify)
+    return work
+
+
+def _summaries(report):
+    return [
+        (res.field_name, res.status.summary(),
+         res.status.modification_level, res.status.bottom_line)
+        for res in report.results
+    ]
+
+
+def test_result_store(requests_mock, monkeypatch, tmp_path):
+    r = _pades_double_sign(requests_mock)
+    data = r.stream.getvalue()
+    store = ValidationResultStore(directory=str(tmp_path))
+    work = _count_work(monkeypatch)
+
+    def _validate():
+        validator = DocumentValidator(
+            PdfFileReader(BytesIO(data)), result_store=store
+        )
+        return validator.validate_all(
+            validation_type=RevocationInfoValidationType.PADES_LT,
+            validation_context_kwargs={'trust_roots': TRUST_ROOTS}
+        )
+
+    report = _validate()
+    assert report.bottom_line
+    # two signatures and two timestamps; Sig1 is compared with the three
+    # revisions after it, Sig2 with the DSS update
+    assert work == {'diffs': 4, 'verifications': 4}
+    expected = _summaries(report)
+
+    second_report = _validate()
+    assert work == {'diffs': 4, 'verifications': 4}
+    assert _summaries(second_report) == expected
+    assert second_report['Sig1'].status.validation_path is not None
+
+    store.invalidate()
+    assert _summaries(_validate()) == expected
+    assert work == {'diffs': 8, 'verifications': 8}
+
+
+def test_result_store_new_revision(monkeypatch, tmp_path):
+    store = ValidationResultStore(directory=str(tmp_path))
+    w = IncrementalPdfFileWriter(BytesIO(SIMPLE_FORM))
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    out = signers.sign_pdf(w, meta, signer=FROM_CA)
+    w = IncrementalPdfFileWriter(out)
+    set_text_field(w, 'Some text')
+    out = BytesIO()
+    w.write(out)
+
+    report = DocumentValidator(
+        PdfFileReader(out), SIMPLE_V_CONTEXT, result_store=store
+    ).validate_all()
+    assert report.bottom_line
+    assert report['Sig1'].status.modification_level \
+        == ModificationLevel.FORM_FILLING
+
+    # append another revision that messes with the form
+    w = IncrementalPdfFileWriter(out)
+    _add_field_copy(w)
+    out = BytesIO()
+    w.write(out)
+    work = _count_work(monkeypatch)
+    r = PdfFileReader(out)
+    report = DocumentValidator(
+        r, SIMPLE_V_CONTEXT, result_store=store
+    ).validate_all()
+    # only the new revision had to be compared with the signed one
+    assert work == {'diffs': 1, 'verifications': 0}
+    assert not report.bottom_line
+    assert report['Sig1'].status.modification_level == ModificationLevel.OTHER
+
+    # a different trust setup means different results
+    vc = ValidationContext(trust_roots=[])
+    report = DocumentValidator(r, vc, result_store=store).validate_all()
+    assert work == {'diffs': 1, 'verifications': 1}
+    assert not report['Sig1'].status.trusted
+
+
+def test_result_store_intermediates(monkeypatch, tmp_path):
+    store = ValidationResultStore(directory=str(tmp_path))
+    data = _sign_without_chain()
+
+    def _validate(vc):
+        return DocumentValidator(
+            PdfFileReader(BytesIO(data)), vc, result_store=store
+        ).validate_all()
+
+    with_interm = ValidationContext(
+        trust_roots=[ROOT_CERT], other_certs=[INTERM_CERT]
+    )
+    assert _validate(with_interm)['Sig1'].status.trusted
+    work = _count_work(monkeypatch)
+    # the stored result relies on a certificate that isn't available now
+    report = _validate(ValidationContext(trust_roots=[ROOT_CERT]))
+    assert work['verifications'] == 1
+    assert not report['Sig1'].status.trusted
+    # ... but it can be reused when it is
+    assert _validate(with_interm)['Sig1'].status.trusted
+    assert work['verifications'] == 1
+
+
+def test_result_store_fetching(requests_mock, monkeypatch, tmp_path):
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    data = signers.sign_pdf(w, meta, signer=FROM_CA).getvalue()
+
+    def _validate(store):
+        report = DocumentValidator(
+            PdfFileReader(BytesIO(data)), live_testing_vc(requests_mock),
+            result_store=store
+        ).validate_all()
+        assert report['Sig1'].status.trusted
+
+    work = _count_work(monkeypatch)
+    # results that depend on fetched revocation info aren't stored...
+    store = ValidationResultStore(directory=str(tmp_path))
+    _validate(store)
+    _validate(store)
+    assert work['verifications'] == 2
+    # ... unless explicitly requested
+    store = ValidationResultStore(directory=str(tmp_path), include_fetched=True)
+    _validate(store)
+    _validate(store)
+    assert work['verifications'] == 3
+
+
+def test_http_timestamp_retry(local_tsa_server):
+    ts = timestamps.HTTPTimeStamper(local_tsa_server.url, backoff_factor=0)
+    local_tsa_server.fail_next = 2
+    digest = hashlib.sha256(b'abc').digest()
+    token = ts.timestamp(digest, 'sha256')
+    assert token['content_type'].native == 'signed_data'
+    assert local_tsa_server.stats()['requests'] == 3
+    assert ts.latency.count == 1
+    assert ts.error_count == 0
+
+    # keep failing until we run out of retries
+    local_tsa_server.fail_next = ts.max_retries + 1
+    with pytest.raises(timestamps.TimestampRequestError):
+        ts.timestamp(digest, 'sha256')
+    assert ts.error_count == 1
+    assert ts.latency.count == 2
+    ts.close()
+
+
+def test_http_timestamp_retry_old_urllib3(monkeypatch):
+    class OldRetry(timestamps.Retry):
+        # urllib3 < 1.26 doesn't know about allowed_methods
+        def __init__(self, method_whitelist=None, **kwargs):
+            if 'allowed_methods' in kwargs:
+                raise TypeError(
+                    "__init__() got an unexpected keyword argument "
+                    "'allowed_methods'"
+                )
+            self.method_whitelist = method_whitelist
+            super().__init__(**kwargs)
+
+    monkeypatch.setattr(timestamps, 'Retry', OldRetry)
+    ts = timestamps.HTTPTimeStamper('http://example.com/tsa')
+    retry = ts.session.get_adapter(ts.url).max_retries
+    assert isinstance(retry, OldRetry)
+    assert retry.method_whitelist is False
+    assert retry.total == ts.max_retries
+    ts.close()
+
+
+def test_http_timestamp_connection_reuse(local_tsa_server):
+    ts = timestamps.HTTPTimeStamper(local_tsa_server.url)
+    digest = hashlib.sha256(b'abc').digest()
+    for _ in range(5):
+        ts.timestamp(digest, 'sha256')
+    # all requests should've gone over the same connection
+    assert local_tsa_server.stats()['requests'] == 5
+    assert local_tsa_server.stats()['connections'] == 1
+    stats = ts.latency.as_dict()
+    assert stats['count'] == 5
+    assert stats['p95'] is not None
+    assert sum(b['count'] for b in stats['buckets']) == 5
+    ts.close()
+
+
+def test_latency_histogram():
+    hist = timestamps.LatencyHistogram(bounds=(0.1, 1.0))
+    assert hist.quantile(0.95) is None
+    for latency in (0.05, 0.05, 0.5, 3.0):
+        hist.record(latency)
+    assert hist.quantile(0.5) == 0.1
+    assert hist.quantile(0.75) == 1.0
+    assert hist.quantile(1) == 3.0
+    assert hist.buckets() == [(0.1, 2), (1.0, 1), (float('inf'), 1)]
+    with pytest.raises(ValueError):
+        hist.quantile(2)
+
+
+class _SlowTimeStamper(timestamps.DummyTimeStamper):
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        super().__init__(
+            tsa_cert=DUMMY_TS.tsa_cert, tsa_key=DUMMY_TS.tsa_key,
+            certs_to_embed=DUMMY_TS.certs_to_embed
+        )
+
+    def request_tsa_response(self, req):
+        time.sleep(self.delay)
+        if self.fail:
+            raise timestamps.TimestampRequestError('TSA is down')
+        return super().request_tsa_response(req)
+
+
+def test_composite_timestamp_failover():
+    broken, working = _SlowTimeStamper(fail=True), _SlowTimeStamper()
+    ts = timestamps.CompositeTimeStamper([broken, working])
+    digest = hashlib.sha256(b'abc').digest()
+    for _ in range(3):
+        ts.timestamp(digest, 'sha256')
+    broken_stats, working_stats = ts.stats()
+    # after the first failure, the broken TSA should be avoided
+    assert broken_stats['failures'] == 1
+    assert broken_stats['consecutive_failures'] == 1
+    assert working_stats['wins'] == 3
+    assert working_stats['latency']['count'] == 3
+
+    working.fail = True
+    with pytest.raises(timestamps.TimestampRequestError):
+        ts.timestamp(digest, 'sha256')
+    ts.close()
+
+
+def test_composite_timestamp_size_estimate():
+    broken, working = _SlowTimeStamper(fail=True), _SlowTimeStamper()
+    ts = timestamps.CompositeTimeStamper([broken, working])
+    # backends that can't be measured are skipped
+    assert ts.token_size_estimate('sha256') \
+        == working.token_size_estimate('sha256')
+    ts.close()
+    ts = timestamps.CompositeTimeStamper([_SlowTimeStamper(fail=True)])
+    with pytest.raises(timestamps.TimestampRequestError):
+        ts.token_size_estimate('sha256')
+    ts.close()
+
+
+def test_composite_timestamp_hedge():
+    slow, fast = _SlowTimeStamper(delay=2), _SlowTimeStamper()
+    ts = timestamps.CompositeTimeStamper(
+        [slow, fast], default_hedge_delay=0.05
+    )
+    digest = hashlib.sha256(b'abc').digest()
+    ts.timestamp(digest, 'sha256')
+    slow_stats, fast_stats = ts.stats()
+    # the hedged request should've answered first
+    assert slow_stats['requests'] == 1
+    assert slow_stats['in_flight'] == 1
+    assert fast_stats['hedges'] == 1
+    assert fast_stats['wins'] == 1
+    ts.close()
+
+
+def test_composite_timestamp_primes_backends():
+    # freshly loaded values that haven't been parsed yet
+    tsa_cert = x509.Certificate.load(DUMMY_TS.tsa_cert.dump())
+    tsa_key = keys.PrivateKeyInfo.load(DUMMY_TS.tsa_key.dump())
+    backend = timestamps.DummyTimeStamper(
+        tsa_cert=tsa_cert, tsa_key=tsa_key,
+        certs_to_embed=DUMMY_TS.certs_to_embed
+    )
+    assert tsa_cert._native is None and tsa_key._native is None
+    ts = timestamps.CompositeTimeStamper([backend])
+    # the backend is shared with the worker threads, so everything
+    # should be parsed before any of them get to it
+    assert tsa_cert._native is not None and tsa_key._native is not None
+    tst = ts.timestamp(hashlib.sha256(b'abc').digest(), 'sha256')
+    assert tst._native is not None
+    ts.close()
+
+
+def test_composite_timestamp_sign():
+    backends = [_SlowTimeStamper(), _SlowTimeStamper(fail=True)]
+    ts = timestamps.CompositeTimeStamper(backends)
+    signer = signers.SimpleSigner(
+        signing_cert=FROM_CA.signing_cert, cert_registry=FROM_CA.cert_registry,
+        signing_key=FROM_CA.signing_key, timestamper=ts
+    )
+    # the broken TSA shouldn't get in the way
+    ts.collect_certs('sha256')
+    assert len(ts._certs) == 1
+    backends[1].fail = False
+    out = signers.sign_pdf(
+        IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD)),
+        signers.PdfSignatureMetadata(
+            field_name='Sig1', validation_context=dummy_ocsp_vc(),
+            subfilter=PADES, embed_validation_info=True
+        ), signer=signer
+    )
+    r = PdfFileReader(out)
+    field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+    validity = val_trusted(r, sig_field, extd=True)
+    assert validity.timestamp_validity.trusted
+    ts.close()
+
+
+def test_local_tsa_server(local_tsa_server):
+    ts = timestamps.HTTPTimeStamper(
+        local_tsa_server.url, max_retries=0
+    )
+    digest = hashlib.sha256(b'abc').digest()
+    local_tsa_server.failure_rate = 1
+    with pytest.raises(timestamps.TimestampRequestError):
+        ts.timestamp(digest, 'sha256')
+    local_tsa_server.failure_rate = 0
+    local_tsa_server.drop_rate = 1
+    with pytest.raises(requests.ConnectionError):
+        ts.timestamp(digest, 'sha256')
+    local_tsa_server.drop_rate = 0
+    ts.timestamp(digest, 'sha256')
+
+    # requests without the right content type are rejected
+    response = requests.post(local_tsa_server.url, data=b'')
+    assert response.status_code == 415
+
+    stats = requests.get(
+        local_tsa_server.url.replace('/tsa', '/stats')
+    ).json()
+    assert stats['requests'] == 4
+    assert stats['failed'] == 1
+    assert stats['dropped'] == 1
+    assert stats['granted'] == 1
+    assert stats['bad_requests'] == 1
+    ts.close()
+
+
+def test_pkcs11_session_pool():
+
+    class _Session:
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    opened = []
+
+    def _open():
+        opened.append(_Session())
+        return opened[-1]
+
+    pool = PKCS11SessionPool(_open, size=2)
+    with pool.lease() as s1:
+        with pool.lease() as s2:
+            assert s1 is not s2
+    assert len(opened) == 2
+    # idle sessions are reused, along with their handle caches
+    with pool.lease() as s3:
+        assert s3 in (s1, s2)
+    assert len(opened) == 2
+    pool.close()
+    assert all(s.closed for s in opened)
+
+    with pytest.raises(ValueError):
+        PKCS11SessionPool()
+
+
+def test_pkcs11_session_pool_relogin():
+    from pkcs11.exceptions import SessionClosed
+
+    class _Token:
+        logged_in = False
+        open_sessions = 0
+        logins = 0
+
+        def open(self, user_pin=None):
+            token = self
+            if user_pin is not None:
+                assert not token.logged_in
+                token.logged_in = True
+                token.logins += 1
+            token.open_sessions += 1
+
+            class _Session:
+                logged_in_at_open = token.logged_in
+
+                def close(self):
+                    token.open_sessions -= 1
+                    # the login state goes away with the last session
+                    if not token.open_sessions:
+                        token.logged_in = False
+
+            return _Session()
+
+    token = _Token()
+    pool = PKCS11SessionPool.for_token(token, size=2, user_pin='1234')
+    with pool.lease() as s1:
+        with pool.lease() as s2:
+            assert s1.session.logged_in_at_open
+            assert s2.session.logged_in_at_open
+    assert token.logins == 1
+    # both sessions break, so the login state is lost
+    for _ in range(2):
+        with pytest.raises(SessionClosed):
+            with pool.lease():
+                raise SessionClosed()
+    assert not token.open_sessions and not token.logged_in
+    with pool.lease() as s3:
+        assert token.logged_in
+        assert s3.session.logged_in_at_open
+    assert token.logins == 2
+    pool.close()
+    assert not token.open_sessions
+
+
+class _FakeSession:
+    # stands in for a pkcs11.Session holding the signer's key and certificate
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.closed = False
+        self.signed = []
+
+    def get_objects(self, attrs):
+        from pkcs11 import Attribute, ObjectClass
+        session = self
+
+        class _Object:
+            def __getitem__(self, attr):
+                assert attr == Attribute.VALUE
+                return FROM_CA.signing_cert.dump()
+
+            def sign(self, data, mechanism):
+                time.sleep(session.delay)
+                session.signed.append(data)
+                return b'signed:' + data
+
+        assert attrs[Attribute.CLASS] in (
+            ObjectClass.CERTIFICATE, ObjectClass.PRIVATE_KEY
+        )
+        return iter([_Object()])
+
+    def close(self):
+        self.closed = True
+
+
+def test_pkcs11_session_pool_discard():
+    from pkcs11.exceptions import SessionClosed
+    opened = []
+
+    def _open():
+        opened.append(_FakeSession())
+        return opened[-1]
+
+    pool = PKCS11SessionPool(_open, size=2, timeout=0.05)
+    with pytest.raises(SessionClosed):
+        with pool.lease() as s1:
+            raise SessionClosed()
+    # the broken session is closed, and never handed out again
+    assert s1.session.closed
+    with pool.lease() as s2, pool.lease() as s3:
+        assert s1.session not in (s2.session, s3.session)
+        assert len(opened) == 3
+        # ... but no more than two sessions are open at any time
+        with pytest.raises(TimeoutError):
+            with pool.lease():
+                pass
+    assert len(opened) == 3
+    pool.close()
+    assert all(s.closed for s in opened)
+
+
+def test_pkcs11_session_pool_waiters():
+    from pkcs11.exceptions import SessionClosed
+    opened = []
+
+    def _open():
+        opened.append(_FakeSession())
+        return opened[-1]
+
+    pool = PKCS11SessionPool(_open, size=1)
+    outcomes = []
+
+    def _wait_for_session():
+        try:
+            with pool.lease() as pooled:
+                outcomes.append(pooled.session)
+        except ValueError as e:
+            outcomes.append(e)
+
+    # a waiting thread gets to open a new session when the one in use
+    # is discarded
+    waiter = threading.Thread(target=_wait_for_session, daemon=True)
+    with pytest.raises(SessionClosed):
+        with pool.lease():
+            waiter.start()
+            time.sleep(0.05)
+            assert not outcomes
+            raise SessionClosed()
+    waiter.join(timeout=5)
+    assert not waiter.is_alive()
+    assert outcomes == [opened[1]]
+
+    # closing the pool wakes up waiting threads
+    outcomes.clear()
+    waiter = threading.Thread(target=_wait_for_session, daemon=True)
+    with pool.lease() as pooled:
+        waiter.start()
+        time.sleep(0.05)
+        pool.close()
+        waiter.join(timeout=5)
+        assert not waiter.is_alive()
+        assert isinstance(outcomes[0], ValueError)
+        assert not pooled.session.closed
+    # the leased session is closed when it's returned
+    assert pooled.session.closed
+    with pytest.raises(ValueError):
+        with pool.lease():
+            pass
+
+
+def test_pkcs11_sign_raw_many_order():
+    sessions = [_FakeSession(delay=0.01) for _ in range(3)]
+    signer = PKCS11Signer(
+        cert_label='signer', session_pool=PKCS11SessionPool(sessions=sessions)
+    )
+    assert signer.signing_cert.dump() == FROM_CA.signing_cert.dump()
+    items = [b'item %d' % ix for ix in range(20)]
+    results = signer.sign_raw_many(items, 'sha256')
+    assert results == [b'signed:' + item for item in items]
+    # the work was spread over all sessions
+    assert all(session.signed for session in sessions)
+    assert sorted(sum((s.signed for s in sessions), [])) == sorted(items)
+    assert signer.sign_raw_many([], 'sha256') == []
+
+
+SOFTHSM_LIB = os.environ.get(
+    'SOFTHSM2_MODULE', '/usr/lib/softhsm/libsofthsm2.so'
+)
+
+
+@pytest.fixture
+def softhsm_token(tmp_path, monkeypatch):
+    if not os.path.isfile(SOFTHSM_LIB) or not shutil.which('softhsm2-util'):
+        pytest.skip('SoftHSM is not available')
+    import pkcs11
+    from pkcs11.util.rsa import decode_rsa_private_key
+    from pkcs11.util.x509 import decode_x509_certificate
+    token_dir = tmp_path / 'tokens'
+    token_dir.mkdir()
+    conf = tmp_path / 'softhsm2.conf'
+    conf.write_text('directories.tokendir = %s\n' % token_dir)
+    monkeypatch.setenv('SOFTHSM2_CONF', str(conf))
+    subprocess.run([
+        'softhsm2-util', '--init-token', '--free', '--label', 'testing',
+        '--pin', '1234', '--so-pin', '5678'
+    ], check=True, capture_output=True)
+    token = pkcs11.lib(SOFTHSM_LIB).get_token(token_label='testing')
+    with token.open(rw=True, user_pin='1234') as session:
+        key_attrs = decode_rsa_private_key(FROM_CA.signing_key.dump())
+        key_attrs.update({
+            pkcs11.Attribute.LABEL: 'signer', pkcs11.Attribute.TOKEN: True
+        })
+        session.create_object(key_attrs)
+        cert_attrs = decode_x509_certificate(FROM_CA.signing_cert.dump())
+        cert_attrs.update({
+            pkcs11.Attribute.LABEL: 'signer', pkcs11.Attribute.TOKEN: True
+        })
+        session.create_object(cert_attrs)
+    return token
+
+
+def test_pkcs11_sign_pool(softhsm_token):
+    pool = PKCS11SessionPool.for_token(softhsm_token, size=3, user_pin='1234')
+    signer = PKCS11Signer(
+        cert_label='signer', session_pool=pool,
+        ca_chain=list(FROM_CA.cert_registry)
+    )
+    assert signer.signing_cert.dump() == FROM_CA.signing_cert.dump()
+    payloads = [b'payload %d' % i for i in range(10)]
+    signatures = signer.sign_raw_many(payloads, 'sha256')
+    pub_key = oskeys.parse_public(FROM_CA.signing_cert.public_key.dump())
+    for payload, signature in zip(payloads, signatures):
+        asymmetric.rsa_pkcs1v15_verify(
+            asymmetric.load_public_key(pub_key), signature, payload, 'sha256'
+        )
+
+    out = signers.sign_pdf(
+        IncrementalPdfFileWriter(BytesIO(MINIMAL)),
+        signers.PdfSignatureMetadata(field_name='Sig1'), signer=signer
+    )
+    r = PdfFileReader(out)
+    field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+    val_trusted(r, sig_field)
+    pool.close()
+
+
+def test_sign_large_file_constant_memory(tmp_path):
+    # pad the file with a large stream that isn't referenced anywhere
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL))
+    w.add_object(generic.StreamObject(stream_data=bytes(32 * 1024 * 1024)))
+    large_file = tmp_path / 'large.pdf'
+    with open(large_file, 'wb') as f:
+        w.write(f)
+    del w
+
+    meta = signers.PdfSignatureMetadata(field_name='Sig1')
+    out_file = tmp_path / 'large-signed.pdf'
+    with open(large_file, 'rb') as infile, open(out_file, 'w+b') as outfile:
+        tracemalloc.start()
+        try:
+            result = signers.sign_pdf(
+                IncrementalPdfFileWriter(infile), meta, signer=FROM_CA,
+                output=outfile
+            )
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert result is outfile
+    assert peak < 4 * 1024 * 1024
+
+    with open(out_file, 'rb') as f:
+        r = PdfFileReader(f)
+        field_name, sig_obj, sig_field = next(fields.enumerate_sig_fields(r))
+        val_trusted(r, sig_field)
@@ -1,3 +1,6 @@
+import gc
+import os
+import weakref
 from fractions import Fraction
 
 import pytest
@@ -6,6 +9,7 @@ from io import BytesIO
 from pdf_utils.generic import Reference
 from pdf_utils.incremental_writer import IncrementalPdfFileWriter
 from pdf_utils.misc import BoxConstraints, BoxSpecificationError
+from pdf_utils.optimise import optimise_pdf
 from pdf_utils.reader import PdfFileReader
 from pdf_utils import writer, generic, misc
 from fontTools import ttLib
@@ -255,6 +259,73 @@ def test_historical_read():
     assert Reference(2, 0) not in reader.xrefs.explicit_refs_in_revision(1)
 
 
+@pytest.mark.parametrize('input_data', [MINIMAL_ONE_FIELD, MINIMAL_XREF])
+def test_chain_updates(input_data):
+    w = IncrementalPdfFileWriter(BytesIO(input_data))
+    w.root['/Chained'] = generic.NumberObject(1)
+    w.update_root()
+    out = BytesIO()
+    w.write(out)
+
+    w2 = w.chain(out)
+    w2.root['/Chained'] = generic.NumberObject(2)
+    w2.update_root()
+    new_ref = w2.add_object(generic.TextStringObject('Hello'))
+    out.seek(0, os.SEEK_END)
+    w2.write(out)
+
+    # the chained reader should agree with a fresh one
+    w3 = w2.chain(out)
+    chained = w3.prev
+    fresh = PdfFileReader(BytesIO(out.getvalue()))
+    revisions = fresh.total_revisions
+    assert chained.total_revisions == revisions
+    assert chained.root['/Chained'] == fresh.root['/Chained'] == 2
+    assert chained.xrefs.xref_locations == fresh.xrefs.xref_locations
+    assert chained.trailer['/Size'] == fresh.trailer['/Size']
+    for rev in range(revisions):
+        assert chained.xrefs.explicit_refs_in_revision(rev) \
+            == fresh.xrefs.explicit_refs_in_revision(rev)
+    root_ref = fresh.trailer.raw_get('/Root')
+    assert chained.get_object(root_ref, revision=revisions - 2)['/Chained'] \
+        == fresh.get_object(root_ref, revision=revisions - 2)['/Chained'] \
+        == 1
+    assert '/Chained' not in fresh.get_object(
+        root_ref, revision=revisions - 3
+    )
+    assert '/Chained' not in chained.get_object(
+        root_ref, revision=revisions - 3
+    )
+
+    assert w3.root['/Chained'] == 2
+    new_ref = generic.IndirectObject(new_ref.idnum, new_ref.generation, chained)
+    assert chained.get_object(new_ref) == 'Hello'
+
+    with pytest.raises(ValueError):
+        IncrementalPdfFileWriter(BytesIO(input_data)).chain(BytesIO())
+
+
+@pytest.mark.parametrize('input_data', [MINIMAL_ONE_FIELD, MINIMAL_XREF])
+def test_chain_mismatch(input_data):
+    w = IncrementalPdfFileWriter(BytesIO(input_data))
+    w.root['/Chained'] = generic.NumberObject(1)
+    w.update_root()
+    out = BytesIO()
+    w.write(out)
+    revisions = w.prev.total_revisions
+
+    # the update isn't in this stream
+    with pytest.raises(misc.PdfReadError):
+        w.chain(BytesIO(input_data))
+    assert w.prev.total_revisions == revisions
+    w.chain(out)
+    assert w.prev.total_revisions == revisions + 1
+    # the reader already knows about this update
+    with pytest.raises(misc.PdfReadError):
+        w.chain(out)
+    assert w.prev.total_revisions == revisions + 1
+
+
 # TODO actually attempt to render the XObjects
 
 @pytest.mark.parametrize('file_no, inherit_filters',
@@ -288,6 +359,75 @@ def test_page_import_with_fonts(inherit_filters):
     assert len(font_file.data) == 1424
 
 
+
+def test_import_page_twice():
+    image_input = PdfFileReader(BytesIO(FILE_WITH_EMBEDDED_FONT))
+    w = writer.PdfFileWriter()
+    xobj1 = w.import_page_as_xobject(image_input).get_object()
+    obj_count = len(w.objects)
+    xobj2 = w.import_page_as_xobject(image_input).get_object()
+    # the second import only adds the XObject itself
+    assert len(w.objects) == obj_count + 1
+    assert xobj1['/Resources'].raw_get('/Font') \
+        == xobj2['/Resources'].raw_get('/Font')
+
+
+def test_import_cyclic_objstream():
+    r = PdfFileReader(BytesIO(MINIMAL))
+    w = writer.PdfFileWriter()
+    obj_stream = w.prepare_object_stream()
+    # page objects have a /Parent back-pointer
+    page_ref = w.import_object(r.root['/Pages']['/Kids'][0], obj_stream)
+    page = page_ref.get_object()
+    pages = page['/Parent']
+    assert pages['/Kids'][0] == page_ref
+    assert page_ref.idnum in w.objs_in_streams
+    # content streams can't go into object streams
+    contents_ref = page.raw_get('/Contents')
+    assert (0, contents_ref.idnum) in w.objects
+    assert b'Hello' in contents_ref.get_object().data
+
+    out = BytesIO()
+    w.write(out)
+    r = PdfFileReader(out)
+    page = r.get_object(generic.Reference(page_ref.idnum, 0, r))
+    assert page['/Type'] == '/Page'
+    assert page['/Parent']['/Kids'][0].get_object() is page
+
+
+def test_import_deep():
+    source = writer.PdfFileWriter()
+    deep = generic.ArrayObject()
+    cur = deep
+    for _ in range(5000):
+        nxt = generic.ArrayObject()
+        cur.append(nxt)
+        cur = nxt
+    cur.append(generic.NumberObject(1))
+    deep_ref = source.add_object(deep)
+
+    w = writer.PdfFileWriter()
+    imported = w.import_object(deep_ref).get_object()
+    for _ in range(5000):
+        imported = imported[0]
+    assert imported == [1]
+
+
+def test_import_does_not_retain_source():
+    source = writer.PdfFileWriter()
+    obj_ref = source.add_object(generic.ArrayObject([generic.NumberObject(1)]))
+    w = writer.PdfFileWriter()
+    imported = w.import_object(obj_ref)
+    # importing the same object again reuses the earlier copy
+    assert w.import_object(obj_ref) == imported
+
+    source_ref = weakref.ref(source)
+    del source, obj_ref
+    gc.collect()
+    assert source_ref() is None
+    assert imported.get_object() == [1]
+
+
 def test_deep_modify():
     w = IncrementalPdfFileWriter(BytesIO(MINIMAL))
     obj3 = generic.Reference(3, 0, w)
@@ -298,6 +438,115 @@ def test_deep_modify():
     assert (0, 3) in w.objects
 
 
+@pytest.mark.parametrize('object_streams', [True, False])
+def test_optimise_drops_dead_objects(object_streams):
+    w = IncrementalPdfFileWriter(BytesIO(MINIMAL_ONE_FIELD))
+    contents = generic.StreamObject(stream_data=b'BT /F1 18 Tf ET')
+    contents_ref = w.add_object(contents)
+    w.add_stream_to_page(0, contents_ref)
+    # add an object that isn't referenced from anywhere; it's added last,
+    # so it has the highest object number in the input
+    dead = generic.StreamObject(stream_data=b'I should not survive')
+    dead_ref = w.add_object(dead)
+    updated = BytesIO()
+    w.write(updated)
+    updated.seek(0)
+
+    out = BytesIO()
+    optimise_pdf(updated, out, object_streams=object_streams)
+    out.seek(0)
+    r = PdfFileReader(out)
+    assert r.total_revisions == 1
+    assert r.has_xref_stream == object_streams
+    output_idnums = {
+        ref.idnum for ref in r.xrefs.explicit_refs_in_revision(0)
+    } | set(r.xrefs.in_obj_stream)
+    assert output_idnums == set(range(1, r.trailer['/Size']))
+    # the dead object didn't make it into the output's xref table,
+    # and its contents are nowhere to be found in the output
+    assert dead_ref.idnum not in output_idnums
+    for idnum in output_idnums:
+        obj = r.get_object(generic.Reference(idnum, 0, r))
+        if isinstance(obj, generic.StreamObject):
+            assert obj.data != b'I should not survive'
+    # reachable objects are retained
+    page = r.root['/Pages']['/Kids'][0].get_object()
+    assert page['/Contents'][1].get_object().data == b'BT /F1 18 Tf ET'
+    field = r.root['/AcroForm']['/Fields'][0].get_object()
+    assert field['/T'] == 'Sig1'
+    # everything but the xref stream and (compressed) streams should be
+    # in object streams
+    if object_streams:
+        assert all(
+            isinstance(r.get_object(ref), generic.StreamObject)
+            for ref in r.xrefs.explicit_refs_in_revision(0)
+            if ref.idnum not in r.xrefs.in_obj_stream
+        )
+    # uncompressed streams get compressed
+    for ref in r.xrefs.explicit_refs_in_revision(0):
+        obj = r.get_object(ref)
+        if isinstance(obj, generic.StreamObject) \
+                and obj.get('/Type') != '/XRef':
+            assert obj['/Filter'] == '/FlateDecode'
+
+
+
+def test_linearize():
+    pdf_out = writer.PdfFileWriter()
+    pages = pdf_out.root['/Pages']
+    for ix in range(3):
+        pdf_out.insert_page(simple_page(pdf_out, f'Page {ix}', compress=True))
+    # test inherited attributes
+    mb = pdf_out.get_object(pages['/Kids'][2].reference).pop('/MediaBox')
+    pages[pdf_name('/MediaBox')] = mb
+    orig = BytesIO()
+    pdf_out.write(orig)
+    orig.seek(0)
+
+    out = BytesIO()
+    optimise_pdf(orig, out, linearize=True)
+    data = out.getvalue()
+    r = PdfFileReader(out)
+    # the linearisation dictionary should be the first object in the file
+    lin_dict_ref = min(
+        r.xrefs.explicit_refs_in_revision(1),
+        key=lambda ref: r.xrefs[ref]
+    )
+    lin_dict = r.get_object(lin_dict_ref)
+    assert lin_dict['/Linearized'] == 1
+    assert lin_dict['/L'] == len(data)
+    assert lin_dict['/N'] == 3
+    first_page_ref = r.root['/Pages']['/Kids'][0]
+    assert lin_dict['/O'] == first_page_ref.idnum
+    # the first page's objects are in the first page section
+    first_page = first_page_ref.get_object()
+    contents_ref = first_page.raw_get('/Contents')
+    assert r.xrefs[contents_ref.reference] < lin_dict['/E']
+    assert b'Page 0' in first_page['/Contents'].data
+    hint_offset, hint_length = lin_dict['/H']
+    assert data[hint_offset + hint_length - 7:hint_offset + hint_length] \
+           == b'endobj\n'
+    assert data[lin_dict['/T']:lin_dict['/T'] + 21] \
+        == b'\n0000000000 65535 f \n'
+
+    # inherited attributes were pushed down
+    for page_ref in r.root['/Pages']['/Kids']:
+        assert '/MediaBox' in page_ref.get_object()
+    assert '/MediaBox' not in r.root['/Pages']
+
+    # incremental updates work as usual
+    w = IncrementalPdfFileWriter(out)
+    w.add_stream_to_page(
+        1, w.add_object(generic.StreamObject(stream_data=b'BT ET'))
+    )
+    updated = BytesIO()
+    w.write(updated)
+    r = PdfFileReader(updated)
+    assert r.total_revisions == 3
+    page = r.root['/Pages']['/Kids'][1].get_object()
+    assert page['/Contents'][1].get_object().data == b'BT ET'
+
+
 def test_box_constraint_over_underspecify():
     w = 1600
     h = 900
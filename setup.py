@@ -9,6 +9,10 @@ setup(
     author='Matthias Valvekens',
     author_email='dev@mvalvekens.be',
     description='Tools for stamping and signing PDF files',
+    extras_require={
+        # AsyncHTTPTimeStamper
+        'async-http': ['aiohttp>=3.7'],
+    },
     entry_points={
         "console_scripts": [
             "pdfstamp = pdfstamp.__main__:launch"